@@ -0,0 +1,186 @@
+"""
+Benchmarks of Prefixer's hot paths on synthetic data: hives, a big Steam root and a big tweak tree.
+
+    python -m benchmarks.run                 # run, compare with the saved baseline
+    python -m benchmarks.run --save          # run, save the results as the new baseline
+    python -m benchmarks.run --scale 0.1     # smaller fixtures for a quick check
+
+Baselines are machine-specific, so they're kept out of git.
+"""
+from contextlib import ExitStack
+from pathlib import Path
+from statistics import median
+from time import perf_counter
+from typing import Callable
+from unittest.mock import patch
+import tempfile
+import shutil
+import json
+import sys
+
+import click
+import vdf
+
+from prefixer.core import paths, tweaks
+from prefixer.coldpfx.regedit import parser, writer
+from prefixer.providers.classes import PrefixIndex
+from prefixer.providers.steam import SteamPrefixProvider, SteamLibraryIndex, CompatToolIndex
+
+BASELINE = Path(__file__).parent / 'baseline.json'
+THRESHOLD = 1.25
+"""Slowdown against the baseline that counts as a regression"""
+
+def make_hive(path: Path, nodes: int):
+    """Writes a Wine hive with nodes keys of a few values each, 50k nodes is ~7 MB"""
+    with open(path, 'w') as f:
+        f.write('WINE REGISTRY Version 2\n;; All keys relative to \\\\Machine\n\n#arch=win64\n\n')
+        for i in range(nodes):
+            f.write(f'[Software\\\\Vendor{i % 97}\\\\Product{i}\\\\Settings] 1700000000\n#time=1d9a0b0c0d0e0f0\n')
+            f.write(f'"Name"="Product {i}"\n"Version"=dword:{i:08x}\n"Path"="C:\\\\Program Files\\\\Product{i}"\n\n')
+
+def make_steam_root(root: Path, apps: int, libraries: int = 3):
+    """Fake Steam root with apps spread over several libraries, a user and a compat tool"""
+    folders = {}
+    for lib in range(libraries):
+        library = root if lib == 0 else root.parent / f'library{lib}'
+        (library / 'steamapps').mkdir(parents=True, exist_ok=True)
+        ids = [str(1000 + i) for i in range(lib, apps, libraries)]
+        folders[str(lib)] = {'path': str(library), 'apps': {id: '0' for id in ids}}
+
+        for id in ids:
+            with open(library / 'steamapps' / f'appmanifest_{id}.acf', 'w') as f:
+                vdf.dump({'AppState': {'appid': id, 'name': f'Game {id}', 'installdir': f'Game{id}', 'StateFlags': '4'}}, f, pretty=True)
+            (library / 'steamapps' / 'compatdata' / id / 'pfx').mkdir(parents=True)
+
+    with open(root / 'steamapps' / 'libraryfolders.vdf', 'w') as f:
+        vdf.dump({'libraryfolders': folders}, f, pretty=True)
+
+    (root / 'config').mkdir()
+    with open(root / 'config' / 'loginusers.vdf', 'w') as f:
+        vdf.dump({'users': {'76561198000000000': {'AccountName': 'bench', 'PersonaName': 'bench', 'MostRecent': '1'}}}, f, pretty=True)
+    with open(root / 'config' / 'config.vdf', 'w') as f:
+        mapping = {'0': {'name': 'proton_experimental'}}
+        vdf.dump({'InstallConfigStore': {'Software': {'Valve': {'Steam': {'CompatToolMapping': mapping}}}}}, f, pretty=True)
+    (root / 'compatibilitytools.d' / 'proton_experimental').mkdir(parents=True)
+
+def make_tweak_tree(root: Path, count: int):
+    """Tweak tree of count JSON5 files in nested categories"""
+    for i in range(count):
+        folder = root / f'category{i % 20}' / f'group{i % 7}'
+        folder.mkdir(parents=True, exist_ok=True)
+        (folder / f'tweak{i}.json5').write_text(
+            '{\n'
+            f'  description: "Synthetic tweak {i}",\n'
+            '  tasks: [\n'
+            f'    {{description: "Download", type: "download", url: "https://example.com/{i}.exe", checksum: "{i:064x}", filename: "{i}.exe"}},\n'
+            f'    {{description: "Run", type: "run_exe", path: "<tempdir>/{i}.exe", args: ["/q"]}},\n'
+            f'    {{description: "Regedit", type: "regedit", path: "Software\\\\Vendor", values: {{Key{i}: "value"}}, filename: "user.reg"}},\n'
+            '  ],\n'
+            '}\n'
+        )
+
+def steam_provider(root: Path) -> SteamPrefixProvider:
+    provider = SteamPrefixProvider()
+    provider.STEAMPATH = root
+    provider.index = SteamLibraryIndex(root)
+    provider.compat_index = CompatToolIndex(root)
+    return provider
+
+def measure(func: Callable, repeats: int, setup: Callable = None) -> list[float]:
+    times = []
+    for _ in range(repeats):
+        if setup: setup()
+        start = perf_counter()
+        func()
+        times.append(perf_counter() - start)
+
+    return times
+
+def run_benchmarks(scale: float = 1.0, repeats: int = 5) -> dict[str, dict[str, float]]:
+    """Builds the fixtures in a temporary directory and returns the min and median time of every benchmark"""
+    def scaled(n: int) -> int: return max(int(n * scale), 10)
+    results = {}
+
+    with tempfile.TemporaryDirectory(prefix='prefixer-bench-') as tmp, ExitStack() as stack:
+        tmp = Path(tmp)
+        cache = tmp / 'cache'
+        stack.enter_context(patch.object(paths, 'CACHE_DIR', str(cache)))
+        def drop_cache(): shutil.rmtree(cache, ignore_errors=True)
+
+        def bench(name: str, func: Callable, setup: Callable = None, times: int = repeats):
+            if setup is None: func() # Warm up imports and caches once
+            timings = measure(func, times, setup)
+            results[name] = {'min': min(timings), 'median': median(timings)}
+
+        hive_path = tmp / 'system.reg'
+        make_hive(hive_path, scaled(50_000))
+        hive_text = hive_path.read_text()
+        hive = parser.parse_hive_file(str(hive_path))
+
+        bench('parse_hive', lambda: parser.parse_hive(hive_text.splitlines()))
+        bench('parse_hive_file', lambda: parser.parse_hive_file(str(hive_path)))
+        bench('serialize', lambda: writer.serialize(hive))
+        middle = scaled(50_000) // 2
+        bench('read_node', lambda: parser.read_node(str(hive_path), f'Software\\\\Vendor{middle % 97}\\\\Product{middle}\\\\Settings'))
+
+        steam_root = tmp / 'steam'
+        make_steam_root(steam_root, scaled(3000))
+        bench('get_prefixes (cold cache)', lambda: steam_provider(steam_root).get_prefixes(), setup=drop_cache)
+        bench('get_prefixes', lambda: steam_provider(steam_root).get_prefixes())
+        bench('resolve proton', lambda: [steam_provider(steam_root).get_prefix(str(1000 + i)) for i in range(0, scaled(3000), 10)])
+        bench('resolve target', lambda: PrefixIndex([steam_provider(steam_root)]).resolve(f'Game {1000 + scaled(3000) // 2}'))
+
+        tweak_root = tmp / 'tweaks'
+        make_tweak_tree(tweak_root, scaled(2000))
+        for name in ['TWEAKS_DIR_PACKAGE', 'TWEAKS_DIR_SYSTEM', 'TWEAKS_DIR_USER']:
+            stack.enter_context(patch.object(tweaks, name, str(tweak_root if name == 'TWEAKS_DIR_PACKAGE' else tmp / 'none')))
+        stack.enter_context(patch.object(tweaks, 'TWEAKS_PATHS', [str(tweak_root)]))
+
+        bench('get_tweak_names (cold cache)', tweaks.get_tweak_names, setup=drop_cache)
+        bench('get_tweak_names', tweaks.get_tweak_names)
+        bench('get_catalog', tweaks.get_catalog)
+        bench('get_tweaks', tweaks.get_tweaks, times=max(repeats // 2, 1))
+
+    return results
+
+def compare(results: dict, baseline: dict, threshold: float = THRESHOLD) -> list[str]:
+    """Returns the benchmarks whose median got slower than threshold times the baseline"""
+    return [name for name, r in results.items() if name in baseline and r['median'] > baseline[name]['median'] * threshold]
+
+@click.command()
+@click.option('--scale', type=float, default=1.0, show_default=True, help='Size of the synthetic fixtures')
+@click.option('--repeats', type=int, default=5, show_default=True, help='Runs of each benchmark')
+@click.option('--save', is_flag=True, help='Save the results as the new baseline')
+@click.option('--threshold', type=float, default=THRESHOLD, show_default=True, help='Slowdown that counts as a regression')
+def main(scale: float, repeats: int, save: bool, threshold: float):
+    """
+    Runs the benchmarks and compares them with the saved baseline
+    """
+    results = run_benchmarks(scale, repeats)
+    baseline = json.loads(BASELINE.read_text()) if BASELINE.exists() else {}
+    if baseline.get('scale', scale) != scale:
+        click.secho(f'Baseline was taken at scale {baseline['scale']}, not comparing', fg='bright_yellow')
+        baseline = {}
+
+    regressions = compare(results, baseline.get('results', {}), threshold)
+    max_len = max(len(name) for name in results)
+
+    for name, r in results.items():
+        line = f'{click.style(name, fg='bright_blue')}{' ' * (max_len - len(name))}  {r['median'] * 1000:9.2f} ms  {click.style(f'(min {r['min'] * 1000:.2f} ms)', fg='bright_black')}'
+        if name in baseline.get('results', {}):
+            ratio = r['median'] / baseline['results'][name]['median']
+            line += '  ' + click.style(f'{ratio:.2f}x', fg='bright_red' if name in regressions else 'bright_green')
+        click.echo(line)
+
+    if save:
+        BASELINE.write_text(json.dumps({'scale': scale, 'python': sys.version.split()[0], 'results': results}, indent=2))
+        click.secho(f'Saved baseline to {BASELINE}', fg='bright_green')
+    elif not baseline:
+        click.secho('No baseline to compare with, save one with --save', fg='bright_yellow')
+
+    if regressions and not save:
+        click.secho(f'Regressions over {threshold}x: {', '.join(regressions)}', fg='bright_red')
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,200 @@
+"""
+Python API for scripting Prefixer without the CLI. A Session keeps providers, the prefix index and built tweaks
+loaded, so one process can work through thousands of prefixes without paying for them again:
+
+    from prefixer.api import Session
+
+    with Session() as session:
+        for prefix in session.select(['all']):
+            result = session.apply(prefix, ['fixes.mouse_grab'])
+            print(prefix.name, result.applied, result.skipped)
+
+Failures raise the exceptions of prefixer.core.exceptions, all subclasses of PrefixerError.
+"""
+from prefixer.coldpfx.regedit.transaction import HiveTransaction
+from prefixer.core import tweaks
+from prefixer.core.batch import BatchResult, run_batch
+from prefixer.core.catalog import CatalogEntry
+from prefixer.core.exceptions import PrefixerError
+from prefixer.core.cache import stamp
+from prefixer.core.ledger import Ledger, LedgerEntry
+from prefixer.core.models import RuntimeContext
+from prefixer.core.planner import Plan, PlanEstimate, prefetch
+from prefixer.core.tweaks import Tweak
+from prefixer.providers.classes import PrefixProvider, PrefixIndex, Prefix, provider_reg, load_providers
+from contextlib import redirect_stdout, nullcontext
+from dataclasses import dataclass
+from time import perf_counter
+from typing import Optional
+import tempfile
+import io
+import os
+
+__all__ = ['Session', 'ApplyResult', 'PlanResult', 'BatchResult', 'Prefix']
+
+@dataclass
+class ApplyResult:
+    """Outcome of applying tweaks to one prefix"""
+    prefix: Prefix
+    applied: list[str]
+    skipped: list[str]
+    """Tweaks skipped due to their conditions"""
+    duration: float
+    log: Optional[str] = None
+    """What the tasks printed, when the session is quiet"""
+
+@dataclass
+class PlanResult:
+    """What applying tweaks to a prefix would do, with conditions checked against the prefix as it is now"""
+    prefix: Prefix
+    plan: Plan
+    """The previewed plan; its nodes are planned or skipped"""
+    estimate: PlanEstimate
+
+class Session:
+    """
+    Owns the providers, the prefix index and built tweaks; they're loaded on first use and kept until refresh().
+    With quiet (the default), what tasks print is captured into results instead of going to stdout.
+    """
+    def __init__(self, providers: Optional[list[PrefixProvider]] = None, quiet: bool = True):
+        self.custom_providers = providers
+        self.quiet = quiet
+        self.index: Optional[PrefixIndex] = None
+        self.built: dict[str, tuple[list[int] | None, Tweak]] = {}
+        """Built tweaks by name, with the stamp of the file they were built from"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.refresh()
+
+    def refresh(self):
+        """Drops everything loaded, for when prefixes or tweaks changed"""
+        self.index = None
+        self.built.clear()
+
+    def prefix_index(self) -> PrefixIndex:
+        if self.index is None:
+            if self.custom_providers is None: load_providers()
+            providers = self.custom_providers if self.custom_providers is not None else [cls() for cls in provider_reg.values()]
+            self.index = PrefixIndex(providers)
+
+        return self.index
+
+    def prefixes(self) -> dict[str, str]:
+        """IDs of every known prefix mapped to their names"""
+        index = self.prefix_index()
+        return dict(zip(index.ids, index.names))
+
+    def resolve(self, target: str | Prefix) -> Prefix:
+        """Returns the prefix for an ID, alias or name; raises NoPrefixError, or AmbiguousTargetError with candidates"""
+        if isinstance(target, Prefix): return target
+        return self.prefix_index().resolve(target)
+
+    def load(self, index: int) -> Optional[Prefix]:
+        """The prefix at an index of the prefix index, None if the game was never launched; raises if it can't be resolved"""
+        prefix = self.prefix_index().get(index)
+        if prefix is None or None in [prefix.pfx_path, prefix.files_path, prefix.binary_path] or not os.path.isdir(prefix.pfx_path): return None
+        return prefix
+
+    def select(self, targets: list[str]) -> list[Prefix]:
+        """Returns the usable prefixes matching IDs, names, glob patterns or 'all'; ones that can't be used yet are left out"""
+        prefixes = []
+        for i in self.prefix_index().select(targets):
+            try:
+                prefix = self.load(i)
+            except PrefixerError: # E.g. NoProtonError, its compat tool isn't installed
+                continue
+            if prefix is not None: prefixes.append(prefix)
+
+        return prefixes
+
+    def catalog(self) -> dict[str, CatalogEntry]:
+        """Every available tweak by name"""
+        return tweaks.get_catalog()
+
+    def tweak(self, name: str) -> Tweak:
+        """Returns a built and validated tweak, building it again only if its file changed"""
+        path = tweaks.get_tweak_names().get(name)
+        file_stamp = stamp(path) if path else None
+        cached = self.built.get(name)
+        if cached and cached[0] == file_stamp: return cached[1]
+
+        built = tweaks.build_tweak(name)
+        self.built[name] = (file_stamp, built)
+        return built
+
+    def targets(self, tweak_names: list[str]) -> list[tuple[str, Tweak]]:
+        return [(name, self.tweak(name)) for name in tweak_names]
+
+    def output(self, buffer: io.StringIO):
+        return redirect_stdout(buffer) if self.quiet else nullcontext()
+
+    def plan(self, target: str | Prefix, tweak_names: list[str]) -> PlanResult:
+        """Plans applying tweaks without running anything; sizes of uncached downloads are asked from their servers"""
+        prefix = self.resolve(target)
+        with tempfile.TemporaryDirectory(prefix='prefixer-') as tempdir:
+            plan = Plan.build_plan(RuntimeContext(prefix, tempdir), self.targets(tweak_names), build=self.tweak)
+            plan.preview()
+            return PlanResult(prefix, plan, plan.estimate())
+
+    def apply(self, target: str | Prefix, tweak_names: list[str], prefetch_downloads: bool = True) -> ApplyResult:
+        """Applies tweaks to a prefix, returns which ran and which were skipped by their conditions"""
+        prefix = self.resolve(target)
+        targets = self.targets(tweak_names)
+        log = io.StringIO()
+        start = perf_counter()
+
+        with self.output(log), tempfile.TemporaryDirectory(prefix='prefixer-') as tempdir:
+            plan = Plan.build_plan(RuntimeContext(prefix, tempdir), targets, build=self.tweak)
+            if prefetch_downloads: prefetch(plan)
+            ran = plan.run()
+
+        return ApplyResult(
+            prefix=prefix,
+            applied=[name for name, _ in targets if ran[name]],
+            skipped=[name for name, _ in targets if not ran[name]],
+            duration=perf_counter() - start,
+            log=log.getvalue() if self.quiet else None
+        )
+
+    def apply_many(self, targets: list[str], tweak_names: list[str], jobs: int = os.cpu_count(), log_dir: Optional[str] = None) -> list[BatchResult]:
+        """Applies tweaks to the prefixes matching targets in worker processes, like `prefixer batch`; failures are reported, not raised"""
+        index = self.prefix_index()
+        built = self.targets(tweak_names)
+        log_dir = log_dir or tempfile.mkdtemp(prefix='prefixer-batch-')
+        os.makedirs(log_dir, exist_ok=True)
+
+        runnable: list[tuple[str, Prefix]] = []
+        results: list[BatchResult] = []
+        for i in index.select(targets):
+            try:
+                prefix = self.load(i)
+            except PrefixerError as e:
+                results.append(BatchResult(index.names[i], index.ids[i], 'skipped', error=f'{type(e).__name__}: {e}' if str(e) else type(e).__name__))
+                continue
+
+            if prefix is None:
+                results.append(BatchResult(index.names[i], index.ids[i], 'skipped', error='No prefix yet, launch the game once'))
+            else:
+                runnable.append((index.ids[i], prefix))
+
+        with self.output(io.StringIO()), tempfile.TemporaryDirectory(prefix='prefixer-') as tempdir:
+            prefetch([Plan.build_plan(RuntimeContext(prefix, tempdir), built, build=self.tweak) for _, prefix in runnable])
+
+        return results + run_batch(runnable, built, jobs, log_dir)
+
+    def registry(self, target: str | Prefix) -> HiveTransaction:
+        """
+        Returns the registry of a prefix; read with node()/hive(), edit with set() inside a with block,
+        which writes the changes when it exits
+        """
+        prefix = self.resolve(target)
+        return HiveTransaction(str(prefix.pfx_path), before_write=prefix.stop_server)
+
+    def applied(self, target: str | Prefix) -> list[LedgerEntry]:
+        """Tweaks applied to a prefix, oldest first"""
+        ledger = Ledger(self.resolve(target).pfx_path)
+        ledger.load()
+        return sorted(ledger.entries.values(), key=lambda e: e.time)
@@ -4,35 +4,35 @@ import subprocess
 from pathlib import Path
 
 import click
-import json5
-from rapidfuzz import process
 from prefixer.core import tweaks
 from prefixer.core import exceptions as excs
 import tempfile
 import sys
-from importlib.metadata import version
 from prefixer.coldpfx import resolve_path
 from prefixer.core.exceptions import BadTweakError, NoPrefixError, NoTweakError
 from prefixer.core.models import RuntimeContext, TweakData, TaskContext
-from prefixer.core.helpers import run_tweak
-from prefixer.core.registry import task_registry, condition_registry
-from prefixer.core.tweaks import get_tweak, get_tweaks, get_tweak_names, Tweak
+from prefixer.core.tweaks import get_tweak, get_catalog, get_tweak_names, Tweak
 from prefixer.coldpfx.regedit import parser, writer
-import prefixer.core.tasks # Import necessary to actually load tasks!
-import prefixer.core.conditions # same with conditions
-from prefixer.providers.classes import provider_reg, PrefixProvider, Prefix
-from prefixer import providers
-import pkgutil
-import importlib
-
-def load_providers():
-    for _, name, _ in pkgutil.iter_modules(providers.__path__):
-        if name == 'classes': continue
-        full_module_name = f"prefixer.providers.{name}"
-        importlib.import_module(full_module_name)
+from prefixer.providers.classes import provider_reg, load_providers, PrefixIndex, Prefix
+from prefixer.core.profiling import profiler
+
+warm_index: PrefixIndex | None = None
+"""Prefix index kept up to date by the daemon; commands it runs use it instead of building their own"""
+
+def get_prefix_index() -> PrefixIndex:
+    if warm_index is not None: return warm_index
+
+    load_providers()
+    return PrefixIndex([cls() for cls in provider_reg.values()])
+
+def enable_profiling(ctx, param, value):
+    if not value or ctx.resilient_parsing: return
+    profiler.enable()
 
 def print_version(ctx, param, value):
     if not value or ctx.resilient_parsing: return
+    from importlib.metadata import version
+
     click.echo(f'{click.style('Prefixer', fg='bright_blue')} v{version('prefixer')}-Turing')
     click.echo(f'Wineprefix management tool by {click.style('Wojtmic', fg='bright_blue')}')
     click.echo('Licensed under GPL-3.0 - Source https://github.com/wojtmic/prefixer')
@@ -41,7 +41,7 @@ def print_version(ctx, param, value):
 
 def list_tweaks(ctx, param, value):
     if not value or ctx.resilient_parsing: return
-    all_tweaks = get_tweaks()
+    all_tweaks = get_catalog()
 
     if not all_tweaks:
         click.secho("No tweaks found! Have you installed Prefixer correctly?", fg='bright_red')
@@ -79,25 +79,21 @@ def print_tweak(ctx, param, tweak_name: str):
 
 def search_tweaks(ctx, param, query):
     if not query or ctx.resilient_parsing: return
+    from prefixer.core import search
 
-    all_tweaks = get_tweaks()
-    all_tweaks_values = list(all_tweaks.values())
+    all_tweaks = get_catalog()
     ids = list(all_tweaks.keys())
+    descriptions = [t.description for t in all_tweaks.values()]
 
-    results = process.extract(
-        query,
-        all_tweaks_values,
-        processor=lambda x: x.description if hasattr(x, 'description') else str(x),
-        limit=5,
-        score_cutoff=30
-    )
+    results = search.rank(query, [search.normalize(d) for d in descriptions], limit=5, score_cutoff=30)
+    if not results: ctx.exit()
 
     max_len = max(len(ids[index]) for choice, score, index in results)
 
     for choice, score, index in results:
         padding = " " * (max_len - len(ids[index]))
         id_styled = click.style(ids[index], fg='bright_blue')
-        desc_styled = click.style(choice.description, bold=True)
+        desc_styled = click.style(descriptions[index], bold=True)
 
         click.echo(f'{id_styled}{padding} - {desc_styled}')
 
@@ -105,6 +101,7 @@ def search_tweaks(ctx, param, query):
 
 def validate_tweak(ctx, param, path: str):
     if not path or ctx.resilient_parsing: return
+    import json5
 
     try:
         with open(path, 'r') as f:
@@ -123,18 +120,26 @@ def validate_tweak(ctx, param, path: str):
         if not 'conditions' in data: data['conditions'] = []
         data['name'] = path.split('/')[-1]
         t = TweakData(**data)
-        Tweak(t.name, t.description, t.tasks, t.conditions)
+        tasks = [TaskContext(**(task | {'conditions': tweaks.build_conditions(task.get('conditions'))})) for task in t.tasks]
+        conditions = tweaks.build_conditions(t.conditions)
     except: raise BadTweakError
 
-    for i in t.tasks:
-        if i['type'] not in task_registry: raise BadTweakError
-
-    for i in t.conditions:
-        if i['type'] not in condition_registry: raise BadTweakError
+    tweaks.validate_tweak(Tweak(t.name, t.description, tasks, conditions))
 
     click.secho('Tweak valid!', fg='bright_green')
     ctx.exit()
 
+def refuse_root():
+    if os.geteuid() == 0:
+        if os.environ.get('ALLOW_ROOT', 'false').lower() != 'true':
+            click.secho('SECURITY WARNING: Prefixer CANNOT be run as root due to security, safety and integrity purposes.', fg='bright_red')
+            click.secho('Running as root will make created/downloaded files read-only to your user, as well as might delete files you don\'t want to.', fg='bright_red')
+            click.secho('If you are absolutely SURE that you want to run Prefixer as root, set the environment variable ALLOW_ROOT to true.', fg='bright_red')
+            click.secho('The developer of Prefixer is not responsible for any damages to your device when running as root.', fg='bright_red')
+            sys.exit(1)
+        else:
+            click.secho('WARNING: Running as root with ALLOW_ROOT override set. The developer of Prefixer is not responsible for any damages.', fg='bright_yellow')
+
 @click.group()
 @click.option('--version', '-v', is_flag=True, help='Print version', callback=print_version, expose_value=False, is_eager=True)
 @click.option('--list-tweaks', is_flag=True, help='Lists available tweaks', callback=list_tweaks, expose_value=False, is_eager=True)
@@ -142,45 +147,17 @@ def validate_tweak(ctx, param, path: str):
 @click.option('--search', callback=search_tweaks, help='Search for a tweak', expose_value=False, is_eager=True)
 @click.option('--validate-tweak', callback=validate_tweak, help='Validate a tweak', expose_value=False, is_eager=True)
 @click.option('--quiet', '-q', is_flag=True, help='Disable non-essential logging')
+@click.option('--profile', is_flag=True, help='Print where the time went; set PF_PROFILE to a path for a JSON trace', callback=enable_profiling, expose_value=False, is_eager=True)
 @click.argument('app_id')
 @click.pass_context
 def prefixer(ctx, app_id: str, quiet: bool):
     """
     Modern tool to manage Proton prefixes.
     """
-    if os.geteuid() == 0:
-        if os.environ.get('ALLOW_ROOT', 'false').lower() != 'true':
-            click.secho('SECURITY WARNING: Prefixer CANNOT be run as root due to security, safety and integrity purposes.', fg='bright_red')
-            click.secho('Running as root will make created/downloaded files read-only to your user, as well as might delete files you don\'t want to.', fg='bright_red')
-            click.secho('If you are absolutely SURE that you want to run Prefixer as root, set the environment variable ALLOW_ROOT to true.', fg='bright_red')
-            click.secho('The developer of Prefixer is not responsible for any damages to your device when running as root.', fg='bright_red')
-            sys.exit(1)
-        else:
-            click.secho('WARNING: Running as root with ALLOW_ROOT override set. The developer of Prefixer is not responsible for any damages.', fg='bright_yellow')
+    refuse_root()
 
-    load_providers()
-    # I am sorry to every non-functional programmer on Earth for this
-    provider_objs: list[PrefixProvider] = [cls() for cls in provider_reg.values()]
-    prefix_ids: list[str] = [p for provider in provider_objs for p in provider.get_prefix_ids()]
-    prefixes: list[str] = [p for provider in provider_objs for p in provider.get_prefixes()]
-    prefix_provider_map: dict[int, int] = {}
-    offset = 0
-    for i, provider in enumerate(provider_objs):
-        p = provider.get_prefixes()
-        for j in range(len(p)):
-            prefix_provider_map[offset + j] = i
-        offset += len(p)
-
-    if app_id in prefix_ids:
-        provider_idx = prefix_provider_map[prefix_ids.index(app_id)]
-        prefix = provider_objs[provider_idx].get_prefix(app_id)
-    else:
-        name, certainty, index = process.extractOne(app_id, prefixes, score_cutoff=50) or ('', 0, 0)
-        if certainty == 0: raise NoPrefixError
-        provider_idx = prefix_provider_map[index]
-        local_index = index - sum(len(list(provider_objs[j].get_prefixes())) for j in range(provider_idx))
-
-        prefix = provider_objs[provider_idx].get_prefix_by_index(local_index)
+    index = get_prefix_index()
+    prefix = index.resolve(app_id)
 
     if not quiet:
         click.echo(f'Targeting => {click.style(prefix.name, fg='bright_blue')}')
@@ -254,25 +231,69 @@ def complete_tweaks(ctx, param, incomplete):
 
     return suggestions
 
+def format_size(size: int) -> str:
+    for unit in ['B', 'KiB', 'MiB', 'GiB']:
+        if size < 1024 or unit == 'GiB': break
+        size /= 1024
+
+    return f'{size:.1f} {unit}' if unit != 'B' else f'{size} B'
+
+def print_plan(plan):
+    plan.preview()
+    estimate = plan.estimate()
+    sizes = {task.checksum.lower(): (size, cached) for task, size, cached in estimate.downloads}
+
+    for node in plan.nodes:
+        if node.kind == 'mark' or (node.gate and node.gate.state == 'covered'): continue
+        indent = '  ' * plan.depth(node)
+
+        if node.kind == 'gate':
+            state = {'passed': '', 'covered': click.style(' (included above)', fg='bright_black')}.get(node.state, click.style(' (skipped, conditions)', fg='bright_yellow'))
+            click.echo(f'{indent}{'Target Tweak' if node.top_level else 'Includes'} => {click.style(node.description, fg='bright_blue')}{state}')
+            continue
+
+        task = node.task
+        line = f'{indent}{click.style('==>', bold=True)} {task.description} {click.style(task.type, fg='bright_black')}'
+        if node.state == 'skipped':
+            line = click.style(f'{indent}==> {task.description} {task.type} (skipped)', fg='bright_black')
+        elif task.type == 'download' and task.checksum:
+            size, cached = sizes[task.checksum.lower()]
+            line += ' ' + (click.style('(cached)', fg='bright_green') if cached else click.style(f'({format_size(size) if size is not None else 'unknown size'})', fg='bright_yellow'))
+
+        click.echo(line)
+
+    unknown = sum(size is None for _, size, cached in estimate.downloads if not cached)
+    cached = sum(cached for _, _, cached in estimate.downloads)
+    click.echo('=' * 20)
+    click.echo(f'Tasks => {click.style(estimate.tasks, fg='bright_blue')} to run, {estimate.skipped} skipped')
+    click.echo(f'Downloads => {click.style(format_size(estimate.download_bytes), fg='bright_blue')} in {len(estimate.downloads) - cached} files'
+               f'{f', {unknown} of unknown size' if unknown else ''}, {cached} cached')
+    click.echo(f'Hives rewritten => {click.style(', '.join(estimate.hives) or 'none', fg='bright_blue')}')
+    click.echo(f'Proton launches => {click.style(estimate.launches, fg='bright_blue')}')
+
 @prefixer.command()
 @click.argument('tweak_names', shell_complete=complete_tweaks, nargs=-1)
+@click.option('--plan', 'plan_only', is_flag=True, help='Only print the tasks that would run and what they cost; conditions are checked against the prefix as it is now')
 @click.pass_context
-def tweak(ctx, tweak_names: list[str]):
+def tweak(ctx, tweak_names: list[str], plan_only: bool):
     """
     Apply a tweak
     """
-    prefix = ctx.obj['PREFIX']
-
-    for tweak_name in tweak_names:
-        target_tweak = tweaks.build_tweak(tweak_name)
+    from prefixer.core.planner import Plan, prefetch
 
-        click.echo(f'Target Tweak => {click.style(target_tweak.description)}')
+    prefix = ctx.obj['PREFIX']
+    targets = [(tweak_name, tweaks.build_tweak(tweak_name)) for tweak_name in tweak_names]
 
+    if plan_only:
         with tempfile.TemporaryDirectory(prefix='prefixer-') as tempdir:
-            runtime = RuntimeContext(prefix, tempdir)
-            run_tweak(runtime, target_tweak, tweak_name)
+            print_plan(Plan.build_plan(RuntimeContext(prefix, tempdir), targets))
+        return
+
+    with tempfile.TemporaryDirectory(prefix='prefixer-') as tempdir:
+        plan = Plan.build_plan(RuntimeContext(prefix, tempdir), targets)
+        prefetch(plan)
+        plan.run()
 
-        click.secho('All tasks completed successfully!', fg='bright_green')
     click.secho('All tweaks completed!', fg='bright_green')
 
 @prefixer.command()
@@ -299,10 +320,8 @@ def overridedll(ctx, dll_names: list[str]):
     """
     dll_names = set(dll_names) # set for deduplication
     prefix: Prefix = ctx.obj['PREFIX']
-    reg = parser.parse_hive_file(os.path.join(prefix.pfx_path, 'user.reg'))
-    override_node = reg.nodes['Software\\\\Wine\\\\DllOverrides']
-    values = override_node.values
     if not dll_names:
+        values = parser.read_node(os.path.join(prefix.pfx_path, 'user.reg'), 'Software\\\\Wine\\\\DllOverrides').values
         max_len = max(len(name) for name in values.keys())
 
         for dll, status in values.items():
@@ -311,6 +330,10 @@ def overridedll(ctx, dll_names: list[str]):
 
         ctx.exit()
 
+    reg = parser.parse_hive_file(os.path.join(prefix.pfx_path, 'user.reg'))
+    override_node = reg.nodes['Software\\\\Wine\\\\DllOverrides']
+    values = override_node.values
+
     for dll in dll_names:
         if dll in values.keys():
             override_node.set(dll, '!prefixer_remove!')
@@ -323,8 +346,7 @@ def overridedll(ctx, dll_names: list[str]):
         click.echo(', ', nl=False)
     click.secho('applying...', fg='bright_black')
 
-    reg.nodes['Software\\\\Wine\\\\DllOverrides'] = override_node
-    writer.write_to_file(hive=reg, path=os.path.join(ctx.obj['PFX_PATH'], 'user.reg'))
+    writer.patch_file(hive=reg, path=os.path.join(prefix.pfx_path, 'user.reg'))
 
     click.secho('Done!', fg='bright_green')
 
@@ -336,10 +358,256 @@ def info(ctx):
     """
     click.echo('='*20)
 
+@click.group()
+@click.option('--profile', is_flag=True, help='Print where the time went; set PF_PROFILE to a path for a JSON trace', callback=enable_profiling, expose_value=False, is_eager=True)
+def tools():
+    """
+    Commands that don't target a prefix
+    """
+
+@tools.group(invoke_without_command=True)
+@click.pass_context
+def cache(ctx):
+    """
+    Inspects the download cache; see subcommands to list and prune it
+    """
+    if ctx.invoked_subcommand: return
+    from prefixer.core import downloads
+    from prefixer.core.settings import CACHE_LIMIT
+
+    stored = downloads.entries()
+    click.echo(f'Location => {click.style(downloads.store_dir(), fg='bright_blue')}')
+    click.echo(f'Files => {click.style(len(stored), fg='bright_blue')}')
+    click.echo(f'Size => {click.style(format_size(sum(size for _, size, _ in stored)), fg='bright_blue')} {click.style(f'(limit {format_size(CACHE_LIMIT)}, PF_CACHE_LIMIT_MB)', fg='bright_black')}')
+
+@cache.command('list')
+def cache_list():
+    """
+    Lists cached downloads, least recently used first
+    """
+    from datetime import datetime
+    from prefixer.core import downloads
+
+    for checksum, size, used in downloads.entries():
+        click.echo(f'{click.style(checksum, fg='bright_blue')} {format_size(size):>10} {click.style(datetime.fromtimestamp(used).strftime('%Y-%m-%d %H:%M'), fg='bright_black')}')
+
+@cache.command('prune')
+@click.option('--max-size', type=int, help='Prune down to this size in MiB; defaults to PF_CACHE_LIMIT_MB')
+@click.option('--all', 'prune_all', is_flag=True, help='Remove every cached download')
+def cache_prune(max_size: int, prune_all: bool):
+    """
+    Removes least recently used downloads until the cache fits its limit
+    """
+    from prefixer.core import downloads
+    from prefixer.core.settings import CACHE_LIMIT
+
+    limit = 0 if prune_all else (max_size * 1024 * 1024 if max_size is not None else CACHE_LIMIT)
+    removed = downloads.evict(limit)
+    click.secho(f'Removed {len(removed)} cached downloads', fg='bright_green')
+
+@tools.command()
+@click.argument('targets', nargs=-1, required=True)
+@click.option('--tweak', '-t', 'tweak_names', multiple=True, required=True, shell_complete=complete_tweaks, help='Tweak to apply; can be repeated')
+@click.option('--jobs', '-j', type=int, default=os.cpu_count(), show_default=True, help='Prefixes worked on at once')
+@click.option('--log-dir', type=click.Path(file_okay=False), help='Directory for per-prefix logs; defaults to a new temporary directory')
+def batch(targets: list[str], tweak_names: list[str], jobs: int, log_dir: str):
+    """
+    Applies tweaks to many prefixes; targets are IDs, names, glob patterns or "all"
+    """
+    refuse_root()
+    from prefixer.core.batch import BatchResult, run_batch
+    from prefixer.core.planner import Plan, prefetch
+
+    index = get_prefix_index()
+
+    runnable: list[tuple[str, Prefix]] = []
+    results: list[BatchResult] = []
+    for i in index.select(list(targets)):
+        try:
+            prefix = index.get(i)
+        except excs.PrefixerError:
+            prefix = None
+
+        if prefix is None or None in [prefix.pfx_path, prefix.files_path, prefix.binary_path] or not os.path.isdir(prefix.pfx_path):
+            results.append(BatchResult(index.names[i], index.ids[i], 'skipped', error='No prefix yet, launch the game once'))
+        else:
+            runnable.append((index.ids[i], prefix))
+
+    targets = [(tweak_name, tweaks.build_tweak(tweak_name)) for tweak_name in tweak_names]
+    click.echo(f'Targeting => {click.style(len(runnable), fg='bright_blue')} prefixes, {click.style(len(targets), fg='bright_blue')} tweaks')
+
+    with tempfile.TemporaryDirectory(prefix='prefixer-') as tempdir:
+        prefetch([Plan.build_plan(RuntimeContext(prefix, tempdir), targets) for _, prefix in runnable])
+
+    log_dir = log_dir or tempfile.mkdtemp(prefix='prefixer-batch-')
+    os.makedirs(log_dir, exist_ok=True)
+    click.echo(f'Logs => {click.style(log_dir, fg='bright_blue')}')
+
+    colors = {'done': 'bright_green', 'skipped': 'bright_yellow', 'failed': 'bright_red'}
+    finished = 0
+    def report(result: BatchResult):
+        nonlocal finished
+        finished += 1
+        click.echo(f'[{finished}/{len(runnable)}] {click.style(result.name, fg='bright_blue')} {click.style(result.status, fg=colors[result.status])}')
+
+    results += run_batch(runnable, targets, jobs, log_dir, on_result=report)
+
+    click.echo('=' * 20)
+    max_len = max(len(r.name) for r in results)
+    for r in sorted(results, key=lambda r: r.name.lower()):
+        padding = " " * (max_len - len(r.name))
+        line = f'{click.style(r.name, fg='bright_blue')}{padding} {click.style(f'{r.status:<7}', fg=colors[r.status])}'
+        if r.status == 'done': line += f' {len(r.applied)} applied, {len(r.skipped)} skipped {click.style(f'({r.duration:.1f}s)', fg='bright_black')}'
+        if r.error: line += f' {r.error}' + (f' {click.style(f'(see {r.log})', fg='bright_black')}' if r.log else '')
+        click.echo(line)
+
+    counts = {status: sum(r.status == status for r in results) for status in colors}
+    click.echo(', '.join(click.style(f'{count} {status}', fg=colors[status]) for status, count in counts.items()))
+    if counts['failed']: sys.exit(1)
+
+@tools.command()
+@click.option('--stop', is_flag=True, help='Stop the running daemon')
+def daemon(stop: bool):
+    """
+    Keeps prefixes, tweaks and imports loaded and runs prefixer commands for faster startup
+    """
+    from prefixer import client
+    from prefixer.core.daemon import Daemon
+
+    if stop:
+        if not client.stop(): click.secho('No daemon is running', fg='bright_yellow')
+        return
+
+    refuse_root()
+    Daemon().serve()
+
+@tools.group(invoke_without_command=True)
+@click.pass_context
+def alias(ctx):
+    """
+    Lists aliases for targets; see subcommands to set and remove them
+    """
+    if ctx.invoked_subcommand: return
+    from prefixer.core import search
+
+    aliases = search.load_aliases()
+    if not aliases:
+        click.echo('No aliases set')
+        return
+
+    max_len = max(len(name) for name in aliases)
+    for name, target in aliases.items():
+        click.echo(f'{click.style(name, fg='bright_blue')}{' ' * (max_len - len(name))} => {target}')
+
+@alias.command('set')
+@click.argument('name')
+@click.argument('target')
+def alias_set(name: str, target: str):
+    """
+    Makes NAME resolve to TARGET, an ID or exact name
+    """
+    from prefixer.core import search
+
+    if name in tools.commands:
+        click.secho(f'{name} is a Prefixer command, pick another alias', fg='bright_red')
+        sys.exit(1)
+
+    aliases = search.load_aliases()
+    aliases[name] = target
+    search.save_aliases(aliases)
+    click.secho(f'{name} => {target}', fg='bright_green')
+
+@alias.command('remove')
+@click.argument('name')
+def alias_remove(name: str):
+    """
+    Removes an alias
+    """
+    from prefixer.core import search
+
+    aliases = search.load_aliases()
+    if aliases.pop(name, None) is None:
+        click.secho(f'No alias named {name}', fg='bright_red')
+        sys.exit(1)
+
+    search.save_aliases(aliases)
+    click.secho(f'Removed {name}', fg='bright_green')
+
+def refresh_registry_index(jobs: int):
+    from prefixer.core import regindex
+
+    index = get_prefix_index()
+    prefixes = []
+    for i in range(len(index.ids)):
+        try:
+            prefix = index.get(i)
+        except excs.PrefixerError:
+            continue
+
+        if prefix is not None and prefix.pfx_path is not None and os.path.isdir(prefix.pfx_path):
+            prefixes.append(regindex.IndexedPrefix(index.ids[i], index.names[i], str(prefix.pfx_path)))
+
+    result = regindex.refresh(prefixes, jobs)
+    for path, error in result.failed.items():
+        click.secho(f'WARNING: Could not index {path} ({error})', fg='bright_yellow', err=True)
+
+    return result
+
+@tools.group('registry-index', invoke_without_command=True)
+@click.pass_context
+def registry_index(ctx):
+    """
+    Inspects the registry index of every prefix; see subcommands to refresh and query it
+    """
+    if ctx.invoked_subcommand: return
+    from prefixer.core import regindex
+
+    counts = regindex.summary()
+    click.echo(f'Location => {click.style(regindex.index_path(), fg='bright_blue')}')
+    for what, count in counts.items():
+        click.echo(f'{what.capitalize()} => {click.style(count, fg='bright_blue')}')
+
+@registry_index.command('refresh')
+@click.option('--jobs', '-j', type=int, default=os.cpu_count(), show_default=True, help='Hives parsed at once')
+def registry_index_refresh(jobs: int):
+    """
+    Indexes the user.reg and system.reg of every prefix; only hives changed since the last refresh are parsed
+    """
+    result = refresh_registry_index(jobs)
+    click.secho(f'Parsed {result.parsed} hives, {result.unchanged} unchanged, {result.removed} removed', fg='bright_green')
+
+@registry_index.command('query')
+@click.argument('key')
+@click.argument('name', required=False)
+@click.option('--value', help='Only values matching this case-insensitive glob pattern, e.g. "native*"')
+@click.option('--refresh', 'refresh_first', is_flag=True, help='Refresh the index first')
+def registry_index_query(key: str, name: str, value: str, refresh_first: bool):
+    """
+    Lists the prefixes having a value under KEY (e.g. 'Software\\Wine\\DllOverrides'), optionally only the NAME value
+    """
+    from prefixer.core import regindex
+
+    if refresh_first: refresh_registry_index(os.cpu_count())
+    matches = regindex.query(key, name, value)
+    if not matches:
+        click.secho('No matching prefixes', fg='bright_yellow')
+        return
+
+    max_len = max(len(m.name) for m in matches)
+    for m in matches:
+        padding = " " * (max_len - len(m.name))
+        click.echo(f'{click.style(m.name, fg='bright_blue')}{padding} {click.style(m.id, fg='bright_black')} {m.value_name}: {click.style(m.value, bold=True)}')
+
+prefixer.epilog = f'Commands without a prefix: {', '.join(tools.commands)}'
+
 # if __name__ == '__main__':
 def main():
+    # Prefix-less commands would otherwise be taken as the APP_ID argument
+    from prefixer.client import command_name
+    entry = tools if command_name(sys.argv[1:]) in tools.commands else prefixer
+
     try:
-        prefixer(standalone_mode=False)
+        entry(standalone_mode=False)
         sys.exit(0)
 
     except click.ClickException as e:
@@ -354,6 +622,10 @@ def main():
         click.secho('ERROR: Prefixer was unable to find Steam!', fg='bright_red')
     except excs.NoTaskError:
         click.secho('ERROR: The task specified in the tweak wasn\'t found!', fg='bright_red')
+    except excs.AmbiguousTargetError as e:
+        click.secho(f'ERROR: "{e.target}" matches several prefixes, use an ID or a longer name:', fg='bright_red')
+        for name, id, score in e.candidates:
+            click.echo(f'  {click.style(id, fg='bright_blue')} {name} {click.style(f'({score:.0f}%)', fg='bright_black')}')
     except excs.NoPrefixError:
         click.secho('ERROR: The specified Prefix couldn\'t be found!', fg='bright_red')
 
@@ -371,4 +643,7 @@ def main():
     except excs.InternalExeError:
         click.secho('ERROR: There was an error while running an external exe within the tweak!', fg='bright_red')
 
+    finally:
+        profiler.finish()
+
     sys.exit(1)
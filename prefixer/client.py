@@ -0,0 +1,78 @@
+"""
+Entry point of the prefixer command. Forwards the command to a running `prefixer daemon` and only loads
+Prefixer itself when there's none, so forwarded commands skip imports and indexing entirely.
+"""
+from prefixer.core.settings import NO_DAEMON, DAEMON_SOCKET
+import socket
+import struct
+import json
+import sys
+import os
+
+TOOLS_OPTIONS = ['--profile']
+"""Options of the prefix-less `tools` group, the only ones that can come before its command"""
+
+def command_name(argv: list[str]) -> str | None:
+    """The first argument that could name a prefix-less command; other options make it a prefix command"""
+    return next((arg for arg in argv if arg not in TOOLS_OPTIONS), None)
+
+def peer_uid(conn: socket.socket) -> int:
+    return struct.unpack('3i', conn.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize('3i')))[1]
+
+def connect(path: str) -> socket.socket | None:
+    """Connects to the daemon, None if there's none or the socket belongs to someone else"""
+    if not os.path.exists(path): return None
+
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        client.connect(path)
+        if peer_uid(client) == os.getuid(): return client # Never hand our environment and terminal to another user
+    except OSError:
+        pass
+
+    client.close()
+    return None
+
+def forward(argv: list[str], path: str = DAEMON_SOCKET, fds: tuple[int, int, int] = (0, 1, 2)) -> int | None:
+    """Runs a command through the daemon with fds as its stdin/stdout/stderr, returns its exit code or None if it can't"""
+    client = connect(path)
+    if client is None: return None
+
+    with client:
+        payload = json.dumps({'argv': argv, 'cwd': os.getcwd(), 'env': dict(os.environ)}).encode() + b'\n'
+        socket.send_fds(client, [payload[:1]], list(fds))
+        client.sendall(payload[1:])
+
+        replies = client.makefile('rb')
+        while True:
+            try:
+                line = replies.readline()
+                break
+            except KeyboardInterrupt:
+                client.sendall(b'interrupt\n') # The command runs in the daemon, pass Ctrl+C on
+
+    if not line:
+        print('ERROR: The Prefixer daemon stopped while running the command', file=sys.stderr)
+        return 1
+
+    reply = json.loads(line)
+    return None if reply.get('fallback') else reply['exit']
+
+def stop(path: str = DAEMON_SOCKET) -> bool:
+    """Asks a running daemon to exit, returns False if there's none"""
+    client = connect(path)
+    if client is None: return False
+
+    with client:
+        socket.send_fds(client, [b'{"stop": true}\n'], [])
+        client.makefile('rb').readline()
+
+    return True
+
+def main():
+    if not NO_DAEMON and command_name(sys.argv[1:]) != 'daemon':
+        code = forward(sys.argv[1:])
+        if code is not None: sys.exit(code)
+
+    from prefixer.cli import main as cli_main
+    cli_main()
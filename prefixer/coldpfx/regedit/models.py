@@ -1,7 +1,7 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from typing import Optional
 
-@dataclass
+@dataclass(slots=True)
 class RegistryNode:
     path: str
     """Registry path"""
@@ -11,6 +11,12 @@ class RegistryNode:
     """Values of the node"""
     changed: bool = False
     """Whenever the node was modified or not"""
+    meta: list[str] = field(default_factory=list)
+    """Wine metadata lines of the node, like #time= or #class="""
+    offset: Optional[int] = field(default=None, compare=False)
+    """Byte offset of the node block in the file it was parsed from"""
+    length: int = field(default=0, compare=False)
+    """Byte length of the node block, up to the next node"""
 
     def get(self, name: str) -> Optional[str]:
         return self.values.get(name)
@@ -30,3 +36,5 @@ class RegistryHive:
     """Nodes in the hive"""
     arch: str = 'win32'
     """Prefix architecture"""
+    stamp: Optional[tuple[int, int]] = field(default=None, compare=False)
+    """(mtime_ns, size) of the file the hive was parsed from, node offsets are only valid for it"""
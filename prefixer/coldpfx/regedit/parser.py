@@ -1,56 +1,126 @@
 from prefixer.coldpfx.regedit.models import RegistryNode, RegistryHive
-from typing import List
+from typing import BinaryIO, Iterable, Iterator, Optional
+from sys import intern
+import os
 import re
 
-def parse_hive(hive_raw: List[str]):
-    """Parses raw strings of a hive into a RegistryHive object"""
-    header = hive_raw[0].strip()
-    relative = hive_raw[1].strip()
-    node_header_pattern = re.compile(r'^\[(?P<key_path>.+)\]\s+(?P<timestamp>\d+)$')
-    value_pattern = re.compile(r'^(?:"(?P<key>(?:[^"\\]|\\.)*)"|(?P<default>@))=(?P<value>.*)$')
+NODE_HEADER_PATTERN = re.compile(r'^\[(?P<key_path>.+)\]\s+(?P<timestamp>\d+)$')
+VALUE_PATTERN = re.compile(r'^(?:"(?P<key>(?:[^"\\]|\\.)*)"|(?P<default>@))=(?P<value>.*)$')
+
+class HiveLines:
+    """Iterates a binary hive file as text lines, tracking the byte offset of each line"""
+    def __init__(self, f: BinaryIO):
+        self.f = f
+        self.offset = 0
+        """Byte offset of the last returned line"""
+        self.position = 0
+        """Byte offset right after the last returned line"""
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> str:
+        raw = self.f.readline()
+        self.offset = self.position
+        if not raw: raise StopIteration
+
+        self.position += len(raw)
+        return raw.decode('utf-8', 'surrogateescape')
+
+def in_subtree(key_path: str, prefix: str) -> bool:
+    """Checks if a key path is the prefix key or one of its subkeys; paths are compared case-insensitively like in Windows"""
+    key_path = key_path.lower()
+    return key_path == prefix or key_path.startswith(prefix + '\\\\')
+
+def iter_nodes(hive_raw: Iterable[str], prefix: Optional[str] = None, hive: Optional[RegistryHive] = None) -> Iterator[RegistryNode]:
+    """
+    Parses raw strings of a hive, yielding each node once it's complete.
+    When prefix is given, nodes outside that subtree are skipped without parsing their values.
+    The #arch= value is stored into hive if one is passed.
+    Nodes read from HiveLines also get the byte offset and length of their block.
+    """
+    if prefix: prefix = prefix.lower()
+    tracked = hive_raw if isinstance(hive_raw, HiveLines) else None
 
     node = None
-    nodes = {}
     current_key = None
-    arch = None
 
     for line in hive_raw:
-        clean_line = line.strip()
+        if line.startswith('['):
+            node_match = NODE_HEADER_PATTERN.match(line.strip())
+            if node_match:
+                if node:
+                    if tracked: node.length = tracked.offset - node.offset
+                    yield node
+
+                key_path = node_match.group('key_path')
+                current_key = None
+
+                if prefix and not in_subtree(key_path, prefix):
+                    node = None
+                    continue
+
+                node = RegistryNode(intern(key_path), int(node_match.group('timestamp')), {})
+                if tracked: node.offset = tracked.offset
+                continue
 
-        if clean_line.startswith('#arch='):
-            arch = clean_line.split('=')[1].strip()
+        if not node:
+            if hive is not None and line.startswith('#arch='):
+                hive.arch = line.split('=')[1].strip()
             continue
 
-        node_match = node_header_pattern.match(clean_line)
-        if node_match:
-            key_path = node_match.group('key_path')
-            timestamp = int(node_match.group('timestamp'))
-            node = RegistryNode(key_path, timestamp, {})
-            nodes[key_path] = node
+        if line.startswith("  ") and current_key:
+            node.values[current_key] += "\n" + line.rstrip()
             continue
 
-        if node:
-            if line.startswith("  ") and current_key:
-                new_val = node.values[current_key] + "\n" + line.rstrip()
-                node.values[current_key] = new_val
-                continue
+        if line.startswith('#'):
+            node.meta.append(line.rstrip())
+            continue
 
-            value_match = value_pattern.match(clean_line)
-            if value_match:
-                if value_match.group('default'):
-                    key = '@'
-                else:
-                    key = value_match.group('key').replace(r'\"', '"').replace(r'\\', '\\')
+        value_match = VALUE_PATTERN.match(line.strip())
+        if value_match:
+            if value_match.group('default'):
+                key = '@'
+            else:
+                key = intern(value_match.group('key').replace(r'\"', '"').replace(r'\\', '\\'))
 
-                current_key = key
-                node.set(key, value_match.group('value'))
-                node.changed = False
-                continue
+            current_key = key
+            node.values[key] = value_match.group('value')
+
+    if node:
+        if tracked: node.length = tracked.position - node.offset
+        yield node
+
+def parse_hive(hive_raw: Iterable[str], prefix: Optional[str] = None):
+    """Parses raw strings of a hive into a RegistryHive object, optionally only the subtree under prefix"""
+    lines = iter(hive_raw)
+    header = next(lines, '').strip()
+    relative = next(lines, '').strip()
+
+    hive = RegistryHive(header, relative, {}, None)
+    for node in iter_nodes(lines, prefix, hive):
+        hive.nodes[node.path] = node
+
+    if not hive.arch: hive.arch = 'win64'
+    return hive
+
+def parse_hive_file(path: str, prefix: Optional[str] = None):
+    """Helper to stream a file into parse_hive, recording node offsets for writer.patch_file"""
+    with open(path, 'rb') as f:
+        st = os.fstat(f.fileno())
+        hive = parse_hive(HiveLines(f), prefix)
+
+    hive.stamp = (st.st_mtime_ns, st.st_size)
+    return hive
+
+def read_node(path: str, key_path: str) -> Optional[RegistryNode]:
+    """Reads a single node from a hive file, stopping as soon as it has been parsed"""
+    with open(path, 'rb') as f:
+        lines = HiveLines(f)
+        next(lines, None)
+        next(lines, None)
 
-    if not arch: arch = 'win64'
-    return RegistryHive(header, relative, nodes, arch)
+        for node in iter_nodes(lines, key_path):
+            if node.path.lower() == key_path.lower(): return node
 
-def parse_hive_file(path: str):
-    """Helper to read and redirect to parse_hive"""
-    with open(path, 'r') as f:
-        return parse_hive(f.readlines())
+    return None
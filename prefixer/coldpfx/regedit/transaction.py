@@ -0,0 +1,111 @@
+from prefixer.coldpfx.regedit.models import RegistryHive, RegistryNode
+from prefixer.coldpfx.regedit import parser, writer
+from typing import Callable, Optional
+import threading
+import os
+
+class HiveTransaction:
+    """
+    Keeps the hives of a prefix parsed in memory while tasks read and edit them.
+    Every changed hive is written once on commit, with a single backup per transaction.
+    Usable as a (re-entrant) context manager that commits when the outermost block exits.
+    Edits are committed even if a task failed, like when every edit was written right away.
+    Safe to use from the planner's worker threads.
+    """
+    def __init__(self, pfx_path: str, before_write: Optional[Callable[[], None]] = None):
+        self.pfx_path = pfx_path
+        self.before_write = before_write
+        """Called before hives are written, e.g. to stop a wineserver that would write them back over us"""
+        self.hives: dict[str, RegistryHive] = {}
+        """Parsed hives by filename, e.g. user.reg"""
+        self.keys: dict[str, dict[str, str]] = {}
+        """Node paths of each parsed hive by their lowercase form, key paths are case-insensitive like in Windows"""
+        self.edits: dict[str, list[tuple[str, str, str]]] = {}
+        """Pending (node path, value name, value) edits of each dirty hive"""
+        self.backed_up: set[str] = set()
+        self.depth = 0
+        self.lock = threading.RLock()
+
+    def path(self, filename: str) -> str:
+        return os.path.join(self.pfx_path, filename)
+
+    def is_current(self, filename: str) -> bool:
+        st = os.stat(self.path(filename))
+        return self.hives[filename].stamp == (st.st_mtime_ns, st.st_size)
+
+    def hive(self, filename: str) -> RegistryHive:
+        """Returns a parsed hive, parsing it again only if something else (like Wine) changed the file"""
+        with self.lock:
+            if filename in self.hives and (filename in self.edits or self.is_current(filename)):
+                return self.hives[filename]
+
+            return self.load(filename)
+
+    def load(self, filename: str) -> RegistryHive:
+        hive = self.hives[filename] = parser.parse_hive_file(self.path(filename))
+        self.keys[filename] = {path.lower(): path for path in hive.nodes}
+        return hive
+
+    def find(self, filename: str, node_path: str) -> Optional[RegistryNode]:
+        """Looks up a node of a parsed hive, ignoring the case of its path like read_node does"""
+        path = self.keys[filename].get(node_path.lower())
+        return None if path is None else self.hives[filename].nodes[path]
+
+    def node(self, filename: str, node_path: str) -> Optional[RegistryNode]:
+        """Returns a node without loading the whole hive if it isn't loaded already"""
+        with self.lock:
+            if filename not in self.hives:
+                return parser.read_node(self.path(filename), node_path)
+
+            self.hive(filename)
+            return self.find(filename, node_path)
+
+    def apply(self, filename: str, node_path: str, name: str, value: str):
+        node = self.find(filename, node_path)
+        if node is None:
+            node = self.hives[filename].nodes[node_path] = RegistryNode(node_path, 0, {})
+            self.keys[filename][node_path.lower()] = node_path
+
+        node.set(name, value)
+
+    def set(self, filename: str, node_path: str, name: str, value: str):
+        """Sets a value in memory, it's written on commit"""
+        with self.lock:
+            self.hive(filename)
+            self.apply(filename, node_path, name, value)
+            self.edits.setdefault(filename, []).append((node_path, name, value))
+
+    def commit(self):
+        """Writes every changed hive back, keeping the pre-transaction file as a .bak"""
+        with self.lock:
+            if self.edits and self.before_write: self.before_write()
+
+            for filename, edits in self.edits.items():
+                path = self.path(filename)
+                backup = None if filename in self.backed_up else f'{path}.bak'
+
+                try:
+                    writer.patch_file(self.hives[filename], path, backup)
+                except writer.StaleHiveError:
+                    # The file was rewritten under us (usually by wineserver), replay our edits on top of it
+                    hive = self.load(filename)
+                    for edit in edits: self.apply(filename, *edit)
+                    writer.patch_file(hive, path, backup)
+
+                self.backed_up.add(filename)
+
+            self.edits.clear()
+
+    def discard(self):
+        with self.lock:
+            self.hives.clear()
+            self.keys.clear()
+            self.edits.clear()
+
+    def __enter__(self):
+        self.depth += 1
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.depth -= 1
+        if not self.depth: self.commit()
@@ -1,6 +1,34 @@
-from prefixer.coldpfx.regedit.models import RegistryHive
+from prefixer.coldpfx.regedit.models import RegistryHive, RegistryNode
+import os
 import time
-from typing import List
+import shutil
+import tempfile
+from typing import List, Optional
+
+class StaleHiveError(Exception): pass
+
+def filetime(unix_time: int) -> str:
+    """Converts a unix timestamp into the hex FILETIME used by Wine's #time= lines"""
+    return f'{(unix_time + 11644473600) * 10_000_000:x}'
+
+def serialize_node(node: RegistryNode, current_time: int) -> List[str]:
+    lines = []
+
+    if node.changed:
+        lines.append(f'[{node.path}] {current_time}')
+        lines.extend(f'#time={filetime(current_time)}' if line.startswith('#time=') else line for line in node.meta)
+    else:
+        lines.append(f'[{node.path}] {node.timestamp}')
+        lines.extend(node.meta)
+
+    for name, raw_value in sorted(node.values.items()):
+        if name == '@':
+            lines.append(f'@={raw_value}')
+        else:
+            escaped_name = name.replace('\\', '\\\\').replace('"', '\\"')
+            lines.append(f'"{escaped_name}"={raw_value}')
+
+    return lines
 
 def serialize(hive: RegistryHive) -> List[str]:
     lines = [hive.header, hive.relative, '', f'#arch={hive.arch}', '']
@@ -11,15 +39,7 @@ def serialize(hive: RegistryHive) -> List[str]:
         if not node.values:
             continue
 
-        if node.changed: lines.append(f'[{node.path}] {current_time}')
-        else: lines.append(f'[{node.path}] {node.timestamp}')
-
-        for name, raw_value in sorted(node.values.items()):
-            if name == '@':
-                lines.append(f'@={raw_value}')
-            else:
-                escaped_name = name.replace('\\', '\\\\').replace('"', '\\"')
-                lines.append(f'"{escaped_name}"={raw_value}')
+        lines.extend(serialize_node(node, current_time))
 
     return lines
 
@@ -27,3 +47,110 @@ def write_to_file(hive: RegistryHive, path: str):
     with open(path, 'w') as f:
         data = serialize(hive)
         f.write('\n'.join(data))
+
+def write_all(fd: int, data: bytes):
+    view = memoryview(data)
+    while view:
+        view = view[os.write(fd, view):]
+
+def copy_range(src: int, dst: int, offset: int, count: int):
+    """Copies a byte range between files in the kernel, which reflinks it on CoW filesystems"""
+    while count > 0 and hasattr(os, 'copy_file_range'):
+        try:
+            copied = os.copy_file_range(src, dst, count, offset)
+        except OSError:
+            copied = 0
+        if not copied: break
+
+        offset += copied
+        count -= copied
+
+    while count > 0: # Fallback for filesystems without copy_file_range
+        chunk = os.pread(src, min(count, 1 << 20), offset)
+        if not chunk: raise StaleHiveError('Hive file shrank while patching')
+        write_all(dst, chunk)
+
+        offset += len(chunk)
+        count -= len(chunk)
+
+def patch_file(hive: RegistryHive, path: str, backup: Optional[str] = None):
+    """
+    Writes a hive parsed with parser.parse_hive_file back by re-serializing only its changed nodes.
+    Untouched blocks are copied byte-for-byte from the original, and the result atomically replaces it.
+    If backup is given, the original file is kept there as a hardlink instead of a copy.
+    Afterwards the hive matches the new file, so it can be patched again.
+    """
+    changed = sorted((n for n in hive.nodes.values() if n.changed and n.offset is not None), key=lambda n: n.offset)
+    added = sorted((n for n in hive.nodes.values() if n.changed and n.offset is None), key=lambda n: n.path)
+    if not changed and not added: return
+
+    current_time = int(time.time())
+    blocks = {}
+    def block(node: RegistryNode) -> bytes:
+        data = ('\n'.join(serialize_node(node, current_time)) + '\n\n').encode('utf-8', 'surrogateescape')
+        blocks[node.path] = data
+        return data
+
+    src = os.open(path, os.O_RDONLY)
+    try:
+        st = os.fstat(src)
+        if hive.stamp != (st.st_mtime_ns, st.st_size):
+            raise StaleHiveError(f'{path} changed since it was parsed')
+
+        fd, tmp = tempfile.mkstemp(prefix=f'.{os.path.basename(path)}-', dir=os.path.dirname(path))
+        try:
+            position = 0
+            for node in changed:
+                copy_range(src, fd, position, node.offset - position)
+                write_all(fd, block(node))
+                position = node.offset + node.length
+
+            copy_range(src, fd, position, st.st_size - position)
+
+            if added:
+                tail = os.pread(src, 2, max(st.st_size - 2, 0))
+                if tail and not tail.endswith(b'\n\n'): write_all(fd, b'\n' if tail.endswith(b'\n') else b'\n\n')
+                end = os.lseek(fd, 0, os.SEEK_CUR)
+                for node in added: write_all(fd, block(node))
+
+            os.fchmod(fd, st.st_mode & 0o7777)
+            os.fsync(fd)
+        except BaseException:
+            os.close(fd)
+            os.remove(tmp)
+            raise
+
+        os.close(fd)
+    finally:
+        os.close(src)
+
+    if backup:
+        if os.path.lexists(backup): os.remove(backup)
+        try:
+            os.link(path, backup)
+        except OSError:
+            shutil.copy2(path, backup)
+
+    os.replace(tmp, path)
+
+    # Shift the offsets of every node to where it now lives in the new file
+    shifts = [(n.offset, len(blocks[n.path]) - n.length) for n in changed]
+    delta = 0
+    for node in sorted((n for n in hive.nodes.values() if n.offset is not None), key=lambda n: n.offset):
+        while shifts and shifts[0][0] < node.offset:
+            delta += shifts.pop(0)[1]
+
+        node.offset += delta
+
+    for node in added:
+        node.offset = end
+        end += len(blocks[node.path])
+
+    for node in changed + added:
+        node.length = len(blocks[node.path])
+        node.timestamp = current_time
+        node.meta = [f'#time={filetime(current_time)}' if line.startswith('#time=') else line for line in node.meta]
+        node.changed = False
+
+    st = os.stat(path)
+    hive.stamp = (st.st_mtime_ns, st.st_size)
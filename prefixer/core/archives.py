@@ -0,0 +1,139 @@
+from prefixer.core.exceptions import BadFileError
+from prefixer.core.settings import EXTRACT_WORKERS, DOWNLOAD_CHUNK_SIZE
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+import threading
+import subprocess
+import tarfile
+import zipfile
+import shutil
+import zlib
+import os
+
+SEVEN_ZIP_MAGIC = b'7z\xbc\xaf\x27\x1c'
+SEVEN_ZIP_BINARIES = ['7z', '7zz', '7za']
+
+@dataclass
+class ExtractResult:
+    extracted: int = 0
+    skipped: int = 0
+    """Members that already matched the destination"""
+
+def archive_format(path: str) -> str:
+    """zip, tar or 7z, detected from the file's contents rather than its name"""
+    if zipfile.is_zipfile(path): return 'zip'
+
+    with open(path, 'rb') as f:
+        if f.read(len(SEVEN_ZIP_MAGIC)) == SEVEN_ZIP_MAGIC: return '7z'
+
+    if tarfile.is_tarfile(path): return 'tar'
+    raise BadFileError(f'{os.path.basename(path)} is not a supported archive')
+
+def member_path(dest: str, name: str) -> str | None:
+    """Where a member goes, sanitized the way zipfile does; None for members that resolve to dest itself"""
+    parts = [p for p in name.replace('\\', '/').split('/') if p not in ('', '.', '..')]
+    return os.path.join(dest, *parts) if parts else None
+
+def crc32_file(path: str) -> int:
+    crc = 0
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(DOWNLOAD_CHUNK_SIZE), b''):
+            crc = zlib.crc32(block, crc)
+
+    return crc
+
+def up_to_date(path: str, size: int, crc: int) -> bool:
+    try:
+        if os.path.getsize(path) != size: return False
+    except OSError:
+        return False
+
+    return crc32_file(path) == crc
+
+def extract_zip(path: str, dest: str, workers: int) -> ExtractResult:
+    """Decompresses members concurrently; zlib and friends release the GIL, so this scales with cores"""
+    result = ExtractResult()
+    local = threading.local()
+    handles = []
+    lock = threading.Lock()
+
+    def archive() -> zipfile.ZipFile:
+        if not hasattr(local, 'zip'):
+            local.zip = zipfile.ZipFile(path)
+            with lock: handles.append(local.zip)
+        return local.zip
+
+    def extract_member(info: zipfile.ZipInfo, target: str) -> bool:
+        if up_to_date(target, info.file_size, info.CRC): return False
+
+        with archive().open(info) as src, open(target, 'wb') as dst:
+            if info.file_size:
+                try:
+                    os.posix_fallocate(dst.fileno(), 0, info.file_size)
+                except OSError: # Not every filesystem supports it
+                    pass
+            shutil.copyfileobj(src, dst, DOWNLOAD_CHUNK_SIZE)
+
+        return True
+
+    try:
+        with zipfile.ZipFile(path) as zf:
+            members = [(info, member_path(dest, info.filename)) for info in zf.infolist()]
+    except zipfile.BadZipFile:
+        raise BadFileError(f'{os.path.basename(path)} is not a valid zip file')
+
+    # Directories are made up front, so workers never race to create them
+    for info, target in members:
+        if target is None: continue
+        os.makedirs(target if info.is_dir() else os.path.dirname(target), exist_ok=True)
+
+    files = [(info, target) for info, target in members if target and not info.is_dir()]
+    try:
+        with ThreadPoolExecutor(max_workers=max(workers, 1)) as pool:
+            for extracted in pool.map(lambda m: extract_member(*m), files):
+                if extracted: result.extracted += 1
+                else: result.skipped += 1
+    except (zipfile.BadZipFile, zlib.error) as e:
+        raise BadFileError(f'{os.path.basename(path)} is corrupted: {e}')
+    finally:
+        for handle in handles: handle.close()
+
+    return result
+
+def extract_tar(path: str, dest: str) -> ExtractResult:
+    """Tar streams can only be read in order; files whose size and mtime match are skipped"""
+    result = ExtractResult()
+
+    try:
+        with tarfile.open(path) as tf:
+            for member in tf:
+                target = member_path(dest, member.name)
+                if member.isfile() and target and os.path.isfile(target):
+                    st = os.stat(target)
+                    if st.st_size == member.size and int(st.st_mtime) == int(member.mtime):
+                        result.skipped += 1
+                        continue
+
+                tf.extract(member, dest, filter='data')
+                if member.isfile(): result.extracted += 1
+    except (tarfile.TarError, zlib.error, EOFError) as e:
+        raise BadFileError(f'{os.path.basename(path)} is corrupted: {e}')
+
+    return result
+
+def extract_7z(path: str, dest: str) -> ExtractResult:
+    """7z archives are handed to the 7-Zip binary, like CABs are to cabextract"""
+    binary = next((shutil.which(b) for b in SEVEN_ZIP_BINARIES if shutil.which(b)), None)
+    if binary is None: raise BadFileError('Extracting 7z archives requires 7-Zip (7z) to be installed')
+
+    subprocess.run([binary, 'x', '-y', '-bso0', '-bsp0', f'-o{dest}', path], check=True)
+    return ExtractResult()
+
+def extract(path: str, dest: str, workers: int = EXTRACT_WORKERS) -> ExtractResult:
+    """Extracts a zip, tar (optionally compressed) or 7z archive into dest"""
+    os.makedirs(dest, exist_ok=True)
+
+    kind = archive_format(path)
+    if kind == 'zip': return extract_zip(path, dest, workers)
+    if kind == 'tar': return extract_tar(path, dest)
+    return extract_7z(path, dest)
@@ -0,0 +1,125 @@
+from prefixer.core import paths
+from prefixer.core.models import RuntimeContext
+from prefixer.core.planner import Plan
+from prefixer.core.settings import PROTON_SLOTS
+from prefixer.core.tweaks import Tweak
+from prefixer.providers.classes import Prefix
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import contextmanager, redirect_stdout, redirect_stderr
+from dataclasses import dataclass, field
+from functools import partial
+from time import perf_counter, sleep
+from typing import Callable, Optional
+import multiprocessing
+import tempfile
+import hashlib
+import click
+import fcntl
+import sys
+import os
+
+@dataclass
+class BatchResult:
+    """Outcome of applying a tweak set to one prefix"""
+    name: str
+    id: str
+    status: str
+    """done, failed or skipped"""
+    applied: list[str] = field(default_factory=list)
+    skipped: list[str] = field(default_factory=list)
+    """Tweaks skipped due to their conditions"""
+    error: Optional[str] = None
+    log: Optional[str] = None
+    duration: float = 0.0
+
+@contextmanager
+def proton_slot(binary_path: os.PathLike | str, slots: int = PROTON_SLOTS):
+    """Holds one of the slots of a Proton build; limits how many Wine processes use one build at once, across processes"""
+    key = hashlib.sha1(str(binary_path).encode()).hexdigest()[:16]
+    lock_dir = os.path.join(paths.CACHE_DIR, 'locks')
+    os.makedirs(lock_dir, exist_ok=True)
+
+    files = [open(os.path.join(lock_dir, f'proton-{key}-{i}.lock'), 'a') for i in range(max(slots, 1))]
+    try:
+        while True:
+            for f in files:
+                try:
+                    fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    continue
+
+                yield
+                return
+
+            sleep(0.2)
+    finally:
+        for f in files: f.close() # Closing releases the lock
+
+@contextmanager
+def redirect_output(log_path: str):
+    """Points stdout/stderr (including Wine's) at a log file and stdin at /dev/null, so prompts fail instead of hanging"""
+    sys.stdout.flush()
+    sys.stderr.flush()
+    saved = [os.dup(fd) for fd in (0, 1, 2)]
+
+    with open(log_path, 'w', buffering=1) as log, open(os.devnull, 'r') as devnull:
+        os.dup2(devnull.fileno(), 0)
+        os.dup2(log.fileno(), 1)
+        os.dup2(log.fileno(), 2)
+        try:
+            with redirect_stdout(log), redirect_stderr(log): yield
+        finally:
+            for fd, copy in enumerate(saved):
+                os.dup2(copy, fd)
+                os.close(copy)
+
+def apply_to_prefix(prefix: Prefix, id: str, targets: list[tuple[str, Tweak]], log_path: str) -> BatchResult:
+    """Applies tweaks to a single prefix with all output going to its log; runs in a batch worker process"""
+    result = BatchResult(prefix.name, id, 'done', log=log_path)
+    start = perf_counter()
+
+    with redirect_output(log_path):
+        try:
+            with tempfile.TemporaryDirectory(prefix='prefixer-') as tempdir:
+                runtime = RuntimeContext(prefix, tempdir, process_lock=partial(proton_slot, prefix.binary_path))
+                ran = Plan.build_plan(runtime, targets).run()
+
+            for name, _ in targets:
+                (result.applied if ran[name] else result.skipped).append(name)
+
+        except click.Abort:
+            result.status = 'failed'
+            result.error = 'A task asked for input'
+        except Exception as e:
+            result.status = 'failed'
+            result.error = f'{type(e).__name__}: {e}' if str(e) else type(e).__name__
+            click.echo(f'ERROR: {result.error}')
+
+    result.duration = perf_counter() - start
+    return result
+
+def run_batch(prefixes: list[tuple[str, Prefix]], targets: list[tuple[str, Tweak]], jobs: int, log_dir: str,
+              on_result: Callable[[BatchResult], None] = None) -> list[BatchResult]:
+    """Applies the same tweaks to many (id, prefix) pairs with a process pool, one prefix per worker at a time"""
+    results = []
+    if not prefixes: return results
+
+    # Forked workers inherit the already resolved prefixes, built tweaks and loaded registries
+    context = multiprocessing.get_context('fork')
+    with ProcessPoolExecutor(max_workers=max(jobs, 1), mp_context=context) as pool:
+        futures = {
+            pool.submit(apply_to_prefix, prefix, id, targets, os.path.join(log_dir, f'{id.replace(os.sep, '_')}.log')): (id, prefix)
+            for id, prefix in prefixes
+        }
+
+        for future in as_completed(futures):
+            id, prefix = futures[future]
+            try:
+                result = future.result()
+            except Exception as e: # The worker itself died
+                result = BatchResult(prefix.name, id, 'failed', error=f'{type(e).__name__}: {e}')
+
+            results.append(result)
+            if on_result: on_result(result)
+
+    return results
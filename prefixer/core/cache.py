@@ -0,0 +1,45 @@
+import os
+import json
+import tempfile
+from prefixer.core import paths
+
+CACHE_VERSION = 1
+
+def stamp(path: os.PathLike | str) -> list[int] | None:
+    """Returns an [mtime_ns, size] stamp for a file, None if it doesn't exist"""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+
+    return [st.st_mtime_ns, st.st_size]
+
+def cache_path(name: str) -> str:
+    return os.path.join(paths.CACHE_DIR, name)
+
+def load_cache(name: str) -> dict:
+    """Loads a JSON cache file, returns an empty dict if missing, corrupted or outdated"""
+    try:
+        with open(cache_path(name), 'r') as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+    if not isinstance(data, dict) or data.get('version') != CACHE_VERSION: return {}
+    return data
+
+def save_cache(name: str, data: dict):
+    """Atomically writes a JSON cache file; caching is best-effort, so failures are ignored"""
+    data['version'] = CACHE_VERSION
+    try:
+        os.makedirs(paths.CACHE_DIR, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(prefix=f'.{name}-', dir=paths.CACHE_DIR)
+    except OSError:
+        return
+
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(data, f, separators=(',', ':'))
+        os.replace(tmp, cache_path(name))
+    except OSError:
+        if os.path.exists(tmp): os.remove(tmp)
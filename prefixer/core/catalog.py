@@ -0,0 +1,119 @@
+from dataclasses import dataclass
+from pathlib import Path
+from prefixer.core.cache import stamp, load_cache, save_cache
+from prefixer.core.exceptions import BadTweakError
+import os
+
+TWEAK_EXTENSIONS = ('.json5', '.json')
+
+@dataclass
+class CatalogEntry:
+    """Summary of a tweak file, enough for listing, searching and completing without parsing it"""
+    name: str
+    filename: Path
+    description: str
+    task_types: list[str]
+    """Types of the tweak's tasks, in order"""
+    conditions: list[dict]
+    """Raw tweak-level conditions"""
+
+class TweakCatalog:
+    """Compiled index of tweak folders and files, persisted in the cache dir and validated with mtime stamps"""
+    CACHE_NAME = 'tweaks.json'
+
+    def __init__(self):
+        self.dirs: dict[str, dict] = {}
+        """Directory paths mapped to their stamp, tweak files and subdirectories"""
+        self.files: dict[str, dict] = {}
+        """Tweak file paths mapped to their stamp and summary"""
+        self.loaded = False
+        self.dirty = False
+
+    def load(self):
+        if self.loaded: return
+        data = load_cache(self.CACHE_NAME)
+        self.dirs = data.get('dirs', {})
+        self.files = data.get('files', {})
+        self.loaded = True
+
+    def list_dir(self, path: str) -> dict | None:
+        """Returns the listing of a directory, scanning it again only if its stamp changed"""
+        dir_stamp = stamp(path)
+        if dir_stamp is None:
+            if self.dirs.pop(path, None): self.dirty = True
+            return None
+
+        listing = self.dirs.get(path)
+        if listing and listing['stamp'] == dir_stamp: return listing
+
+        listing = {'stamp': dir_stamp, 'files': [], 'subdirs': []}
+        with os.scandir(path) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False): listing['subdirs'].append(entry.name)
+                elif entry.name.endswith(TWEAK_EXTENSIONS): listing['files'].append(entry.name)
+
+        self.dirs[path] = listing
+        self.dirty = True
+        return listing
+
+    def index_folder(self, folder: Path | str) -> dict[str, Path]:
+        """Returns tweak names mapped to tweak files for a folder and its subdirectories"""
+        self.load()
+        folder = Path(folder)
+        tweaks: dict[str, Path] = {}
+
+        pending = [()]
+        while pending:
+            layer = pending.pop()
+            listing = self.list_dir(str(folder.joinpath(*layer)))
+            if not listing: continue
+
+            for file in listing['files']:
+                # fonts/font_tweak_A.json5 -> fonts.font_tweak_A
+                tweaks[f'{'.'.join(layer)}.{Path(file).stem}'] = folder.joinpath(*layer, file)
+
+            pending.extend((*layer, subdir) for subdir in listing['subdirs'])
+
+        return tweaks
+
+    def entry(self, name: str, path: Path) -> CatalogEntry:
+        """Returns the catalog entry of a tweak file, parsing it only if its stamp changed"""
+        self.load()
+        key = str(path)
+        file_stamp = stamp(path)
+
+        summary = self.files.get(key)
+        if not summary or summary['stamp'] != file_stamp:
+            summary = self.summarize(path)
+            summary['stamp'] = file_stamp
+            self.files[key] = summary
+            self.dirty = True
+
+        return CatalogEntry(name, path, summary['description'], summary['task_types'], summary['conditions'])
+
+    @staticmethod
+    def summarize(path: Path) -> dict:
+        import json5
+        try:
+            with open(path, 'r') as f:
+                obj: dict = json5.load(f)
+
+            return {
+                'description': obj['description'],
+                'task_types': [t.get('type') for t in obj['tasks']],
+                'conditions': obj.get('conditions', [])
+            }
+        except (ValueError, UnicodeDecodeError, KeyError, AttributeError, TypeError):
+            raise BadTweakError(str(path))
+
+    def save(self):
+        """Writes the catalog back if anything changed, dropping files no longer listed"""
+        if not self.dirty: return
+
+        listed = {os.path.join(d, f) for d, listing in self.dirs.items() for f in listing['files']}
+        self.files = {path: summary for path, summary in self.files.items() if path in listed}
+
+        save_cache(self.CACHE_NAME, {'dirs': self.dirs, 'files': self.files})
+        self.dirty = False
+
+catalog = TweakCatalog()
@@ -1,29 +1,33 @@
-from prefixer.coldpfx.regedit.models import RegistryNode, RegistryHive
+from prefixer.coldpfx.regedit.models import RegistryNode
 from prefixer.core.models import ConditionContext, RuntimeContext, required_context
-from prefixer.core.registry import condition
-from prefixer.coldpfx.regedit import parser
+from prefixer.core.registry import condition, uses
+from prefixer.core.ledger import LEDGER_FILE
 import os
 
 @condition
+@uses(lambda ctx, runtime: ([ctx.filename], []))
 @required_context('filename')
 def file_exists(ctx: ConditionContext, runtime: RuntimeContext):
     return os.path.exists(ctx.filename)
 
 @condition
+@uses(lambda ctx, runtime: ([ctx.value, ctx.matches], []))
 @required_context('filename', 'matches')
 def file_matches(ctx: ConditionContext, runtime: RuntimeContext):
     return os.path.samefile(ctx.value, ctx.matches)
 
 @condition
+@uses(lambda ctx, runtime: ([], []))
 @required_context('value', 'matches')
 def env_matches(ctx: ConditionContext, runtime: RuntimeContext):
     return os.environ[ctx.value] == ctx.matches
 
 @condition
+@uses(lambda ctx, runtime: ([os.path.join(runtime.pfx_path, ctx.filename)], []))
 @required_context('path', 'filename', 'values')
 def reg_matches(ctx: ConditionContext, runtime: RuntimeContext):
-    hive: RegistryHive = parser.parse_hive_file(os.path.join(runtime.pfx_path, ctx.filename))
-    node: RegistryNode = hive.nodes.get(ctx.path.replace('\\', '\\\\'), RegistryNode(ctx.path, 0, {}, False))
+    node_path = ctx.path.replace('\\', '\\\\')
+    node: RegistryNode = runtime.registry.node(ctx.filename, node_path) or RegistryNode(node_path, 0, {}, False)
 
     for k, v in ctx.values.items():
         if v == '!prefixer_none!': v = None
@@ -32,12 +36,7 @@ def reg_matches(ctx: ConditionContext, runtime: RuntimeContext):
     return True
 
 @condition
+@uses(lambda ctx, runtime: ([os.path.join(runtime.pfx_path, LEDGER_FILE)], []))
 @required_context('value')
 def tweak_ran(ctx: ConditionContext, runtime: RuntimeContext):
-    list_file = os.path.join(runtime.pfx_path, 'tweaks.prefixer.txt')
-    if not os.path.exists(list_file): return False
-
-    with open(list_file, 'r') as f:
-        lines = [line.strip() for line in f.readlines()]
-
-    return ctx.value in lines
+    return runtime.ledger.ran(ctx.value)
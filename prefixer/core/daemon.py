@@ -0,0 +1,234 @@
+"""
+Server side of `prefixer daemon`: keeps providers, the tweak catalog and heavy imports loaded, and runs each
+forwarded command in a child forked from that warm state, with the client's terminal as its stdin/stdout/stderr.
+"""
+from prefixer import client
+from prefixer.core.exceptions import PrefixerError
+from prefixer.core.settings import DAEMON_SOCKET
+from prefixer.core.cache import stamp
+from pathlib import Path
+from time import monotonic
+import ctypes.util
+import threading
+import selectors
+import importlib
+import ctypes
+import signal
+import socket
+import click
+import json
+import sys
+import os
+
+POLL_INTERVAL = 2.0
+SETTLE_TIME = 0.5
+"""Quiet time after a change before the daemon refreshes, Steam writes files in bursts"""
+
+# Variables read once at import time; a client with different ones runs in-process instead
+STATIC_ENV = ('HOME', 'XDG_CACHE_HOME', 'XDG_CONFIG_HOME', 'ALLOW_ROOT')
+
+# inotify(7) events that mean a watched folder changed
+IN_EVENTS = 0x2 | 0x4 | 0x8 | 0x40 | 0x80 | 0x100 | 0x200 | 0x400 | 0x800
+
+def static_env(env: dict[str, str]) -> dict[str, str]:
+    return {k: v for k, v in env.items() if k.startswith('PF_') or k in STATIC_ENV}
+
+class Watcher:
+    """Tells when any of a set of folders changed, through inotify or by polling their stamps where it's unavailable"""
+    def __init__(self, folders: list[Path]):
+        self.folders = [str(f) for f in folders if os.path.isdir(f)]
+        self.fd = None
+        self.stamps = None
+
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC) if hasattr(libc, 'inotify_init1') else -1
+        if fd < 0:
+            self.stamps = self.poll()
+            return
+
+        self.fd = fd
+        for folder in self.folders: libc.inotify_add_watch(fd, folder.encode(), IN_EVENTS)
+
+    def fileno(self) -> int | None:
+        return self.fd
+
+    def poll(self) -> dict[str, list[int] | None]:
+        stamps = {}
+        for folder in self.folders:
+            stamps[folder] = stamp(folder)
+            try:
+                with os.scandir(folder) as entries:
+                    for entry in entries: stamps[entry.path] = stamp(entry.path)
+            except OSError:
+                pass
+
+        return stamps
+
+    def changed(self) -> bool:
+        if self.fd is None:
+            stamps = self.poll()
+            changed, self.stamps = stamps != self.stamps, stamps
+            return changed
+
+        changed = False
+        while True:
+            try:
+                changed |= bool(os.read(self.fd, 65536))
+            except BlockingIOError:
+                return changed
+
+    def close(self):
+        if self.fd is not None: os.close(self.fd)
+
+class Daemon:
+    def __init__(self, path: str = DAEMON_SOCKET):
+        self.path = path
+        self.watcher: Watcher | None = None
+        self.env = static_env(os.environ)
+        self.running = True
+
+    def warm(self):
+        """Loads everything a command would, so forked children start with it"""
+        from prefixer import cli
+        from prefixer.core import tweaks
+        from prefixer.core.registry import task_registry, condition_registry
+
+        for module in ['requests', 'rapidfuzz.process', 'json5', 'vdf']: importlib.import_module(module)
+        task_registry.load()
+        condition_registry.load()
+
+        tweaks.get_catalog() # Also creates missing tweak folders, so they can be watched
+        folders = [Path(p) for root in tweaks.TWEAKS_PATHS for p, _, _ in os.walk(root)]
+
+        cli.warm_index = None
+        try:
+            cli.warm_index = cli.get_prefix_index()
+            for provider in cli.warm_index.providers:
+                if hasattr(provider, 'get_compat_index'): provider.get_compat_index()
+                folders += provider.watch_paths()
+        except PrefixerError as e: # No Steam yet, say; children will try on their own
+            click.secho(f'Could not index prefixes: {str(e) or type(e).__name__}', fg='bright_yellow', err=True)
+
+        if self.watcher: self.watcher.close()
+        self.watcher = Watcher(folders)
+
+    def socket_dir(self):
+        """Creates the socket's folder if needed, and refuses folders other users could swap the socket in"""
+        folder = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(folder, mode=0o700, exist_ok=True)
+
+        st = os.stat(folder)
+        if st.st_uid != os.getuid() or st.st_mode & 0o022:
+            raise click.ClickException(f'Refusing to listen in {folder}, it has to be owned by and only writable for this user; set PF_DAEMON_SOCKET')
+
+    def serve(self):
+        self.socket_dir()
+        self.warm()
+        if os.path.exists(self.path): os.remove(self.path)
+
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        old_umask = os.umask(0o177) # Only our user may connect
+        try:
+            server.bind(self.path)
+        finally:
+            os.umask(old_umask)
+        server.listen()
+        signal.signal(signal.SIGCHLD, signal.SIG_IGN) # Children are never waited for
+        click.secho(f'Listening on {self.path}', fg='bright_green', err=True)
+
+        selector = selectors.DefaultSelector()
+        selector.register(server, selectors.EVENT_READ)
+        changed_at = None
+
+        try:
+            while self.running:
+                watched = self.watcher.fileno()
+                if watched is not None: selector.register(watched, selectors.EVENT_READ)
+                timeout = SETTLE_TIME if changed_at else (None if watched is not None else POLL_INTERVAL)
+                events = selector.select(timeout=timeout)
+                if watched is not None: selector.unregister(watched)
+
+                if watched is None or any(key.fd == watched for key, _ in events):
+                    if self.watcher.changed(): changed_at = monotonic()
+
+                if any(key.fileobj is server for key, _ in events):
+                    conn, _ = server.accept()
+                    self.handle(conn, server)
+
+                if changed_at and monotonic() - changed_at >= SETTLE_TIME:
+                    changed_at = None
+                    self.warm()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.close()
+            if os.path.exists(self.path): os.remove(self.path)
+
+    def handle(self, conn: socket.socket, server: socket.socket):
+        fds = []
+        try:
+            if client.peer_uid(conn) != os.getuid(): return
+
+            data, fds, _, _ = socket.recv_fds(conn, 65536, 3)
+            while not data.endswith(b'\n'):
+                chunk = conn.recv(65536)
+                if not chunk: return
+                data += chunk
+
+            request = json.loads(data)
+            if request.get('stop'):
+                self.running = False
+                conn.sendall(b'{"exit": 0}\n')
+                return
+
+            if len(fds) != 3 or static_env(request['env']) != self.env:
+                conn.sendall(b'{"fallback": true}\n')
+                return
+
+            sys.stdout.flush()
+            sys.stderr.flush()
+            if os.fork() == 0:
+                server.close()
+                self.watcher.close()
+                run_request(conn, request, fds)
+        except (OSError, ValueError, KeyError):
+            pass
+        finally:
+            conn.close()
+            for fd in fds: os.close(fd)
+
+def run_request(conn: socket.socket, request: dict, fds: list[int]):
+    """Runs one forwarded command in a forked child and never returns"""
+    code = 1
+    try:
+        signal.signal(signal.SIGCHLD, signal.SIG_DFL) # subprocess has to wait for Wine
+        for target, fd in enumerate(fds): os.dup2(fd, target)
+        sys.stdout.reconfigure(line_buffering=os.isatty(1))
+        sys.stderr.reconfigure(line_buffering=True)
+
+        os.chdir(request['cwd'])
+        os.environ.clear()
+        os.environ.update(request['env'])
+        sys.argv = ['prefixer', *request['argv']]
+
+        def listen():
+            # The client forwards Ctrl+C; losing the client counts as one too
+            for line in conn.makefile('rb'):
+                if line.strip() == b'interrupt': break
+            os.kill(os.getpid(), signal.SIGINT)
+        threading.Thread(target=listen, daemon=True).start()
+
+        from prefixer import cli
+        try:
+            cli.main()
+        except SystemExit as e:
+            code = e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+        except KeyboardInterrupt:
+            code = 130
+    finally:
+        try:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            conn.sendall(json.dumps({'exit': code}).encode() + b'\n')
+        finally:
+            os._exit(code)
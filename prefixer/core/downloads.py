@@ -0,0 +1,230 @@
+from prefixer.core import paths
+from prefixer.core.exceptions import BadDownloadError
+from prefixer.core.profiling import profiled
+from prefixer.core.settings import CACHE_LIMIT, DOWNLOAD_WORKERS, DOWNLOAD_CHUNK_SIZE, NO_DOWNLOAD
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Callable
+import click
+import fcntl
+import hashlib
+import os
+import queue
+import shutil
+
+FICLONE = 0x40049409 # ioctl for reflinking a whole file, from linux/fs.h
+
+def store_dir() -> str:
+    """Content-addressed download store; files are named by their SHA-256"""
+    return os.path.join(paths.CACHE_DIR, 'downloads')
+
+def object_path(checksum: str) -> str:
+    checksum = checksum.lower()
+    return os.path.join(store_dir(), checksum[:2], checksum)
+
+def part_path(checksum: str) -> str:
+    """Where an unfinished download of an object lives"""
+    return os.path.join(store_dir(), 'partial', f'{checksum.lower()}.part')
+
+@contextmanager
+def locked(checksum: str):
+    """Holds an exclusive lock on fetching an object, so concurrent processes never write the same .part file"""
+    path = f'{part_path(checksum)}.lock'
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    with open(path, 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        yield
+
+def lookup(checksum: str) -> str | None:
+    """Returns the stored file with this checksum and marks it as recently used"""
+    path = object_path(checksum)
+    try:
+        os.utime(path)
+    except OSError:
+        return None
+
+    return path
+
+def add(path: str, checksum: str) -> str:
+    """Moves a verified file into the store, evicting old files if the store grows over its limit"""
+    target = object_path(checksum)
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    shutil.move(path, target)
+    os.chmod(target, 0o444) # Guards the store against accidental writes; objects only leave it as reflinks or copies
+
+    evict(CACHE_LIMIT, keep=target)
+    return target
+
+def link(source: str, dest: str):
+    """
+    Places a stored file at dest by reflink, falling back to a plain copy. Never by hardlink: the copy would share
+    the store object's read-only mode, and writing through it would corrupt the store.
+    """
+    if os.path.lexists(dest): os.remove(dest)
+
+    try:
+        with open(source, 'rb') as src, open(dest, 'wb') as dst:
+            fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+        return
+    except OSError:
+        if os.path.lexists(dest): os.remove(dest)
+
+    shutil.copyfile(source, dest)
+
+def sha256_file(path: str) -> str:
+    sha256_hash = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for byte_block in iter(lambda: f.read(DOWNLOAD_CHUNK_SIZE), b''):
+            sha256_hash.update(byte_block)
+
+    return sha256_hash.hexdigest()
+
+@profiled('download')
+def fetch(url: str, dest: str, on_size: Callable[[int], None] = None, on_progress: Callable[[int], None] = None) -> str:
+    """
+    Streams a URL into dest, reporting the expected size and every written chunk, and returns the file's SHA-256.
+    The hash is computed while streaming; if dest holds a partial download, it's resumed with a Range request.
+    """
+    import requests
+
+    sha256_hash = hashlib.sha256()
+    offset = 0
+    if os.path.exists(dest):
+        with open(dest, 'rb') as f:
+            for block in iter(lambda: f.read(DOWNLOAD_CHUNK_SIZE), b''):
+                sha256_hash.update(block)
+                offset += len(block)
+
+    headers = {
+        'User-Agent': 'Prefixer/1.3.2 (Linux)',
+        'Accept-Encoding': 'identity' # Range offsets have to be in bytes of the file itself
+    }
+    if offset: headers['Range'] = f'bytes={offset}-'
+
+    os.makedirs(os.path.dirname(dest), exist_ok=True)
+    with requests.get(url, stream=True, headers=headers, allow_redirects=True) as response:
+        if offset and response.status_code == 416: # Nothing left to fetch, let the checksum decide
+            if on_size: on_size(offset)
+            if on_progress: on_progress(offset)
+            return sha256_hash.hexdigest()
+
+        response.raise_for_status()
+
+        resumed = offset and response.status_code == 206 and response.headers.get('content-range', '').startswith(f'bytes {offset}-')
+        if not resumed:
+            sha256_hash = hashlib.sha256()
+            offset = 0
+
+        if on_size: on_size(int(response.headers.get('content-length', 0)) + offset)
+        if on_progress and offset: on_progress(offset)
+
+        with open(dest, 'ab' if resumed else 'wb') as f:
+            for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                f.write(chunk)
+                sha256_hash.update(chunk)
+                if on_progress: on_progress(len(chunk))
+
+    return sha256_hash.hexdigest()
+
+def remote_size(url: str) -> int | None:
+    """Asks the server how big a download is, None if it doesn't say"""
+    import requests
+
+    try:
+        response = requests.head(url, headers={'User-Agent': 'Prefixer/1.3.2 (Linux)', 'Accept-Encoding': 'identity'}, allow_redirects=True, timeout=10)
+        response.raise_for_status()
+    except requests.RequestException:
+        return None
+
+    size = response.headers.get('content-length')
+    return int(size) if size and size.isdigit() else None
+
+def fetch_with_progress(url: str, dest: str, filename: str) -> str:
+    """fetch with a progress bar"""
+    click.echo(f'Downloading {click.style(filename, 'bright_blue', bold=True)}')
+
+    with click.progressbar(length=0, label='Download Progress') as bar:
+        def on_size(size: int): bar.length = size
+        return fetch(url, dest, on_size, bar.update)
+
+def fetch_verified(url: str, checksum: str, on_size: Callable[[int], None] = None, on_progress: Callable[[int], None] = None) -> str:
+    """Fetches a URL straight into the store, raising BadDownloadError on checksum mismatch"""
+    part = part_path(checksum)
+
+    with locked(checksum):
+        stored = lookup(checksum) # Someone else might have fetched it while we waited
+        if stored: return stored
+        if NO_DOWNLOAD: raise BadDownloadError(url)
+
+        if fetch(url, part, on_size, on_progress) != checksum.lower():
+            os.remove(part)
+            raise BadDownloadError(url)
+
+        return add(part, checksum)
+
+@profiled('download')
+def prefetch(items: list[tuple[str, str]], workers: int = DOWNLOAD_WORKERS) -> dict[str, Exception]:
+    """
+    Concurrently fetches (url, checksum) pairs missing from the store, with one combined progress bar.
+    Failures are returned by URL instead of raised; the download task retries them on its own.
+    """
+    if NO_DOWNLOAD: return {} # The download tasks look for the files in ~/Downloads instead
+
+    missing = {checksum.lower(): url for url, checksum in items if not lookup(checksum)}
+    if not missing: return {}
+
+    events: queue.Queue[tuple[str, int]] = queue.Queue()
+    failures = {}
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            pool.submit(fetch_verified, url, checksum, lambda n: events.put(('size', n)), lambda n: events.put(('progress', n))): url
+            for checksum, url in missing.items()
+        }
+
+        with click.progressbar(length=0, label=f'Prefetching {len(missing)} downloads') as bar:
+            # click's progress bar isn't thread-safe, so only this thread touches it
+            while not all(f.done() for f in futures) or not events.empty():
+                try:
+                    kind, value = events.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+
+                if kind == 'size': bar.length += value
+                else: bar.update(value)
+
+    for future, url in futures.items():
+        if future.exception(): failures[url] = future.exception()
+
+    return failures
+
+def entries() -> list[tuple[str, int, float]]:
+    """Returns (checksum, size, last used) of every stored file, least recently used first"""
+    found = []
+    if not os.path.isdir(store_dir()): return found
+
+    for shard in os.scandir(store_dir()):
+        if not shard.is_dir() or len(shard.name) != 2: continue
+
+        for entry in os.scandir(shard.path):
+            st = entry.stat()
+            found.append((entry.name, st.st_size, st.st_mtime))
+
+    return sorted(found, key=lambda e: e[2])
+
+def evict(limit: int, keep: str | None = None) -> list[str]:
+    """Removes least recently used files until the store is at most limit bytes, returns removed checksums"""
+    stored = entries()
+    total = sum(size for _, size, _ in stored)
+    removed = []
+
+    for checksum, size, _ in stored:
+        if total <= limit: break
+        if object_path(checksum) == keep: continue
+
+        os.remove(object_path(checksum))
+        total -= size
+        removed.append(checksum)
+
+    return removed
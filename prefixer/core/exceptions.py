@@ -10,6 +10,14 @@ class NoTweakError(PrefixerError):
 class NoPrefixError(PrefixerError):
     pass
 
+class AmbiguousTargetError(NoPrefixError):
+    """A target matched several prefixes about equally well"""
+    def __init__(self, target: str, candidates: list[tuple[str, str, float]]):
+        super().__init__(target)
+        self.target = target
+        self.candidates = candidates
+        """(name, ID, score) of the best matches, best first"""
+
 class NoTaskError(PrefixerError):
     pass
 
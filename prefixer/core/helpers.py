@@ -2,7 +2,8 @@ import os
 from prefixer.core.models import RuntimeContext, TaskContext, ConditionContext
 import click
 from prefixer.core.registry import task_registry, condition_registry
-from prefixer.core.tweaks import Tweak
+from prefixer.core.tweaks import Tweak, tweak_version
+from time import perf_counter
 
 def setup_env(ctx: RuntimeContext):
     env = os.environ.copy()
@@ -11,55 +12,52 @@ def setup_env(ctx: RuntimeContext):
     env['STEAM_COMPAT_CLIENT_INSTALL_PATH'] = os.path.expanduser('~/.steam/steam')
     return env
 
-def add_tweak_to_file(file: str, tweak: str):
-    with open(file, 'a') as f:
-        f.write(tweak)
-        f.write('\n')
+# Tasks that start Wine, which reads and rewrites the registry hives itself
+PROCESS_TASKS = {'run_exe', 'wineserver', 'register_dll'}
 
-def run_tweak(runtime: RuntimeContext, target_tweak: Tweak, full_name: str='unknown'):
-    tasks = target_tweak.tasks
+def run_tweak(runtime: RuntimeContext, target_tweak: Tweak, full_name: str='unknown') -> bool:
+    """Runs a tweak and records it in the prefix, returns False if it was skipped"""
+    start = perf_counter()
+    with runtime.registry, runtime.prefix.session():
+        if not run_tasks(runtime, target_tweak): return False
 
-    tweak_conditions = target_tweak.conditions
-    for c in tweak_conditions:
+    mark_tweak_ran(runtime, full_name, perf_counter() - start)
+    return True
+
+def conditions_pass(conditions: list[ConditionContext], runtime: RuntimeContext) -> bool:
+    for c in conditions:
         c.resolve_paths(runtime)
 
         result = condition_registry[c.type](c, runtime)
         if c.invert: result = not result
 
-        if not result:
-            click.secho('Skipping tweak due to conditions')
-            return
+        if not result: return False
 
-    for task in tasks:
-        click.echo(f'{click.style('==>', bold=True)} {task.description} {click.style(task.type, fg='bright_black')}')
-        task_conditions = task.conditions
-        if not task_conditions: task_conditions = []
-        passing = True
-        for c in task_conditions:
-            if 'invert' not in c: c['invert'] = False
+    return True
 
-            built = ConditionContext(**c)
-            built.resolve_paths(runtime)
+def run_tasks(runtime: RuntimeContext, target_tweak: Tweak) -> bool:
+    """Runs the tasks of a tweak, returns False if the tweak was skipped"""
+    if not conditions_pass(target_tweak.conditions, runtime):
+        click.secho('Skipping tweak due to conditions')
+        return False
 
-            result = condition_registry[built.type](built, runtime)
-            if built.invert: result = not result
+    for task in target_tweak.tasks:
+        click.echo(f'{click.style('==>', bold=True)} {task.description} {click.style(task.type, fg='bright_black')}')
 
-            if not result:
-                click.secho('Skipping task due to conditions')
-                passing = False
+        if not conditions_pass(task.conditions or [], runtime):
+            click.secho('Skipping task due to conditions')
+            continue
 
-        if not passing: continue
         task.resolve_paths(runtime)
-        task_registry[task.type](ctx=task, runtime=runtime)
-
-    ran_tweak_file = os.path.join(runtime.pfx_path, 'tweaks.prefixer.txt')
 
-    if not os.path.exists(ran_tweak_file):
-        add_tweak_to_file(ran_tweak_file, full_name)
-        return
+        if task.type in PROCESS_TASKS:
+            runtime.registry.commit()
+            with runtime.process_lock():
+                task_registry[task.type](ctx=task, runtime=runtime)
+        else:
+            task_registry[task.type](ctx=task, runtime=runtime)
 
-    with open(ran_tweak_file, 'r') as f:
-        content = f.read()
-        if full_name in content: return
+    return True
 
-    add_tweak_to_file(ran_tweak_file, full_name)
\ No newline at end of file
+def mark_tweak_ran(runtime: RuntimeContext, full_name: str, duration: float = 0.0):
+    runtime.ledger.record(full_name, tweak_version(full_name), duration)
@@ -0,0 +1,139 @@
+from prefixer.core import paths
+from contextlib import contextmanager
+from dataclasses import dataclass, asdict
+from typing import Optional
+import threading
+import sqlite3
+import json
+import time
+import os
+
+LEDGER_FILE = 'tweaks.prefixer.jsonl'
+LEGACY_FILE = 'tweaks.prefixer.txt'
+INDEX_NAME = 'ledger.sqlite'
+
+@dataclass
+class LedgerEntry:
+    """One applied tweak"""
+    name: str
+    version: Optional[str]
+    """Hash of the tweak file it was applied from, None if unknown"""
+    time: float
+    duration: float
+
+class Ledger:
+    """
+    Tweaks applied to a prefix, kept as JSON lines in the prefix and mirrored into a central SQLite index.
+    The prefix file is the source of truth; the index only exists so fleets can be queried without opening every prefix.
+    """
+    def __init__(self, pfx_path: str):
+        self.pfx_path = str(pfx_path)
+        self.path = os.path.join(self.pfx_path, LEDGER_FILE)
+        self.entries: dict[str, LedgerEntry] = {}
+        self.loaded = False
+        self.migrated: list[LedgerEntry] = []
+        """Entries converted from the legacy list, written out on the next record()"""
+        self.lock = threading.Lock()
+
+    def load(self):
+        if self.loaded: return
+        self.loaded = True
+
+        if not os.path.exists(self.path):
+            self.migrate()
+            return
+
+        with open(self.path, 'r') as f:
+            for line in f:
+                try:
+                    entry = LedgerEntry(**json.loads(line))
+                except (ValueError, TypeError): # A line cut short by a crash
+                    continue
+                self.entries[entry.name] = entry
+
+    def migrate(self):
+        """Reads tweaks.prefixer.txt from older versions, which only listed names; nothing is written until record()"""
+        legacy = os.path.join(self.pfx_path, LEGACY_FILE)
+        if not os.path.exists(legacy): return
+
+        applied = os.path.getmtime(legacy)
+        with open(legacy, 'r') as f:
+            names = [line.strip() for line in f if line.strip()]
+
+        self.migrated = [LedgerEntry(name, None, applied, 0.0) for name in dict.fromkeys(names)]
+        self.entries = {entry.name: entry for entry in self.migrated}
+
+    def append(self, entry: LedgerEntry):
+        with open(self.path, 'a') as f:
+            f.write(json.dumps(asdict(entry)) + '\n')
+        self.entries[entry.name] = entry
+
+    def ran(self, name: str) -> bool:
+        self.load()
+        return name in self.entries
+
+    def get(self, name: str) -> Optional[LedgerEntry]:
+        self.load()
+        return self.entries.get(name)
+
+    def record(self, name: str, version: Optional[str] = None, duration: float = 0.0) -> LedgerEntry:
+        """Records a tweak as applied; applying it again adds a newer entry, the latest one counts"""
+        with self.lock:
+            self.load()
+            written, self.migrated = self.migrated, []
+            for migrated in written: self.append(migrated)
+
+            entry = LedgerEntry(name, version, time.time(), duration)
+            self.append(entry)
+
+        index_entries(self.pfx_path, [*written, entry])
+        return entry
+
+def index_path() -> str:
+    return os.path.join(paths.CACHE_DIR, INDEX_NAME)
+
+@contextmanager
+def connect():
+    """Opens the index in a transaction that's committed on success"""
+    os.makedirs(paths.CACHE_DIR, exist_ok=True)
+    db = sqlite3.connect(index_path(), timeout=30)
+    try:
+        db.execute('PRAGMA journal_mode=WAL') # Batch workers record into it concurrently
+        db.execute('CREATE TABLE IF NOT EXISTS applied (prefix TEXT, tweak TEXT, version TEXT, time REAL, duration REAL, PRIMARY KEY (prefix, tweak))')
+        db.execute('CREATE INDEX IF NOT EXISTS applied_tweak ON applied (tweak)')
+        with db: yield db
+    finally:
+        db.close()
+
+def index_entries(pfx_path: str, entries: list[LedgerEntry]):
+    """Mirrors ledger entries into the central index; it's only a cache, so failing to write it isn't fatal"""
+    if not entries: return
+
+    try:
+        with connect() as db:
+            db.executemany('INSERT OR REPLACE INTO applied VALUES (?, ?, ?, ?, ?)',
+                           [(pfx_path, e.name, e.version, e.time, e.duration) for e in entries])
+    except (sqlite3.Error, OSError):
+        pass
+
+def sync(pfx_paths: list[str]):
+    """Rebuilds the index entries of some prefixes from their ledgers, e.g. after they were changed elsewhere"""
+    ledgers = [Ledger(pfx_path) for pfx_path in pfx_paths]
+    for ledger in ledgers: ledger.load()
+
+    with connect() as db:
+        for ledger in ledgers:
+            db.execute('DELETE FROM applied WHERE prefix = ?', (ledger.pfx_path,))
+            db.executemany('INSERT INTO applied VALUES (?, ?, ?, ?, ?)',
+                           [(ledger.pfx_path, e.name, e.version, e.time, e.duration) for e in ledger.entries.values()])
+
+def prefixes_with(tweak: str) -> list[str]:
+    """Prefix paths that have a tweak applied, according to the index"""
+    with connect() as db:
+        return [row[0] for row in db.execute('SELECT prefix FROM applied WHERE tweak = ? ORDER BY prefix', (tweak,))]
+
+def applied_tweaks(pfx_path: str) -> list[LedgerEntry]:
+    """Tweaks applied to a prefix, according to the index"""
+    with connect() as db:
+        rows = db.execute('SELECT tweak, version, time, duration FROM applied WHERE prefix = ? ORDER BY time', (str(pfx_path),))
+        return [LedgerEntry(*row) for row in rows]
@@ -1,10 +1,15 @@
-from dataclasses import dataclass
-from functools import wraps
-from typing import Optional, List, Dict
+from contextlib import nullcontext
+from functools import cached_property
+from dataclasses import dataclass, field, fields
+from typing import Optional, List, Dict, Callable, ContextManager
 from prefixer.core.exceptions import MalformedTaskError
-from inspect import signature
 from prefixer.providers.classes import Prefix
+from prefixer.coldpfx.regedit.transaction import HiveTransaction
+from prefixer.core.ledger import Ledger
 import os
+import re
+
+PLACEHOLDERS = re.compile('<gamedir>|<pfxdir>|<tempdir>')
 
 @dataclass
 class RuntimeContext:
@@ -13,6 +18,22 @@ class RuntimeContext:
     """The Prefix"""
     operation_path: str
     """Temporary directory for performing operations"""
+    registry: HiveTransaction = field(init=False, repr=False)
+    """Registry hives of the prefix, shared by every task of a tweak run"""
+    process_lock: Callable[[], ContextManager] = field(default=nullcontext, repr=False)
+    """Held while a task runs Wine; batch runs use it to throttle tasks per Proton build"""
+    placeholders: dict[str, str] = field(init=False, repr=False)
+    """Values of the path placeholders, bound once for every task and condition of the run"""
+
+    def __post_init__(self):
+        self.registry = HiveTransaction(self.pfx_path, before_write=self.prefix.stop_server)
+        values = {'<gamedir>': self.game_path, '<pfxdir>': self.pfx_path, '<tempdir>': self.operation_path}
+        self.placeholders = {k: v for k, v in values.items() if v}
+
+    def substitute(self, text: Optional[str]) -> Optional[str]:
+        """Replaces path placeholders in a single pass"""
+        if not text or '<' not in text: return text
+        return PLACEHOLDERS.sub(lambda m: self.placeholders.get(m[0], m[0]), text)
 
     @property
     def pfx_path(self): return str(self.prefix.pfx_path)
@@ -20,7 +41,12 @@ class RuntimeContext:
     @property
     def game_path(self): return str(self.prefix.files_path)
 
-@dataclass
+    @cached_property
+    def ledger(self) -> Ledger:
+        """Tweaks applied to the prefix, loaded on first use"""
+        return Ledger(self.pfx_path)
+
+@dataclass(slots=True)
 class ConditionContext:
     """Condition that needs to pass before running tweak/task"""
     type: str
@@ -39,25 +65,10 @@ class ConditionContext:
     """List of values; depends on condition type"""
 
     def resolve_paths(self, runtime: RuntimeContext) -> None:
-        replacers = {
-            '<gamedir>': runtime.game_path,
-            '<pfxdir>': runtime.pfx_path,
-            '<tempdir>': runtime.operation_path,
-        }
-
-        def _apply_replacements(text: Optional[str]) -> Optional[str]:
-            if not text:
-                return text
+        self.value = runtime.substitute(self.value)
+        self.matches = runtime.substitute(self.matches)
 
-            for placeholder, value in replacers.items():
-                if value:
-                    text = text.replace(placeholder, value)
-            return text
-
-        self.value = _apply_replacements(self.value)
-        self.matches = _apply_replacements(self.matches)
-
-@dataclass
+@dataclass(slots=True)
 class TaskContext:
     """General config context for Prefixer tweak tasks"""
     description: str
@@ -65,7 +76,7 @@ class TaskContext:
     type: str
     """Type of this task; view core.tasks"""
     conditions: Optional[List[ConditionContext]] = None
-    """Conditions to run this task"""
+    """Conditions to run this task; raw dicts in tweak files, built into ConditionContext by build_tweak"""
     filename: Optional[str] = None
     """File name; depends on task type"""
     checksum: Optional[str] = None
@@ -90,26 +101,11 @@ class TaskContext:
     """Task-specific action; depends on task type"""
 
     def resolve_paths(self, runtime: RuntimeContext) -> None:
-        replacers = {
-            '<gamedir>': runtime.game_path,
-            '<pfxdir>': runtime.pfx_path,
-            '<tempdir>': runtime.operation_path,
-        }
+        self.filename = runtime.substitute(self.filename)
+        self.path = runtime.substitute(self.path)
+        self.new_path = runtime.substitute(self.new_path)
 
-        def _apply_replacements(text: Optional[str]) -> Optional[str]:
-            if not text:
-                return text
-
-            for placeholder, value in replacers.items():
-                if value:
-                    text = text.replace(placeholder, value)
-            return text
-
-        self.filename = _apply_replacements(self.filename)
-        self.path = _apply_replacements(self.path)
-        self.new_path = _apply_replacements(self.new_path)
-
-        if self.args: self.args = [_apply_replacements(arg) for arg in self.args]
+        if self.args: self.args = [runtime.substitute(arg) for arg in self.args]
 
 @dataclass
 class TaskData:
@@ -126,21 +122,22 @@ class TweakData:
     conditions: Optional[List[ConditionContext]]
     tasks: List[Dict[str, str]]
 
+IMPLICIT_FIELDS = {'type', 'description', 'invert', 'conditions'}
+"""Fields every task/condition may set"""
+
 def required_context(*keys: str):
-    """Checks if the passed context contains required keys"""
+    """Declares the fields a task or condition uses; tweaks are checked against them once when built, not on every call"""
     def decorator(func):
-        @wraps(func)
-        def wrapper(*args, **kwargs):
-            bound = signature(func).bind(*args, **kwargs)
-            bound.apply_defaults()
-            ctx = bound.arguments['ctx']
+        func.required = frozenset(keys)
+        return func
+    return decorator
 
-            missing = [k for k in keys if not getattr(ctx, k, None)]
-            extra   = [k for k, v in vars(ctx).items() if v and k not in keys and k not in {'type', 'description', 'invert', 'conditions'}]
+def validate_context(ctx: 'TaskContext | ConditionContext', keys: frozenset[str]):
+    """Raises MalformedTaskError if a context misses a field its type requires, or sets one it doesn't use"""
+    missing = [k for k in keys if not getattr(ctx, k, None)]
+    extra   = [f.name for f in fields(ctx) if getattr(ctx, f.name) and f.name not in keys and f.name not in IMPLICIT_FIELDS]
 
-            if len(missing) > 0: raise MalformedTaskError(f'Too little fields! Should contain {keys}')
-            if len(extra) > 0:   raise MalformedTaskError(f'Too many fields! Should contain {keys}')
+    name = getattr(ctx, 'description', ctx.type)
 
-            return func(*args, **kwargs)
-        return wrapper
-    return decorator
+    if len(missing) > 0: raise MalformedTaskError(f'Too little fields in "{name}"! Should contain {tuple(sorted(keys))}')
+    if len(extra) > 0:   raise MalformedTaskError(f'Too many fields in "{name}"! Should contain {tuple(sorted(keys))}')
@@ -1,6 +1,8 @@
 import os
 from importlib import resources
 
+CONFIG_DIR = os.path.join(os.environ.get('XDG_CONFIG_HOME') or os.path.expanduser('~/.config'), 'prefixer')
 TWEAKS_DIR_USER = os.path.expanduser('~/.config/prefixer/tweaks')
 TWEAKS_DIR_SYSTEM = os.path.expanduser('/usr/share/prefixer/tweaks')
 TWEAKS_DIR_PACKAGE = str(resources.files('prefixer').joinpath('data/tweaks'))
+CACHE_DIR = os.path.join(os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache'), 'prefixer')
@@ -0,0 +1,321 @@
+from prefixer.core import downloads
+from prefixer.core.exceptions import BadTweakError
+from prefixer.core.helpers import PROCESS_TASKS, conditions_pass, mark_tweak_ran
+from prefixer.core.ledger import LEDGER_FILE
+from prefixer.core.profiling import profiled
+from prefixer.core.models import RuntimeContext, TaskContext, ConditionContext
+from prefixer.core.registry import task_registry, condition_registry
+from prefixer.core.settings import PLAN_WORKERS, DOWNLOAD_WORKERS, NO_DOWNLOAD
+from prefixer.core.tweaks import Tweak, build_tweak
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from dataclasses import dataclass, field, replace
+from time import perf_counter
+from typing import Callable, Optional
+import heapq
+import click
+import os
+
+HIVES = ['system.reg', 'user.reg', 'userdef.reg']
+
+@dataclass(eq=False)
+class PlanNode:
+    """One step of a plan; a tweak's conditions (gate), one of its tasks, or recording it as ran (mark)"""
+    index: int
+    """Position in the order a serial run would use"""
+    kind: str
+    """gate, task or mark"""
+    tweak: str
+    gate: Optional['PlanNode']
+    """Gate that has to pass for this node to run; for gates, the gate of the including tweak"""
+    task: Optional[TaskContext] = None
+    conditions: list[ConditionContext] = field(default_factory=list)
+    description: str = ''
+    reads: set[str] = field(default_factory=set)
+    writes: set[str] = field(default_factory=set)
+    exclusive: bool = False
+    """Conflicts with everything, for nodes with undeclared resources"""
+    top_level: bool = False
+    deps: set['PlanNode'] = field(default_factory=set)
+    dependents: list['PlanNode'] = field(default_factory=list)
+    earlier: list['PlanNode'] = field(default_factory=list)
+    """For gates, the marks of earlier copies of the same tweak"""
+    state: str = 'pending'
+    """pending, then passed/skipped for gates and done/skipped for the rest; covered if an earlier copy of the tweak ran instead"""
+    started: float = 0.0
+    """When a gate was evaluated, marks record the time since their gate as the tweak's duration"""
+
+    def __lt__(self, other: 'PlanNode'): return self.index < other.index
+
+@dataclass
+class PlanEstimate:
+    """What running a previewed plan would cost"""
+    downloads: list[tuple[TaskContext, Optional[int], bool]]
+    """Download tasks with their size (None if unknown) and whether they're cached"""
+    hives: list[str]
+    """Hive files that would be rewritten"""
+    launches: int
+    """Proton/Wine process launches"""
+    tasks: int
+    skipped: int
+
+    @property
+    def download_bytes(self) -> int:
+        return sum(size or 0 for _, size, cached in self.downloads if not cached)
+
+def overlaps(a: str, b: str) -> bool:
+    """Same resource, or one path contains the other"""
+    if a == b: return True
+    if not os.path.isabs(a) or not os.path.isabs(b): return False
+
+    return a.startswith(b.rstrip(os.sep) + os.sep) or b.startswith(a.rstrip(os.sep) + os.sep)
+
+def conflicts(a: PlanNode, b: PlanNode) -> bool:
+    if a.exclusive or b.exclusive: return True
+
+    return any(overlaps(w, r) for w in a.writes for r in b.reads | b.writes) or \
+           any(overlaps(w, r) for w in b.writes for r in a.reads)
+
+def normalize(entries) -> set[str]:
+    return {os.path.normpath(e) if os.path.isabs(e) else e for e in entries if e}
+
+class Plan:
+    """
+    A tweak set expanded into a dependency graph: nested tweaks are inlined where they're included, and every node
+    depends on the earlier nodes it conflicts with, so anything independent can run concurrently.
+    A sub-tweak included several times gets a copy per include, gated by that include; like a serial run,
+    it runs at the first include whose gates pass, and later copies are covered by it.
+    """
+    def __init__(self, runtime: RuntimeContext, build: Callable[[str], Tweak] = build_tweak):
+        self.runtime = runtime
+        self.build = build
+        self.nodes: list[PlanNode] = []
+        self.marks: dict[str, list[PlanNode]] = {}
+        """Mark nodes of every copy of an expanded tweak, by name"""
+        self.expanding: set[str] = set()
+
+    def resources(self, node: PlanNode, handler, ctx):
+        declared = getattr(handler, 'resources', None)
+        if declared is None:
+            node.exclusive = True
+            return
+
+        reads, writes = declared(ctx, self.runtime)
+        node.reads |= normalize(reads)
+        node.writes |= normalize(writes)
+
+    def add(self, node: PlanNode, after: list[PlanNode] = ()) -> PlanNode:
+        for c in node.conditions:
+            self.resources(node, condition_registry[c.type], c)
+
+        node.deps.update(after)
+        if node.gate: node.deps.add(node.gate)
+        node.deps.update(n for n in self.nodes if conflicts(n, node))
+
+        for dep in node.deps: dep.dependents.append(node)
+        self.nodes.append(node)
+        return node
+
+    def node(self, kind: str, tweak: str, gate: Optional[PlanNode], **kwargs) -> PlanNode:
+        return PlanNode(len(self.nodes), kind, tweak, gate, **kwargs)
+
+    def expand(self, name: str, target: Tweak, parent_gate: Optional[PlanNode] = None, extra_conditions: list[ConditionContext] = (), top_level: bool = False) -> PlanNode:
+        """Adds a copy of a tweak to the graph, returns its mark node"""
+        if name in self.expanding: raise BadTweakError(f'{name} includes itself')
+        self.expanding.add(name)
+
+        conditions = [replace(c) for c in [*extra_conditions, *target.conditions]]
+        for c in conditions: c.resolve_paths(self.runtime)
+        earlier = list(self.marks.get(name, []))
+        gate = self.add(self.node('gate', name, parent_gate, conditions=conditions, description=target.description, top_level=top_level, earlier=earlier), earlier)
+
+        members = []
+        for task in target.tasks:
+            if task.type == 'tweak':
+                members.append(self.expand(task.name, self.build(task.name), gate, task.conditions or []))
+                continue
+
+            task_conditions = [replace(c) for c in task.conditions or []]
+            ctx = replace(task)
+            ctx.resolve_paths(self.runtime)
+            for c in task_conditions: c.resolve_paths(self.runtime)
+
+            node = self.node('task', name, gate, task=ctx, conditions=task_conditions, description=task.description)
+            self.resources(node, task_registry[task.type], ctx)
+            members.append(self.add(node))
+
+        mark = self.node('mark', name, gate, top_level=top_level, writes={os.path.join(self.runtime.pfx_path, LEDGER_FILE)})
+        if top_level: # Top-level tweaks commit the registry before being marked, like a serial run
+            mark.writes |= {os.path.join(self.runtime.pfx_path, hive) for hive in HIVES}
+        self.marks.setdefault(name, []).append(self.add(mark, members))
+
+        self.expanding.discard(name)
+        return mark
+
+    @classmethod
+    @profiled('planner')
+    def build_plan(cls, runtime: RuntimeContext, targets: list[tuple[str, Tweak]], build: Callable[[str], Tweak] = build_tweak) -> 'Plan':
+        plan = cls(runtime, build)
+        for name, target in targets:
+            plan.expand(name, target, top_level=True)
+
+        return plan
+
+    def gate_open(self, node: PlanNode) -> bool:
+        return node.gate is None or node.gate.state == 'passed'
+
+    def covered(self, gate: PlanNode) -> bool:
+        """Whether an earlier copy of the gate's tweak already ran"""
+        return any(mark.gate.state == 'passed' for mark in gate.earlier)
+
+    def run_node(self, node: PlanNode):
+        runtime = self.runtime
+
+        if not self.gate_open(node):
+            node.state = 'covered' if node.gate.state == 'covered' else 'skipped'
+            return
+
+        if node.kind == 'gate' and self.covered(node):
+            node.state = 'covered'
+
+        elif node.kind == 'gate':
+            node.started = perf_counter()
+            if node.top_level: click.echo(f'Target Tweak => {click.style(node.description)}')
+
+            node.state = 'passed' if conditions_pass(node.conditions, runtime) else 'skipped'
+            if node.state == 'skipped': click.secho(f'Skipping tweak {node.tweak} due to conditions')
+
+        elif node.kind == 'task':
+            task = node.task
+            click.echo(f'{click.style('==>', bold=True)} {task.description} {click.style(task.type, fg='bright_black')}')
+
+            if not conditions_pass(node.conditions, runtime):
+                click.secho('Skipping task due to conditions')
+                node.state = 'skipped'
+                return
+
+            if task.type in PROCESS_TASKS:
+                runtime.registry.commit()
+                with runtime.process_lock():
+                    task_registry[task.type](ctx=task, runtime=runtime)
+            else:
+                task_registry[task.type](ctx=task, runtime=runtime)
+
+            node.state = 'done'
+
+        else:
+            if node.top_level: runtime.registry.commit()
+            mark_tweak_ran(runtime, node.tweak, perf_counter() - node.gate.started)
+            node.state = 'done'
+
+    def depth(self, node: PlanNode) -> int:
+        """How deep a node is nested in included tweaks, 0 for the tasks of a requested tweak"""
+        depth, gate = 0, node.gate if node.kind != 'gate' else node
+        while gate and gate.gate:
+            depth, gate = depth + 1, gate.gate
+
+        return depth
+
+    def preview(self) -> list[PlanNode]:
+        """
+        Evaluates every condition in serial order without running anything, tasks end up planned or skipped.
+        Conditions see the prefix as it is now; ones that can't be evaluated yet count as passing.
+        """
+        for node in self.nodes:
+            if not self.gate_open(node):
+                node.state = 'covered' if node.gate.state == 'covered' else 'skipped'
+                continue
+
+            if node.kind == 'gate' and self.covered(node):
+                node.state = 'covered'
+                continue
+
+            try:
+                passed = conditions_pass([replace(c) for c in node.conditions], self.runtime)
+            except Exception:
+                passed = True
+
+            if node.kind == 'gate': node.state = 'passed' if passed else 'skipped'
+            else: node.state = 'planned' if passed else 'skipped'
+
+        return self.nodes
+
+    def downloads(self) -> list[TaskContext]:
+        """Download tasks the plan is going to run, judged by a preview; the plan can still be run afterwards"""
+        self.preview()
+        found = [n.task for n in self.nodes if n.kind == 'task' and n.state == 'planned' and n.task.type == 'download']
+        for node in self.nodes: node.state = 'pending'
+
+        return found
+
+    def estimate(self) -> PlanEstimate:
+        """Sums up the cost of a previewed plan; sizes of uncached downloads are asked from their servers, unless downloads are disabled"""
+        planned = [n for n in self.nodes if n.kind == 'task' and n.state == 'planned']
+
+        unique = {}
+        for node in planned:
+            if node.task.type == 'download' and node.task.checksum: unique.setdefault(node.task.checksum.lower(), node.task)
+
+        cached = {checksum for checksum in unique if os.path.exists(downloads.object_path(checksum))}
+        missing = [checksum for checksum in unique if checksum not in cached]
+        with ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS) as pool:
+            sizes = dict(zip(missing, pool.map(lambda c: None if NO_DOWNLOAD else downloads.remote_size(unique[c].url), missing)))
+        sizes |= {checksum: os.path.getsize(downloads.object_path(checksum)) for checksum in cached}
+
+        hive_paths = {os.path.normpath(os.path.join(self.runtime.pfx_path, hive)): hive for hive in HIVES}
+        hives = {hive_paths[w] for n in planned for w in n.writes if w in hive_paths}
+
+        return PlanEstimate(
+            downloads=[(task, sizes[checksum], checksum in cached) for checksum, task in unique.items()],
+            hives=sorted(hives),
+            launches=sum(n.task.type in PROCESS_TASKS for n in planned),
+            tasks=len(planned),
+            skipped=sum(n.kind == 'task' and n.state == 'skipped' for n in self.nodes)
+        )
+
+    def run(self, workers: int = PLAN_WORKERS) -> dict[str, bool]:
+        """Runs the plan, returns whether each top-level tweak ran; the first failure stops scheduling and is raised"""
+        remaining = {node: len(node.deps) for node in self.nodes}
+        ready = [node for node in self.nodes if not node.deps]
+        heapq.heapify(ready)
+        failure = None
+
+        with self.runtime.registry, self.runtime.prefix.session(), ThreadPoolExecutor(max_workers=max(workers, 1)) as pool:
+            running = {}
+            while ready or running:
+                while ready and failure is None and len(running) < max(workers, 1):
+                    node = heapq.heappop(ready)
+                    running[pool.submit(self.run_node, node)] = node
+
+                if not running: break
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+
+                for future in finished:
+                    node = running.pop(future)
+                    if future.exception():
+                        failure = failure or future.exception()
+                        continue
+
+                    for dependent in node.dependents:
+                        remaining[dependent] -= 1
+                        if not remaining[dependent]: heapq.heappush(ready, dependent)
+
+        if failure: raise failure
+
+        return {node.tweak: node.gate.state in ('passed', 'covered') for node in self.nodes if node.kind == 'mark' and node.top_level}
+
+def prefetch(plans: Plan | list[Plan]):
+    """
+    Downloads everything built plans (for one or more prefixes) need concurrently, so their download tasks resolve from the cache.
+    Taking built plans means every included tweak was built and validated before anything is downloaded.
+    """
+    if NO_DOWNLOAD: return
+
+    items = {}
+    for plan in plans if isinstance(plans, list) else [plans]:
+        for task in plan.downloads():
+            if task.url and task.checksum: items[task.checksum.lower()] = task.url
+
+    failures = downloads.prefetch([(url, checksum) for checksum, url in items.items()])
+
+    for url, e in failures.items():
+        click.secho(f'WARNING: Prefetching {url} failed, it will be retried by its task ({e})', fg='bright_yellow')
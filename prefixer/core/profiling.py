@@ -0,0 +1,178 @@
+from prefixer.core.settings import PROFILE
+from contextlib import contextmanager
+from dataclasses import dataclass, asdict
+from functools import wraps
+from time import perf_counter_ns
+from typing import Callable
+import threading
+import inspect
+import click
+import json
+import sys
+import os
+
+@dataclass(slots=True)
+class Span:
+    """One timed call; own_* values leave out the spans nested in it"""
+    phase: str
+    name: str
+    start: int
+    duration: int
+    own: int
+    read: int
+    written: int
+    subprocesses: int
+    thread: int
+
+def io_counters() -> tuple[int, int]:
+    """Bytes read and written by this process so far, including through pipes and sockets"""
+    try:
+        with open('/proc/self/io', 'r') as f:
+            fields = dict(line.split(': ') for line in f)
+    except (OSError, ValueError):
+        return 0, 0
+
+    return int(fields['rchar']), int(fields['wchar'])
+
+class Profiler:
+    """Collects timed spans of tasks, conditions, providers, tweak and hive parsing; does nothing until enabled"""
+    def __init__(self):
+        self.enabled = False
+        self.trace_path: str | None = None
+        self.spans: list[Span] = []
+        self.subprocesses = 0
+        self.origin = perf_counter_ns()
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.hooked = False
+
+    def enable(self, trace_path: str | None = None):
+        self.enabled = True
+        self.trace_path = trace_path or self.trace_path
+        self.origin = perf_counter_ns()
+
+        if not self.hooked:
+            sys.addaudithook(self.audit)
+            self.hooked = True
+
+        # coldpfx doesn't know about Prefixer, so its functions are only wrapped once profiling is on
+        from prefixer.coldpfx.regedit import parser, writer
+        self.instrument(parser, ['parse_hive', 'parse_hive_file', 'read_node'], 'regedit')
+        self.instrument(writer, ['serialize', 'write_to_file', 'patch_file'], 'regedit')
+
+    def audit(self, event: str, args: tuple):
+        if event == 'subprocess.Popen' and self.enabled: self.subprocesses += 1
+
+    @contextmanager
+    def span(self, phase: str, name: str):
+        if not self.enabled:
+            yield
+            return
+
+        stack = self.local.__dict__.setdefault('stack', [])
+        read, written = io_counters()
+        subprocesses = self.subprocesses
+        stack.append([0, 0, 0, 0]) # Time, read, written and subprocesses of nested spans
+        start = perf_counter_ns()
+
+        try:
+            yield
+        finally:
+            totals = [perf_counter_ns() - start, *(now - before for now, before in zip(io_counters(), (read, written))), self.subprocesses - subprocesses]
+            nested = stack.pop()
+            if stack: stack[-1] = [a + b for a, b in zip(stack[-1], totals)]
+
+            own = [a - b for a, b in zip(totals, nested)]
+            with self.lock:
+                self.spans.append(Span(phase, name, start - self.origin, totals[0], *own, threading.get_ident()))
+
+    def wrap(self, phase: str, name: str, func: Callable) -> Callable:
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if not self.enabled: return func(*args, **kwargs)
+
+            with self.span(phase, name):
+                return func(*args, **kwargs)
+
+        wrapper.profiled = True
+        return wrapper
+
+    def instrument(self, owner, names: list[str], phase: str):
+        """Replaces functions of a module with timed ones"""
+        for name in names:
+            func = getattr(owner, name)
+            if not getattr(func, 'profiled', False): setattr(owner, name, self.wrap(phase, name, func))
+
+    def instrument_class(self, cls: type, phase: str):
+        """Times every public method defined by a class"""
+        for name, func in list(vars(cls).items()):
+            if not name.startswith('_') and inspect.isfunction(func):
+                setattr(cls, name, self.wrap(phase, f'{cls.__name__}.{name}', func))
+
+    def phases(self) -> dict[str, dict[str, int]]:
+        summary = {}
+        for span in self.spans:
+            phase = summary.setdefault(span.phase, {'calls': 0, 'time_ns': 0, 'read': 0, 'written': 0, 'subprocesses': 0})
+            phase['calls'] += 1
+            phase['time_ns'] += span.own
+            phase['read'] += span.read
+            phase['written'] += span.written
+            phase['subprocesses'] += span.subprocesses
+
+        return dict(sorted(summary.items(), key=lambda p: -p[1]['time_ns']))
+
+    def write_trace(self, path: str):
+        """Writes the spans in Chrome's trace event format (chrome://tracing, Perfetto) with the phase summary"""
+        from importlib.metadata import version
+
+        events = [{
+            'name': span.name, 'cat': span.phase, 'ph': 'X', 'pid': os.getpid(), 'tid': span.thread,
+            'ts': span.start / 1000, 'dur': span.duration / 1000,
+            'args': {'own_us': span.own / 1000, 'read': span.read, 'written': span.written, 'subprocesses': span.subprocesses}
+        } for span in self.spans]
+
+        with open(path, 'w') as f:
+            json.dump({
+                'traceEvents': events,
+                'otherData': {'version': version('prefixer'), 'argv': sys.argv[1:], 'wall_ns': perf_counter_ns() - self.origin},
+                'phases': self.phases()
+            }, f, indent=1)
+
+    def print_table(self):
+        def ms(ns: int) -> str: return f'{ns / 1e6:.1f} ms'
+        def kib(n: int) -> str: return f'{n / 1024:.0f} KiB'
+
+        rows = [(phase, str(p['calls']), ms(p['time_ns']), kib(p['read']), kib(p['written']), str(p['subprocesses'])) for phase, p in self.phases().items()]
+        rows.insert(0, ('Phase', 'Calls', 'Time', 'Read', 'Written', 'Processes'))
+        widths = [max(len(row[i]) for row in rows) for i in range(len(rows[0]))]
+
+        click.secho('Profile (time excludes nested phases)', fg='bright_blue', err=True)
+        for i, row in enumerate(rows):
+            line = '  '.join(cell.ljust(width) if not c else cell.rjust(width) for c, (cell, width) in enumerate(zip(row, widths)))
+            click.secho(line, bold=not i, err=True)
+
+        slowest = sorted(self.spans, key=lambda s: -s.own)[:10]
+        click.secho('Slowest calls', fg='bright_blue', err=True)
+        for span in slowest:
+            click.echo(f'{ms(span.own):>10}  {span.phase}: {span.name}', err=True)
+
+        click.echo(f'Total => {ms(perf_counter_ns() - self.origin)}', err=True)
+
+    def finish(self):
+        if not self.enabled: return
+
+        self.print_table()
+        if self.trace_path:
+            self.write_trace(self.trace_path)
+            click.echo(f'Trace => {self.trace_path}', err=True)
+
+profiler = Profiler()
+
+def profiled(phase: str, name: str | None = None):
+    """Times calls of a function while profiling is enabled"""
+    def decorator(func: Callable) -> Callable:
+        return profiler.wrap(phase, name or func.__name__, func)
+    return decorator
+
+if PROFILE.lower() not in ['', '0', 'false']:
+    profiler.enable(None if PROFILE.lower() in ['1', 'true'] else PROFILE)
@@ -0,0 +1,187 @@
+"""
+Fleet registry index: the values of every prefix's user.reg and system.reg in one SQLite database,
+so questions like "which prefixes override d3d9" are one indexed query instead of parsing every hive.
+Hives are only parsed again when their stamp changed since the last refresh.
+"""
+from prefixer.coldpfx.regedit import parser
+from prefixer.core import paths
+from prefixer.core.cache import stamp
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+import multiprocessing
+import sqlite3
+import re
+import os
+
+INDEX_NAME = 'registry.sqlite'
+HIVES = ['user.reg', 'system.reg']
+ESCAPE = re.compile(r'\\(.)')
+
+@dataclass
+class IndexedPrefix:
+    id: str
+    name: str
+    pfx_path: str
+
+@dataclass
+class RefreshResult:
+    parsed: int = 0
+    unchanged: int = 0
+    """Hives whose stamp matched the index"""
+    removed: int = 0
+    """Hives that no longer exist, or whose prefix doesn't"""
+    failed: dict[str, str] = field(default_factory=dict)
+    """Hive paths mapped to why they couldn't be parsed"""
+
+@dataclass
+class RegistryMatch:
+    id: str
+    name: str
+    pfx_path: str
+    hive: str
+    key: str
+    value_name: str
+    value: str
+
+def index_path() -> str:
+    return os.path.join(paths.CACHE_DIR, INDEX_NAME)
+
+@contextmanager
+def connect():
+    """Opens the index in a transaction that's committed on success"""
+    os.makedirs(paths.CACHE_DIR, exist_ok=True)
+    db = sqlite3.connect(index_path(), timeout=30)
+    try:
+        db.execute('PRAGMA journal_mode=WAL')
+        db.execute('CREATE TABLE IF NOT EXISTS prefixes (path TEXT PRIMARY KEY, id TEXT, name TEXT)')
+        db.execute('CREATE TABLE IF NOT EXISTS hives (id INTEGER PRIMARY KEY, prefix TEXT, hive TEXT, mtime_ns INTEGER, size INTEGER, UNIQUE (prefix, hive))')
+        db.execute('CREATE TABLE IF NOT EXISTS entries (hive INTEGER, key TEXT COLLATE NOCASE, name TEXT COLLATE NOCASE, value TEXT)')
+        db.execute('CREATE INDEX IF NOT EXISTS entries_key ON entries (key, name)')
+        db.execute('CREATE INDEX IF NOT EXISTS entries_hive ON entries (hive)')
+        with db: yield db
+    finally:
+        db.close()
+
+def normalize_key(key: str) -> str:
+    """Key path with single backslashes, however it was written"""
+    return key.replace('\\\\', '\\').strip('\\')
+
+def decode_value(raw: str) -> str:
+    """String values without their quotes and escapes; other types (dword:, hex:, str(2):) stay as written"""
+    if len(raw) >= 2 and raw.startswith('"') and raw.endswith('"'): return ESCAPE.sub(r'\1', raw[1:-1])
+    return raw
+
+def read_rows(path: str) -> list[tuple[str, str, str]]:
+    """(key, value name, value) rows of a hive file; runs in worker processes"""
+    with open(path, 'rb') as f:
+        lines = parser.HiveLines(f)
+        next(lines, None)
+        next(lines, None)
+
+        return [(normalize_key(node.path), name, decode_value(value))
+                for node in parser.iter_nodes(lines) for name, value in node.values.items()]
+
+def like_pattern(pattern: str) -> str:
+    """Turns a glob pattern into a LIKE pattern, escaping what LIKE would treat as wildcards"""
+    special = {'*': '%', '?': '_', '%': '\\%', '_': '\\_', '\\': '\\\\'}
+    return ''.join(special.get(c, c) for c in pattern)
+
+def parse_hives(changed: list[tuple[str, str, list[int]]], jobs: int):
+    """Yields each (prefix path, hive, stamp) with its rows, or the exception parsing it raised"""
+    if len(changed) <= 1 or jobs <= 1: # Not worth starting workers for
+        for item in changed:
+            try:
+                yield item, read_rows(os.path.join(item[0], item[1]))
+            except (OSError, ValueError) as e:
+                yield item, e
+        return
+
+    # Stamps are taken before parsing, so a hive written meanwhile is parsed again next time
+    context = multiprocessing.get_context('fork')
+    with ProcessPoolExecutor(max_workers=min(jobs, len(changed)), mp_context=context) as pool:
+        futures = {pool.submit(read_rows, os.path.join(pfx_path, hive)): (pfx_path, hive, hive_stamp) for pfx_path, hive, hive_stamp in changed}
+
+        for future in as_completed(futures):
+            try:
+                yield futures[future], future.result()
+            except Exception as e: # Unreadable hive, or the worker itself died
+                yield futures[future], e
+
+def refresh(prefixes: list[IndexedPrefix], jobs: int = os.cpu_count(), prune: bool = True) -> RefreshResult:
+    """
+    Brings the index up to date with the hives of some prefixes, parsing changed ones in worker processes.
+    With prune, prefixes that aren't given are dropped from the index.
+    """
+    result = RefreshResult()
+    known_paths = {str(p.pfx_path) for p in prefixes}
+
+    with connect() as db:
+        known = {(prefix, hive): (id, [mtime_ns, size]) for id, prefix, hive, mtime_ns, size in db.execute('SELECT * FROM hives')}
+        db.executemany('INSERT OR REPLACE INTO prefixes VALUES (?, ?, ?)', [(str(p.pfx_path), p.id, p.name) for p in prefixes])
+
+        stale = [id for (prefix, _), (id, _) in known.items() if prune and prefix not in known_paths]
+        if prune: db.execute(f'DELETE FROM prefixes WHERE path NOT IN ({', '.join('?' * len(known_paths))})', list(known_paths))
+
+    changed = []
+    for pfx_path in known_paths:
+        for hive in HIVES:
+            hive_stamp = stamp(os.path.join(pfx_path, hive))
+            indexed = known.get((pfx_path, hive))
+
+            if hive_stamp is None:
+                if indexed: stale.append(indexed[0])
+            elif indexed and indexed[1] == hive_stamp:
+                result.unchanged += 1
+            else:
+                changed.append((pfx_path, hive, hive_stamp))
+
+    with connect() as db:
+        for id in stale:
+            db.execute('DELETE FROM entries WHERE hive = ?', (id,))
+            db.execute('DELETE FROM hives WHERE id = ?', (id,))
+        result.removed = len(stale)
+        db.commit()
+
+        for (pfx_path, hive, hive_stamp), rows in parse_hives(changed, jobs):
+            if isinstance(rows, Exception):
+                result.failed[os.path.join(pfx_path, hive)] = f'{type(rows).__name__}: {rows}'
+                continue
+
+            id = db.execute('INSERT INTO hives (prefix, hive, mtime_ns, size) VALUES (?, ?, ?, ?) '
+                            'ON CONFLICT (prefix, hive) DO UPDATE SET mtime_ns = excluded.mtime_ns, size = excluded.size RETURNING id',
+                            (pfx_path, hive, *hive_stamp)).fetchone()[0]
+            db.execute('DELETE FROM entries WHERE hive = ?', (id,))
+            db.executemany('INSERT INTO entries VALUES (?, ?, ?, ?)', [(id, *row) for row in rows])
+            db.commit() # Per hive, so an interrupted refresh keeps what it did
+            result.parsed += 1
+
+    return result
+
+def query(key: str, name: str | None = None, value: str | None = None) -> list[RegistryMatch]:
+    """
+    Values of a key across every indexed prefix; key and name are matched case-insensitively,
+    value as a case-insensitive glob pattern against the decoded value
+    """
+    sql = ('SELECT p.id, p.name, h.prefix, h.hive, e.key, e.name, e.value FROM entries e '
+           'JOIN hives h ON h.id = e.hive JOIN prefixes p ON p.path = h.prefix WHERE e.key = ?')
+    args = [normalize_key(key)]
+
+    if name is not None:
+        sql += ' AND e.name = ?'
+        args.append(name)
+    if value is not None:
+        sql += " AND e.value LIKE ? ESCAPE '\\'"
+        args.append(like_pattern(value))
+
+    with connect() as db:
+        return [RegistryMatch(*row) for row in db.execute(sql + ' ORDER BY p.name COLLATE NOCASE, e.name', args)]
+
+def summary() -> dict[str, int]:
+    """Counts of what's in the index"""
+    with connect() as db:
+        return {
+            'prefixes': db.execute('SELECT COUNT(DISTINCT prefix) FROM hives').fetchone()[0],
+            'hives': db.execute('SELECT COUNT(*) FROM hives').fetchone()[0],
+            'values': db.execute('SELECT COUNT(*) FROM entries').fetchone()[0],
+        }
@@ -1,14 +1,78 @@
+from prefixer.core.profiling import profiler
 from typing import Callable
+import importlib
 
-task_registry = {}
-condition_registry = {}
+class LazyRegistry(dict):
+    """Registry that imports the module defining its entries on first lookup"""
+    def __init__(self, module: str):
+        super().__init__()
+        self.module = module
+        self.loaded = False
+
+    def load(self):
+        if self.loaded: return
+        self.loaded = True # set first, the imported module registers into us
+
+        try:
+            importlib.import_module(self.module)
+        except BaseException:
+            self.loaded = False
+            raise
+
+    def __getitem__(self, key):
+        self.load()
+        return super().__getitem__(key)
+
+    def __contains__(self, key):
+        self.load()
+        return super().__contains__(key)
+
+    def __iter__(self):
+        self.load()
+        return super().__iter__()
+
+    def __len__(self):
+        self.load()
+        return super().__len__()
+
+    def get(self, key, default=None):
+        self.load()
+        return super().get(key, default)
+
+    def keys(self):
+        self.load()
+        return super().keys()
+
+    def values(self):
+        self.load()
+        return super().values()
+
+    def items(self):
+        self.load()
+        return super().items()
+
+task_registry = LazyRegistry('prefixer.core.tasks')
+condition_registry = LazyRegistry('prefixer.core.conditions')
 
 def task(func: Callable):
     """Registers a function as a task"""
+    func = profiler.wrap('task', func.__name__, func)
     task_registry[func.__name__] = func
     return func
 
 def condition(func: Callable):
     """Registers a function as a condition"""
+    func = profiler.wrap('condition', func.__name__, func)
     condition_registry[func.__name__] = func
     return func
+
+def uses(resolver: Callable):
+    """
+    Declares what a task or condition touches, as resolver(ctx, runtime) -> (reads, writes).
+    Entries are absolute paths (a path covers everything under it) or plain resource names like 'console'.
+    The planner runs anything without a declaration on its own.
+    """
+    def decorator(func: Callable):
+        func.resources = resolver
+        return func
+    return decorator
@@ -0,0 +1,61 @@
+from prefixer.core import paths
+from prefixer.core.cache import load_cache, save_cache
+import json
+import os
+import re
+
+RECENT_LIMIT = 50
+AMBIGUITY_MARGIN = 5.0
+"""Fuzzy matches scoring within this of the best one are too close to pick between"""
+
+def normalize(text: str) -> str:
+    """Lowercase words without punctuation, the form names are stored and matched in"""
+    return ' '.join(re.sub(r'[^\w]+', ' ', text.lower()).split())
+
+def rank(query: str, choices: list[str], limit: int = 5, score_cutoff: float = 50) -> list[tuple[str, float, int]]:
+    """Scores already normalized choices in one batched rapidfuzz call, best first"""
+    from rapidfuzz import process, fuzz
+    return process.extract(normalize(query), choices, scorer=fuzz.WRatio, processor=None, limit=limit, score_cutoff=score_cutoff)
+
+def aliases_path() -> str:
+    return os.path.join(paths.CONFIG_DIR, 'aliases.json')
+
+def load_aliases() -> dict[str, str]:
+    """User-defined aliases mapped to the ID or name they stand for"""
+    try:
+        with open(aliases_path(), 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_aliases(aliases: dict[str, str]):
+    os.makedirs(paths.CONFIG_DIR, exist_ok=True)
+    with open(aliases_path(), 'w') as f:
+        json.dump(dict(sorted(aliases.items())), f, indent=2)
+
+class RecentTargets:
+    """Most recently used targets, mapping what was typed to the ID it resolved to"""
+    CACHE_NAME = 'recent_targets.json'
+
+    def __init__(self):
+        self.entries: dict[str, str] | None = None
+
+    def load(self) -> dict[str, str]:
+        if self.entries is None: self.entries = load_cache(self.CACHE_NAME).get('targets', {})
+        return self.entries
+
+    def get(self, query: str) -> str | None:
+        return self.load().get(normalize(query))
+
+    def add(self, query: str, id: str):
+        entries = self.load()
+        key = normalize(query)
+        if next(iter(entries), None) == key and entries[key] == id: return
+
+        entries.pop(key, None)
+        self.entries = dict(list({key: id, **entries}.items())[:RECENT_LIMIT])
+        save_cache(self.CACHE_NAME, {'targets': self.entries})
+
+    def ids(self) -> list[str]:
+        """Recently used IDs, most recent first"""
+        return list(dict.fromkeys(self.load().values()))
@@ -3,3 +3,14 @@ import os
 NO_DOWNLOAD = os.environ.get('PF_NO_DOWNLOAD', 'false') == 'true'
 SILENCE_EXTERNAL = os.environ.get('PF_SILENCE_EXTERNAL', 'false') == 'true'
 ALLOW_SHELL = os.environ.get('PF_ALLOW_SHELL', 'false') == 'true'
+CACHE_LIMIT = int(os.environ.get('PF_CACHE_LIMIT_MB', '10240')) * 1024 * 1024
+DOWNLOAD_WORKERS = int(os.environ.get('PF_DOWNLOAD_WORKERS', '4'))
+DOWNLOAD_CHUNK_SIZE = int(os.environ.get('PF_DOWNLOAD_CHUNK_KB', '1024')) * 1024
+PROTON_SLOTS = int(os.environ.get('PF_PROTON_SLOTS', '1'))
+EXTRACT_WORKERS = int(os.environ.get('PF_EXTRACT_WORKERS', str(min(os.cpu_count() or 1, 8))))
+PLAN_WORKERS = int(os.environ.get('PF_PLAN_WORKERS', '4'))
+PROFILE = os.environ.get('PF_PROFILE', '')
+NO_DAEMON = os.environ.get('PF_NO_DAEMON', 'false') == 'true'
+# Without XDG_RUNTIME_DIR, the socket goes in a private folder the daemon creates, never straight in the shared /tmp
+DAEMON_SOCKET = os.environ.get('PF_DAEMON_SOCKET') or (os.path.join(os.environ['XDG_RUNTIME_DIR'], 'prefixer.sock') if os.environ.get('XDG_RUNTIME_DIR')
+                                                      else os.path.join('/tmp', f'prefixer-{os.getuid()}', 'daemon.sock'))
@@ -1,76 +1,59 @@
 from pathlib import Path
 from prefixer.core.helpers import run_tweak
 from prefixer.core.models import TaskContext, RuntimeContext, required_context
-from prefixer.core.registry import task
+from prefixer.core.registry import task, uses
 from prefixer.core.settings import NO_DOWNLOAD
-from prefixer.core.exceptions import BadFileError, BadDownloadError, MalformedTaskError
+from prefixer.core.exceptions import BadDownloadError, MalformedTaskError
 from prefixer.core.tweaks import build_tweak
-from prefixer.coldpfx.regedit import parser, writer
-from prefixer.coldpfx.regedit.models import RegistryNode
+from prefixer.core import downloads, archives
 import click
 import subprocess
-import zipfile
 import shutil
-import hashlib
 import os.path
-import requests
 
 @task
+@uses(lambda ctx, runtime: ([], [os.path.join(runtime.operation_path, ctx.filename), 'network']))
 @required_context('filename', 'url', 'checksum')
 def download(ctx: TaskContext, runtime: RuntimeContext):
-    if NO_DOWNLOAD:
-        if os.path.exists(os.path.expanduser(f'~/Downloads/{ctx.filename}')):
-            ctx.filename = os.path.expanduser(f'~/Downloads/{ctx.filename}')
-        else:
-            raise BadDownloadError
+    dest = os.path.join(runtime.operation_path, ctx.filename)
 
-    else:
-        try:
-            headers = {
-                'User-Agent': 'Prefixer/1.3.2 (Linux)'
-            }
+    with downloads.locked(ctx.checksum): # Batch runs download in many processes at once
+        cached = downloads.lookup(ctx.checksum)
+        if cached:
+            click.echo(f'Using cached {click.style(ctx.filename, 'bright_blue', bold=True)}')
+            downloads.link(cached, dest)
+            return
 
-            with requests.get(ctx.url, stream=True, headers=headers, allow_redirects=True) as response:
-                response.raise_for_status()
+        if NO_DOWNLOAD:
+            if os.path.exists(os.path.expanduser(f'~/Downloads/{ctx.filename}')):
+                ctx.filename = os.path.expanduser(f'~/Downloads/{ctx.filename}')
+            else:
+                raise BadDownloadError
 
-                total_size = int(response.headers.get('content-length', 0))
-                click.echo(f'Downloading {click.style(ctx.filename, 'bright_blue', bold=True)}')
-
-                with click.progressbar(
-                    iterable=response.iter_content(chunk_size=8192),
-                    length=total_size,
-                    label='Download Progress'
-                ) as bar:
-                    with open(os.path.join(runtime.operation_path, ctx.filename), 'wb') as f:
-                        for chunk in bar:
-                            f.write(chunk)
+            return
 
+        part = downloads.part_path(ctx.checksum)
+        try:
+            calc_checksum = downloads.fetch_with_progress(ctx.url, part, ctx.filename)
         except Exception as e:
             click.echo('ERROR: Unable to download file')
             click.echo(f'Exception triggered: {e}')
+            raise BadDownloadError
 
-        click.echo('Verifying checksum...')
-        sha256_hash = hashlib.sha256()
+        if calc_checksum != ctx.checksum.lower():
+            click.secho(f'WARNING: Checksum mismatch!', fg='bright_red')
+            click.secho(f'Expected: {ctx.checksum}', fg='red')
+            click.secho(f'Got:      {calc_checksum}', fg='red')
 
-        try:
-            with open(os.path.join(runtime.operation_path, ctx.filename), "rb") as f:
-                for byte_block in iter(lambda: f.read(4096), b""):
-                    sha256_hash.update(byte_block)
-
-            calc_checksum = sha256_hash.hexdigest()
-
-            if calc_checksum != ctx.checksum:
-                click.secho(f'WARNING: Checksum mismatch!', fg='bright_red')
-                click.secho(f'Expected: {ctx.checksum}', fg='red')
-                click.secho(f'Got:      {calc_checksum}', fg='red')
-
-                if not click.confirm('Do you want to keep this file?', default=False):
-                    os.remove(ctx.filename)
-                    raise BadDownloadError
-                else:
-                    click.secho('Keeping unverified file at user request.', fg='yellow')
-        except FileNotFoundError:
-            raise BadDownloadError
+            if not click.confirm('Do you want to keep this file?', default=False):
+                os.remove(part)
+                raise BadDownloadError
+
+            click.secho('Keeping unverified file at user request.', fg='yellow')
+            shutil.move(part, dest) # Never store unverified files
+            return
+
+        downloads.link(downloads.add(part, ctx.checksum), dest)
 
 @task
 @required_context('path', 'args')
@@ -79,43 +62,30 @@ def run_exe(ctx: TaskContext, runtime: RuntimeContext):
     runtime.prefix.run(Path(ctx.path), ctx.args)
 
 @task
+@uses(lambda ctx, runtime: ([], [os.path.join(runtime.pfx_path, ctx.filename or 'user.reg')]))
 @required_context('values', 'path', 'filename')
 def regedit(ctx: TaskContext, runtime: RuntimeContext):
     target_file = ctx.filename if ctx.filename else 'user.reg'
-    reg_path = os.path.join(runtime.pfx_path, target_file)
-
-    hive = parser.parse_hive_file(reg_path)
-
     node_path = ctx.path.replace('\\', '\\\\')
 
-    if node_path not in hive.nodes:
-        hive.nodes[node_path] = RegistryNode(node_path, 0, {})
-
-    node = hive.nodes[node_path]
-
     for key, value in ctx.values.items():
-        if isinstance(value, str) and not value.startswith(('hex:', 'dword:')): node.set(key, f'"{value}"')
-        else: node.set(key, value)
-
-    shutil.copy(reg_path, os.path.join(runtime.pfx_path, f'{target_file}.bak'))
-    writer.write_to_file(hive, reg_path)
+        if isinstance(value, str) and not value.startswith(('hex:', 'dword:')): value = f'"{value}"'
+        runtime.registry.set(target_file, node_path, key, value)
 
 @task
+@uses(lambda ctx, runtime: ([os.path.join(runtime.operation_path, ctx.filename)], [ctx.path]))
 @required_context('path', 'filename')
 def extract(ctx: TaskContext, runtime: RuntimeContext):
     if not os.path.exists(ctx.path):
         click.echo("Target path non-existent, creating")
         os.makedirs(ctx.path)
 
-    try:
-        with zipfile.ZipFile(os.path.join(runtime.operation_path, ctx.filename), "r") as zip_ref:
-            zip_ref.extractall(ctx.path)
-        click.echo('Extracted!')
-
-    except zipfile.BadZipFile:
-        raise BadFileError
+    result = archives.extract(os.path.join(runtime.operation_path, ctx.filename), ctx.path)
+    if result.skipped: click.echo(f'Extracted! {result.skipped} files were already up to date')
+    else: click.echo('Extracted!')
 
 @task
+@uses(lambda ctx, runtime: ([os.path.join(runtime.operation_path, ctx.filename)], [ctx.path]))
 @required_context('path', 'filename')
 def extract_cab(ctx: TaskContext, runtime: RuntimeContext):
     if not os.path.exists(ctx.path):
@@ -126,23 +96,31 @@ def extract_cab(ctx: TaskContext, runtime: RuntimeContext):
 
     subprocess.run(['cabextract', '-q', '-d', ctx.path, os.path.join(runtime.operation_path, ctx.filename)], check=True)
 
+def copy_file(src: str, dest: str):
+    if os.path.isfile(dest) and not os.stat(dest).st_mode & 0o200: os.chmod(dest, os.stat(dest).st_mode | 0o200)
+    shutil.copyfile(src, dest)
+
 @task
+@uses(lambda ctx, runtime: ([ctx.path], [ctx.new_path]))
 @required_context('path', 'new_path')
 def copy(ctx: TaskContext, runtime: RuntimeContext):
     click.echo(f'Copying {click.style(ctx.path, fg='bright_blue')} to {click.style(ctx.new_path, fg='bright_blue')}...')
 
+    # Contents only, modes stay the prefix's own; also fixes up files left read-only by older versions
     if os.path.isfile(ctx.path):
-        shutil.copy(ctx.path, ctx.new_path)
+        copy_file(ctx.path, os.path.join(ctx.new_path, os.path.basename(ctx.path)) if os.path.isdir(ctx.new_path) else ctx.new_path)
     else:
-        shutil.copytree(ctx.path, ctx.new_path, dirs_exist_ok=True)
+        shutil.copytree(ctx.path, ctx.new_path, copy_function=copy_file, dirs_exist_ok=True)
 
 @task
+@uses(lambda ctx, runtime: ([], [ctx.path, ctx.new_path]))
 @required_context('path', 'new_path')
 def rename(ctx: TaskContext, runtime: RuntimeContext):
     click.echo(f'Renaming {click.style(ctx.path, fg='bright_blue')} to {click.style(ctx.new_path, fg='bright_blue')}...')
     os.rename(ctx.path, ctx.new_path)
 
 @task
+@uses(lambda ctx, runtime: ([], [ctx.path]))
 @required_context('path')
 def delete(ctx: TaskContext, runtime: RuntimeContext):
     click.echo(f'Deleting {click.style(ctx.path, fg='bright_blue')}...')
@@ -153,6 +131,7 @@ def delete(ctx: TaskContext, runtime: RuntimeContext):
         shutil.rmtree(ctx.path)
 
 @task
+@uses(lambda ctx, runtime: ([], [ctx.path]))
 @required_context('path', 'content')
 def create(ctx: TaskContext, runtime: RuntimeContext):
     click.echo(f'Creating {click.style(ctx.path, fg='bright_blue')}...')
@@ -166,6 +145,10 @@ def tweak(ctx: TaskContext, runtime: RuntimeContext):
     run_tweak(runtime, build_tweak(ctx.name))
 
 @task
+@uses(lambda ctx, runtime: (
+    [os.path.join(runtime.operation_path, ctx.filename)],
+    [os.path.join(runtime.pfx_path, 'drive_c', 'windows', 'Fonts', ctx.filename), os.path.join(runtime.pfx_path, 'system.reg')]
+))
 @required_context('filename', 'name')
 def install_font(ctx: TaskContext, runtime: RuntimeContext):
     source_path = os.path.join(runtime.operation_path, ctx.filename)
@@ -184,11 +167,13 @@ def install_font(ctx: TaskContext, runtime: RuntimeContext):
     regedit(regedit_ctx, runtime)
 
 @task
+@uses(lambda ctx, runtime: ([], ['console']))
 @required_context('content')
 def message(ctx: TaskContext, runtime: RuntimeContext):
     click.echo(ctx.content)
 
 @task
+@uses(lambda ctx, runtime: ([], ['console']))
 @required_context()
 def pause(ctx: TaskContext, runtime: RuntimeContext):
     click.pause()
@@ -206,10 +191,11 @@ def wineserver(ctx: TaskContext, runtime: RuntimeContext):
     elif ctx.action == 'kill':
         click.echo(f"Forcibly terminating prefix {click.style(runtime.pfx_path, fg='bright_blue')}...")
 
-    runtime.prefix.run(Path('wineserver'), args=[flags[ctx.action]])
+    runtime.prefix.wineserver(ctx.action)
     click.secho('Done!', fg='bright_blue')
 
 @task
+@uses(lambda ctx, runtime: ([], [ctx.filename]))
 @required_context('values', 'path', 'filename')
 def edit_ini(ctx: TaskContext, runtime: RuntimeContext):
     filepath = ctx.filename
@@ -259,6 +245,7 @@ def edit_ini(ctx: TaskContext, runtime: RuntimeContext):
         f.writelines(lines)
 
 @task
+@uses(lambda ctx, runtime: ([], [ctx.path]))
 @required_context('path', 'values')
 def text_replace(ctx: TaskContext, runtime: RuntimeContext):
     with open(ctx.path, 'r') as f:
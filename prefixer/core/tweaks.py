@@ -1,9 +1,12 @@
-from prefixer.core.models import TweakData, TaskContext, RuntimeContext, ConditionContext
+from prefixer.core.models import TweakData, TaskContext, RuntimeContext, ConditionContext, validate_context
 from prefixer.core.paths import TWEAKS_DIR_USER, TWEAKS_DIR_SYSTEM, TWEAKS_DIR_PACKAGE
-from prefixer.core.exceptions import NoTweakError
+from prefixer.core.exceptions import NoTweakError, NoTaskError, MalformedTaskError
+from prefixer.core.registry import task_registry, condition_registry
+from prefixer.core.catalog import catalog, CatalogEntry
+from prefixer.core.profiling import profiled
 import os
-import json5
 import logging
+import hashlib
 from pathlib import Path
 
 # TODO: These do not belong here. Set root logger in centralized location.
@@ -28,32 +31,22 @@ def index_tweak_folder(folder: Path | str) -> dict[str, Path]:
 
     returns: dict where key is the tweak name and value path-object to tweak-file.
     """
-    tweaks: dict[str, Path] = {}
-    folder = Path(folder)
+    tweaks = catalog.index_folder(folder)
 
-    tweak_files = list(folder.rglob("*.json5")) + list(folder.rglob("*.json"))
-
-    if not tweak_files:
+    if not tweaks:
         logger.warning(f"No tweak json files found in {folder}")
     else:
-        logger.debug(f"Found {len(tweak_files)} tweaks in {folder}")
-
-    for tweak_file in tweak_files:
-        # Generate the tweak category layer from the directory structure excluding the 
-        # given parent directory, e.g. /usr/share/prefixer/tweaks/fonts/font_tweak_A.json5 -> fonts.font_tweak_A
-        # where /usr/share/prefixer/tweaks/ was the parent directory given as function argument.
-        layer = ".".join([x for x in tweak_file.parent.parts if x not in folder.parts])
-        tweak_name = tweak_file.stem
-        full_tweak_name = f"{layer}.{tweak_name}"
-
-        tweaks[full_tweak_name] = tweak_file
+        logger.debug(f"Found {len(tweaks)} tweaks in {folder}")
 
     return tweaks
 
+@profiled('tweaks')
 def parse_tweak(tweak_file: Path) -> TweakData:
     """
     Read and parse the data from tweak file into TweakData-object.
     """
+    import json5
+
     with open(tweak_file, 'r') as f:
         obj: dict = json5.load(f)
     logger.debug(f"Parsed succesfully file: {tweak_file}")
@@ -62,10 +55,7 @@ def parse_tweak(tweak_file: Path) -> TweakData:
 
     return TweakData(tweak_file.stem, tweak_file, obj['description'], obj['conditions'], obj['tasks'])
 
-def get_tweaks() -> dict[str, TweakData]:
-    """
-    Read and parse all tweaks.
-    """
+def create_tweak_dirs():
     for tweakpath in TWEAKS_PATHS:
         if not os.path.exists(tweakpath):
             try:
@@ -73,6 +63,11 @@ def get_tweaks() -> dict[str, TweakData]:
             except PermissionError:
                 continue
 
+def get_tweaks() -> dict[str, TweakData]:
+    """
+    Read and parse all tweaks.
+    """
+    create_tweak_dirs()
     tweak_names = get_tweak_names()
 
     # Example code on using multiprocessing to parse the JSON-files in parallel.
@@ -94,19 +89,46 @@ def get_tweak(name: str) -> TweakData:
     return parse_tweak(tweak_names[name])
 
 def build_tweak(name: str):
+    """
+    Builds a tweak and validates it, so a malformed tweak fails before anything runs.
+    """
     tweak = get_tweak(name)
-    tasks = []
-    for t in tweak.tasks:
-        tasks.append(TaskContext(**t))
+    try:
+        tasks = []
+        for t in tweak.tasks:
+            tasks.append(TaskContext(**(t | {'conditions': build_conditions(t.get('conditions'))})))
 
-    conditions = []
-    for c in tweak.conditions:
-        if 'invert' not in c: c['invert'] = False
-        conditions.append(ConditionContext(**c))
+        conditions = build_conditions(tweak.conditions)
+    except TypeError as e:
+        raise MalformedTaskError(f'Unknown field in {name}: {e}')
 
-    return Tweak(name=tweak.name, description=tweak.description, conditions=conditions, tasks=tasks)
+    built = Tweak(name=tweak.name, description=tweak.description, conditions=conditions, tasks=tasks)
+    validate_tweak(built)
+    return built
 
+def build_conditions(raw_conditions: list[dict] | None) -> list[ConditionContext]:
+    return [ConditionContext(**({'invert': False} | c)) for c in raw_conditions or []]
 
+def validate_condition(c: ConditionContext):
+    if c.type not in condition_registry: raise MalformedTaskError(f'Unknown condition type {c.type}')
+    required = getattr(condition_registry[c.type], 'required', None)
+    if required is not None: validate_context(c, required)
+
+def validate_tweak(tweak: Tweak):
+    """
+    Checks every task and condition of a tweak against the fields its type declares with required_context.
+    """
+    for c in tweak.conditions: validate_condition(c)
+
+    for t in tweak.tasks:
+        if t.type not in task_registry: raise NoTaskError(f'Unknown task type {t.type}')
+        required = getattr(task_registry[t.type], 'required', None)
+        if required is not None: validate_context(t, required)
+
+        for c in t.conditions or []: validate_condition(c)
+
+
+@profiled('tweaks')
 def get_tweak_names() -> dict[str, Path]:
     """
     Get all tweak names and the path to the tweak file.
@@ -129,5 +151,25 @@ def get_tweak_names() -> dict[str, Path]:
             logger.debug(f"Ignoring file {all_tweak_files[name]}, same tweak is found with higher priority from {TWEAKS_DIR_USER}")
 
     all_tweak_files |= user_tweak_files
+    catalog.save()
 
     return all_tweak_files
+
+def tweak_version(name: str) -> str | None:
+    """Short hash of a tweak's file, recorded in the ledger to tell which revision of it was applied"""
+    path = get_tweak_names().get(name)
+    if path is None: return None
+
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()[:16]
+
+@profiled('tweaks')
+def get_catalog() -> dict[str, CatalogEntry]:
+    """
+    Get the compiled catalog of all tweaks; only tweak files changed since the last call are parsed.
+    """
+    create_tweak_dirs()
+    entries = {name: catalog.entry(name, path) for name, path in get_tweak_names().items()}
+    catalog.save()
+
+    return entries
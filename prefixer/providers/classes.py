@@ -1,8 +1,22 @@
 from pathlib import Path
+import importlib
+import pkgutil
+from fnmatch import fnmatch
+from contextlib import contextmanager
 from abc import ABC, abstractmethod
+from prefixer.core.exceptions import NoPrefixError, AmbiguousTargetError
+from prefixer.core.profiling import profiler
+from prefixer.core import search
 
 provider_reg: dict[str, type['PrefixProvider']] = {}
 
+def load_providers():
+    """Imports every provider module, which registers its providers"""
+    from prefixer import providers
+    for _, name, _ in pkgutil.iter_modules(providers.__path__):
+        if name == 'classes': continue
+        importlib.import_module(f'prefixer.providers.{name}')
+
 class Prefix(ABC):
     def __init__(self, pfx_path: Path, files_path: Path, binary_path: Path, name: str):
         self.pfx_path:    Path = pfx_path
@@ -15,10 +29,25 @@ class Prefix(ABC):
         """Runs an exe file in the prefix"""
         pass
 
+    @contextmanager
+    def session(self):
+        """Block in which run() may reuse state between launches; nothing by default"""
+        yield
+
+    def stop_server(self):
+        """Stops a wineserver kept running by a session, for when files Wine holds in memory are about to change"""
+        pass
+
+    def wineserver(self, action: str):
+        """Waits for (wait) or kills (kill) the processes of the prefix"""
+        flags = {'kill': '-k', 'wait': '-w'}
+        self.run(Path('wineserver'), args=[flags[action]])
+
 class PrefixProvider(ABC):
     def __init_subclass__(cls, **kwargs):
         super().__init_subclass__(**kwargs)
         provider_reg[cls.__name__] = cls
+        profiler.instrument_class(cls, 'provider')
 
     @abstractmethod
     def get_prefixes(self) -> dict[str, str]:
@@ -35,9 +64,20 @@ class PrefixProvider(ABC):
         """Returns a Prefix by index"""
         pass
 
+    def watch_paths(self) -> list[Path]:
+        """Folders whose changes make the provider's prefixes outdated, watched by the daemon"""
+        return []
+
+    def get_prefix_table(self) -> dict[str, str]:
+        """Returns get_prefixes(), built only once per provider instance"""
+        if '_prefix_table' not in self.__dict__:
+            self._prefix_table = self.get_prefixes()
+
+        return self._prefix_table
+
     def get_prefix_ids(self) -> list[str]:
         """Returns all prefix IDs"""
-        return list(self.get_prefixes().values())
+        return list(self.get_prefix_table().values())
 
     def get_all_prefixes(self, name: str) -> list[Prefix]:
         """Returns a list of all prefix objects; very slow"""
@@ -46,3 +86,85 @@ class PrefixProvider(ABC):
             returns.append(self.get_prefix(p))
 
         return returns
+
+class PrefixIndex:
+    """
+    Name/ID index over the prefixes of every provider, each prefix table is collected once.
+    Targets resolve by ID, alias, exact name or recent use before any fuzzy matching is done.
+    """
+    def __init__(self, providers: list[PrefixProvider]):
+        self.providers: list[PrefixProvider] = providers
+        self.names:     list[str]            = []
+        self.ids:       list[str]            = []
+        self.owners:    list[PrefixProvider] = []
+        """Maps an index to the provider owning that prefix"""
+        self.id_lookup: dict[str, int]       = {}
+        self.normalized: list[str]           = []
+        """Names in the form they're matched in"""
+        self.name_lookup: dict[str, int]     = {}
+        self.recent = search.RecentTargets()
+        self.aliases: dict[str, str] | None  = None
+
+        for provider in providers:
+            for name, id in provider.get_prefix_table().items():
+                self.id_lookup.setdefault(id, len(self.ids))
+                self.name_lookup.setdefault(search.normalize(name), len(self.ids))
+                self.normalized.append(search.normalize(name))
+                self.names.append(name)
+                self.ids.append(id)
+                self.owners.append(provider)
+
+    def get(self, index: int) -> Prefix:
+        """Returns the Prefix at an index"""
+        return self.owners[index].get_prefix(self.ids[index])
+
+    def find(self, target: str) -> int:
+        """
+        Returns the index of a prefix by ID, alias, exact name or recent use, falling back to fuzzy name matching.
+        Raises AmbiguousTargetError if the best fuzzy matches are too close to pick one.
+        """
+        if target in self.id_lookup: return self.id_lookup[target]
+
+        if self.aliases is None: self.aliases = search.load_aliases()
+        target = self.aliases.get(target, target)
+        if target in self.id_lookup: return self.id_lookup[target]
+
+        key = search.normalize(target)
+        if key in self.name_lookup: return self.name_lookup[key]
+
+        recent = self.recent.get(target)
+        if recent in self.id_lookup: return self.id_lookup[recent]
+
+        matches = search.rank(target, self.normalized)
+        if not matches: raise NoPrefixError(target)
+
+        _, best, index = matches[0]
+        if best < 100 and any(best - score <= search.AMBIGUITY_MARGIN and self.ids[i] != self.ids[index] for _, score, i in matches[1:]):
+            raise AmbiguousTargetError(target, [(self.names[i], self.ids[i], score) for _, score, i in matches])
+
+        self.recent.add(target, self.ids[index])
+        return index
+
+    def resolve(self, target: str) -> Prefix:
+        """Returns the Prefix best matching an ID or name"""
+        prefix = self.get(self.find(target))
+        if prefix is None: raise NoPrefixError(target)
+
+        return prefix
+
+    def select(self, targets: list[str]) -> list[int]:
+        """Returns the indexes matching IDs, names, glob patterns over both, or 'all', without duplicates"""
+        found = {}
+        for target in targets:
+            if target == 'all':
+                matches = range(len(self.ids))
+            elif any(c in target for c in '*?['):
+                pattern = target.lower()
+                matches = [i for i in range(len(self.ids)) if fnmatch(self.names[i].lower(), pattern) or fnmatch(self.ids[i], pattern)]
+                if not matches: raise NoPrefixError(target)
+            else:
+                matches = [self.find(target)]
+
+            for i in matches: found.setdefault(i)
+
+        return list(found)
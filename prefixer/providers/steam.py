@@ -2,107 +2,364 @@ from click import secho
 
 from prefixer.providers.classes import Prefix, PrefixProvider
 from prefixer.core.exceptions import NoSteamError, NoProtonError, ProviderError
+from prefixer.core.cache import stamp, load_cache, save_cache
+from prefixer.core.profiling import profiled
 from pathlib import Path
 from subprocess import run, DEVNULL
+from contextlib import contextmanager
+from time import sleep
 from os import environ
+import os
 import vdf
 
+# Wine's own background processes, they live as long as the wineserver does
+SYSTEM_PROCESSES = {'services.exe', 'winedevice.exe', 'plugplay.exe', 'svchost.exe', 'explorer.exe', 'rpcss.exe', 'tabtip.exe', 'conhost.exe', 'start.exe'}
+
 class SteamPrefix(Prefix):
     def __init__(self, pfx_path: Path, files_path: Path, binary_path: Path, proton_script_path: Path, name: str, steampath: Path):
         super().__init__(pfx_path, files_path, binary_path, name)
 
         self.proton_script_path = proton_script_path
         self.STEAMPATH = steampath
+        self.session_depth = 0
+        self.server_running = False
 
-    def run(self, exe: Path, args: list[str] = None, silent: bool = False):
+    def env(self) -> dict[str, str]:
         env = environ.copy()
 
         env['WINEPREFIX'] = str(self.pfx_path)
         env['STEAM_COMPAT_DATA_PATH'] = str(self.pfx_path.parent)
         env['STEAM_COMPAT_CLIENT_INSTALL_PATH'] = str(self.STEAMPATH)
+        return env
+
+    def wine_dist(self) -> Path | None:
+        """Directory holding Proton's Wine build (files/ in current Proton, dist/ in older ones)"""
+        for name in ['files', 'dist']:
+            dist = Path(self.binary_path) / name
+            if (dist / 'bin' / 'wine').exists() and (dist / 'bin' / 'wineserver').exists(): return dist
+
+        return None
+
+    def wine_env(self) -> dict[str, str]:
+        """Environment for running Proton's Wine directly, like the proton script would set it up"""
+        dist = self.wine_dist()
+        env = self.env()
+
+        libs = [str(dist / lib) for lib in ['lib64', 'lib'] if (dist / lib).exists()]
+        env['PATH'] = f'{dist / 'bin'}:{env.get('PATH', '')}'
+        env['LD_LIBRARY_PATH'] = ':'.join([*libs, env.get('LD_LIBRARY_PATH', '')]).strip(':')
+        env['WINEDLLPATH'] = ':'.join(f'{lib}/wine' for lib in libs)
+        env.setdefault('WINEDEBUG', '-all')
+        return env
+
+    @contextmanager
+    def session(self):
+        """
+        Keeps one persistent wineserver up for every run() in the block, which then starts Proton's Wine directly
+        instead of going through the proton script and a cold wineserver each time. Falls back to proton if its Wine isn't found.
+        """
+        if self.wine_dist() is None:
+            yield
+            return
+
+        self.session_depth += 1
+        try:
+            yield
+        finally:
+            self.session_depth -= 1
+            if not self.session_depth: self.stop_server()
+
+    def wineserver_command(self, *args: str):
+        run([str(self.wine_dist() / 'bin' / 'wineserver'), *args], env=self.wine_env())
+
+    def start_server(self):
+        if self.server_running: return
+
+        self.wineserver_command('-p') # Forks into the background and stays until killed
+        self.server_running = True
+
+    def user_processes(self) -> list[int]:
+        """PIDs of the Windows programs running in this prefix, without Wine's background processes"""
+        marker = f'WINEPREFIX={self.pfx_path}'.encode()
+        found = []
+
+        for entry in os.scandir('/proc'):
+            if not entry.name.isdigit(): continue
+
+            try:
+                with open(f'/proc/{entry.name}/environ', 'rb') as f:
+                    if marker not in f.read().split(b'\0'): continue
+                with open(f'/proc/{entry.name}/cmdline', 'rb') as f:
+                    program = f.read().split(b'\0')[0].decode(errors='replace')
+            except OSError:
+                continue
+
+            name = program.replace('\\', '/').rsplit('/', 1)[-1].lower()
+            if name.endswith('.exe') and name not in SYSTEM_PROCESSES: found.append(int(entry.name))
+
+        return found
+
+    def wait_for_programs(self):
+        while self.user_processes(): sleep(0.5)
+
+    def stop_server(self):
+        """Lets running programs finish, then shuts the session's wineserver down so it saves the registry"""
+        if not self.server_running: return
+
+        self.wait_for_programs()
+        self.wineserver_command('-k')
+        self.wineserver_command('-w')
+        self.server_running = False
+
+    def wineserver(self, action: str):
+        if not self.session_depth: return super().wineserver(action)
+
+        if action == 'wait':
+            self.wait_for_programs() # wineserver -w would wait for the persistent server forever
+        elif self.server_running:
+            self.wineserver_command('-k')
+            self.wineserver_command('-w')
+            self.server_running = False
+
+    def run(self, exe: Path, args: list[str] = None, silent: bool = False):
+        if self.session_depth:
+            self.start_server()
+            command = [str(self.wine_dist() / 'bin' / 'wine'), str(exe), *(args or [])]
+            env = self.wine_env()
+        else:
+            command = [str(self.proton_script_path), 'run', str(exe), *(args or [])]
+            env = self.env()
 
         if not silent:
-            run([str(self.proton_script_path), 'run', str(exe), *(args or [])], env=env)
+            run(command, env=env)
         else:
-            run([str(self.proton_script_path), 'run', str(exe), *(args or [])], env=env, stdout=DEVNULL, stderr=DEVNULL)
+            run(command, env=env, stdout=DEVNULL, stderr=DEVNULL)
+
+class SteamLibraryIndex:
+    """Persistent index of Steam libraries and appmanifests, kept valid with file mtime/size stamps"""
+    CACHE_NAME = 'steam.json'
+
+    def __init__(self, steampath: Path):
+        self.steampath = steampath
+        self.libmanifest_path = steampath / 'steamapps' / 'libraryfolders.vdf'
+        self.libraries: dict[str, list[str]] = {}
+        """Existing library paths mapped to the app IDs they contain"""
+        self.manifests: dict[str, dict] = {}
+        """appmanifest paths mapped to their stamp and basic AppState fields"""
+        self.app_libraries: dict[str, str] = {}
+        """App IDs mapped to the library path they are installed in"""
+        self.apps: dict[str, dict] = {}
+        """App IDs mapped to their manifest entry"""
+        self.loaded = False
+
+    def parse_libraries(self) -> dict[str, list[str]]:
+        with open(self.libmanifest_path, 'r') as f:
+            libmanifest = vdf.load(f)
+
+        return {lib['path']: list(lib.get('apps', {})) for lib in libmanifest['libraryfolders'].values()}
+
+    def parse_manifest(self, path: str, library: str, manifest_stamp: list[int]) -> dict | None:
+        try:
+            with open(path, 'r') as f:
+                app = vdf.load(f)['AppState']
+        except (OSError, SyntaxError, KeyError):
+            return None # Steam might be in the middle of writing it, try again next time
+
+        return {
+            'stamp': manifest_stamp,
+            'appid': app['appid'],
+            'name': app.get('name', app['appid']),
+            'installdir': app.get('installdir'),
+            'library': library
+        }
+
+    @profiled('provider', 'SteamLibraryIndex.refresh')
+    def refresh(self):
+        """Brings the index up to date, re-parsing only files whose stamp changed"""
+        libmanifest_stamp = stamp(self.libmanifest_path)
+        if libmanifest_stamp is None: raise NoSteamError
+
+        data = load_cache(self.CACHE_NAME)
+        if data.get('steampath') != str(self.steampath): data = {}
+        dirty = False
+
+        libfolders = data.get('libraryfolders', {})
+        if libfolders.get('stamp') != libmanifest_stamp:
+            libfolders = {'stamp': libmanifest_stamp, 'libraries': self.parse_libraries()}
+            dirty = True
+
+        self.libraries = {path: apps for path, apps in libfolders['libraries'].items() if os.path.exists(path)}
+
+        cached = data.get('manifests', {})
+        manifests = {}
+        for lib in self.libraries:
+            try:
+                entries = os.scandir(os.path.join(lib, 'steamapps'))
+            except OSError:
+                continue
+
+            with entries:
+                for entry in entries:
+                    if not entry.name.endswith('.acf'): continue
+
+                    st = entry.stat()
+                    entry_stamp = [st.st_mtime_ns, st.st_size]
+                    record = cached.get(entry.path)
+                    if not record or record['stamp'] != entry_stamp:
+                        record = self.parse_manifest(entry.path, lib, entry_stamp)
+                        dirty = True
+                    if record: manifests[entry.path] = record
+
+        if manifests.keys() != cached.keys(): dirty = True
+        self.manifests = manifests
+
+        self.app_libraries = {app: lib for lib, apps in self.libraries.items() for app in apps}
+        self.apps = {m['appid']: m for m in manifests.values()}
+        self.loaded = True
+
+        if dirty:
+            save_cache(self.CACHE_NAME, {
+                'steampath': str(self.steampath),
+                'libraryfolders': libfolders,
+                'manifests': manifests
+            })
+
+class CompatToolIndex:
+    """
+    Compatibility tools (Proton builds) and the tool each app is set to use, built in one pass over
+    compatibilitytools.d folders, official Proton apps and config.vdf. Persisted with mtime/size stamps.
+    """
+    CACHE_NAME = 'compat.json'
+    SYSTEM_TOOLS_DIR = Path('/usr/share/steam/compatibilitytools.d')
+    DEFAULT_TOOL = 'proton_experimental'
+
+    def __init__(self, steampath: Path):
+        self.steampath = steampath
+        self.config_path = steampath / 'config' / 'config.vdf'
+        self.tool_dirs = [steampath / 'compatibilitytools.d', self.SYSTEM_TOOLS_DIR]
+        """Custom tool folders, highest priority first"""
+        self.tools: dict[str, Path] = {}
+        """Tool names mapped to their install folder"""
+        self.mapping: dict[str, str] = {}
+        """App IDs mapped to the tool they're set to use, '0' is the global default"""
+        self.loaded = False
+
+    def parse_mapping(self) -> dict[str, str]:
+        try:
+            with open(self.config_path, 'r') as f:
+                config = vdf.load(f)
+        except OSError:
+            return {}
+
+        mapping = config['InstallConfigStore']['Software']['Valve']['Steam'].get('CompatToolMapping', {})
+        return {app: tool['name'] for app, tool in mapping.items() if tool.get('name')}
+
+    @profiled('provider', 'CompatToolIndex.refresh')
+    def refresh(self, libraries: SteamLibraryIndex):
+        """Brings the index up to date; official Proton builds come from the (already stamped) library index"""
+        data = load_cache(self.CACHE_NAME)
+        if data.get('steampath') != str(self.steampath): data = {}
+        dirty = False
+
+        config = data.get('config', {})
+        config_stamp = stamp(self.config_path)
+        if config.get('stamp') != config_stamp:
+            config = {'stamp': config_stamp, 'mapping': self.parse_mapping()}
+            dirty = True
+
+        dirs = {}
+        for tool_dir in self.tool_dirs:
+            dir_stamp = stamp(tool_dir)
+            if dir_stamp is None: continue
+
+            record = data.get('dirs', {}).get(str(tool_dir))
+            if not record or record['stamp'] != dir_stamp:
+                record = {'stamp': dir_stamp, 'tools': sorted(e.name for e in os.scandir(tool_dir) if e.is_dir())}
+                dirty = True
+            dirs[str(tool_dir)] = record
+
+        if dirs.keys() != data.get('dirs', {}).keys(): dirty = True
+
+        tools = {}
+        for app in libraries.apps.values():
+            if app['installdir']:
+                tools[app['name'].replace(' ', '_').lower()] = Path(app['library']) / 'steamapps' / 'common' / app['installdir']
+        for tool_dir in reversed(self.tool_dirs): # Custom tools win over official ones, user ones over system ones
+            for name in dirs.get(str(tool_dir), {}).get('tools', []):
+                tools[name] = tool_dir / name
+
+        self.tools = tools
+        self.mapping = config['mapping']
+        self.loaded = True
+
+        if dirty:
+            save_cache(self.CACHE_NAME, {'steampath': str(self.steampath), 'config': config, 'dirs': dirs})
+
+    def tool_for(self, app_id: str) -> str:
+        return self.mapping.get(str(app_id)) or self.mapping.get('0') or self.DEFAULT_TOOL
+
+    def resolve(self, name: str) -> Path:
+        path = self.tools.get(name)
+        if path is None or not path.exists(): raise NoProtonError
+        return path
 
 class SteamPrefixProvider(PrefixProvider):
     def __init__(self):
         super()
         self.STEAMPATH = Path('~/.steam/steam').expanduser()
         self.LIBMANIFEST_LOCATION = self.STEAMPATH / 'steamapps' / 'libraryfolders.vdf'
+        self.index = SteamLibraryIndex(self.STEAMPATH)
+        self.compat_index = CompatToolIndex(self.STEAMPATH)
+        self.shortcut_manifests: dict[str, list[dict]] = {}
 
-    def get_libraries(self):
-        if not self.LIBMANIFEST_LOCATION:
-            raise NoSteamError
-
-        with open(self.LIBMANIFEST_LOCATION, 'r') as f:
-            libmanifest = vdf.load(f)
+    def get_index(self) -> SteamLibraryIndex:
+        if not self.index.loaded: self.index.refresh()
+        return self.index
 
-        libs = []
-        for lib in libmanifest['libraryfolders']:
-            if not Path(libmanifest['libraryfolders'][lib]['path']).exists(): continue
-            libs.append(lib)
+    def get_compat_index(self) -> CompatToolIndex:
+        if not self.compat_index.loaded: self.compat_index.refresh(self.get_index())
+        return self.compat_index
 
-        lib_paths = []
-        for lib in libs:
-            lib_paths.append(libmanifest['libraryfolders'][lib]['path'])
+    def watch_paths(self) -> list[Path]:
+        folders = [self.STEAMPATH / 'config', *self.compat_index.tool_dirs, *(self.STEAMPATH / 'userdata').glob('*/config')]
+        folders += [Path(lib) / 'steamapps' for lib in self.get_index().libraries]
+        return folders
 
-        lib_apps = []
-        for lib in libs:
-            lib_apps.append(libmanifest['libraryfolders'][lib]['apps'])
+    def get_libraries(self):
+        libraries = self.get_index().libraries
+        return list(libraries.keys()), list(libraries.values())
 
-        return lib_paths, lib_apps
+    def get_library(self, target_id: str) -> str | None:
+        return self.get_index().app_libraries.get(target_id)
 
     def get_prefix_path(self, target_id: str) -> Path:
-        libs = self.get_libraries()
-        lib_paths = libs[0]
-        apps = libs[1]
-
-        index = next((i for i, app in enumerate(apps) if target_id in app), None)
-        if index is None:
+        lib = self.get_library(target_id)
+        if lib is None:
             return None
 
-        return Path(f'{lib_paths[index]}/steamapps/compatdata/{target_id}/pfx')
-
-    def get_manifest(self, target_id: str) -> Path:
-        libs = self.get_libraries()
-        lib_paths = libs[0]
-        apps = libs[1]
+        return Path(lib) / 'steamapps' / 'compatdata' / target_id / 'pfx'
 
-        index = next((i for i, app in enumerate(apps) if target_id in app), None)
-        if index is None:
+    def get_manifest(self, target_id: str) -> dict:
+        lib = self.get_library(target_id)
+        if lib is None:
             return None
 
-        path = Path(f'{lib_paths[index]}/steamapps/appmanifest_{target_id}.acf')
+        path = Path(lib) / 'steamapps' / f'appmanifest_{target_id}.acf'
         with open(str(path), 'r') as f:
             manifest_data = vdf.loads(f.read())
 
         return manifest_data
 
     def get_installdir(self, target_id: str):
-        manifest = self.get_manifest(target_id)
-        libs = self.get_libraries()
-        lib_paths = libs[0]
-        apps = libs[1]
-
-        index = next((i for i, app in enumerate(apps) if target_id in app), None)
-        if index is None:
+        lib = self.get_library(target_id)
+        app = self.get_index().apps.get(target_id)
+        if lib is None or app is None or not app['installdir']:
             return None
 
-        return Path(f'{lib_paths[index]}/steamapps/common/{manifest['AppState']['installdir']}')
+        return Path(lib) / 'steamapps' / 'common' / app['installdir']
 
     def build_game_manifest(self):
-        games = []
-
-        libs = self.get_libraries()[0]
-        for lib in libs:
-            for file in (Path(lib) / 'steamapps').glob('*.acf'):
-                with open(str(file), 'r') as f:
-                    data = vdf.loads(f.read())
-                    games.append(data['AppState'])
-
-        return games
+        return list(self.get_index().apps.values())
 
     def get_games_dict(self):
         return {f"{game['name']} ({game['appid']})": game for game in self.build_game_manifest()}
@@ -120,32 +377,14 @@ class SteamPrefixProvider(PrefixProvider):
 
         return data
 
-    def get_compat_tool_mapping(self):
-        config = self.get_steam_config()
-        return config['InstallConfigStore']['Software']['Valve']['Steam']['CompatToolMapping']
+    def get_compat_tool_mapping(self) -> dict[str, str]:
+        return self.get_compat_index().mapping
 
     def get_compat_tool(self, target_id: str):
-        override = self.get_compat_tool_mapping().get(target_id)
-        global_tool = self.get_compat_tool_mapping().get(0)
-        if override:
-            return override['name']
-        elif global_tool:
-            return global_tool['name']
-        else:
-            return 'proton_experimental'
+        return self.get_compat_index().tool_for(target_id)
 
     def get_proton_path(self, name: str):
-        custom_path = self.STEAMPATH / 'compatibilitytools.d' / name
-        custom_sys_path = Path('/usr/share/steam/compatibilitytools.d') / name
-
-        official = self.get_machine_games_dict().get(name)
-        if custom_path.exists(): return custom_path
-        elif custom_sys_path.exists(): return custom_sys_path
-        elif official:
-            dir = self.get_installdir(official['appid'])
-            if dir.exists(): return dir
-            raise NoProtonError
-        else: raise NoProtonError
+        return self.get_compat_index().resolve(name)
 
     def get_last_user(self):
         with open(str(self.STEAMPATH / 'config' / 'loginusers.vdf'), 'r') as f:
@@ -170,6 +409,8 @@ class SteamPrefixProvider(PrefixProvider):
         return data
 
     def build_shortcut_manifest(self, user_id: str):
+        if user_id in self.shortcut_manifests: return self.shortcut_manifests[user_id]
+
         manifest = []
         shortcuts = self.get_shortcuts(user_id)
         for shortcut in shortcuts:
@@ -182,6 +423,7 @@ class SteamPrefixProvider(PrefixProvider):
                 'prefix': self.STEAMPATH / 'steamapps' / 'compatdata' / str(unsigned_id) / 'pfx'
             })
 
+        self.shortcut_manifests[user_id] = manifest
         return manifest
 
     def get_prefixes(self) -> dict[str, str]:
@@ -198,12 +440,12 @@ class SteamPrefixProvider(PrefixProvider):
 
     def get_prefix_by_index(self, index: int) -> SteamPrefix:
         """Returns a Prefix by index."""
-        prefixes = self.get_prefixes()
+        prefixes = self.get_prefix_table()
         id = list(prefixes.values())[index]
         return self.get_prefix(id)
 
     def get_prefix(self, id: str) -> SteamPrefix:
-        name = next((k for k, v in self.get_prefixes().items() if v == id), None)
+        name = next((k for k, v in self.get_prefix_table().items() if v == id), None)
 
         pfx_path = self.get_prefix_path(id)
         if pfx_path:
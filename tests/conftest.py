@@ -0,0 +1,28 @@
+from pathlib import Path
+
+import pytest
+
+from prefixer.core import paths
+from prefixer.core.models import RuntimeContext
+from prefixer.providers.classes import Prefix
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path, monkeypatch):
+    """Keep tests from reading or writing the real ~/.cache/prefixer and ~/.config/prefixer"""
+    monkeypatch.setattr(paths, 'CACHE_DIR', str(tmp_path / 'cache'))
+    monkeypatch.setattr(paths, 'CONFIG_DIR', str(tmp_path / 'config'))
+    return tmp_path / 'cache'
+
+
+class FakePrefix(Prefix):
+    """Prefix whose Wine processes never run"""
+    def run(self, exe: Path, args: list[str] = None, silent: bool = False):
+        pass
+
+
+@pytest.fixture
+def runtime(tmp_path):
+    (tmp_path / 'pfx').mkdir()
+    (tmp_path / 'operation').mkdir()
+    return RuntimeContext(FakePrefix(tmp_path / 'pfx', tmp_path, tmp_path, 'Fake'), str(tmp_path / 'operation'))
@@ -0,0 +1,139 @@
+from pathlib import Path
+
+import pytest
+import responses
+
+from prefixer.api import Session
+from prefixer.core import tweaks
+from prefixer.core.ledger import Ledger
+from prefixer.core.exceptions import NoPrefixError, NoProtonError, NoTaskError, NoTweakError
+from prefixer.providers.classes import Prefix, PrefixProvider, provider_reg
+
+from conftest import FakePrefix
+
+
+class FolderProvider(PrefixProvider):
+    """Every subfolder of a folder is a prefix, named after it"""
+    def __init__(self, root: Path):
+        self.root = root
+
+    def get_prefixes(self) -> dict[str, str]:
+        return {p.name: p.name for p in sorted(self.root.iterdir())}
+
+    def get_prefix(self, id: str) -> Prefix:
+        if id == 'Broken': raise NoProtonError('proton_9 is not installed')
+        if id == 'Unlaunched': return FakePrefix(None, self.root / id / 'game', self.root / 'proton', id)
+        return FakePrefix(self.root / id / 'pfx', self.root / id / 'game', self.root / 'proton', id)
+
+    def get_prefix_by_index(self, index: int) -> Prefix:
+        return self.get_prefix(list(self.get_prefixes().values())[index])
+
+provider_reg.pop('FolderProvider') # Keep the fake provider out of the CLI
+
+MARKER_TWEAK = """{
+    description: "Creates a marker",
+    tasks: [
+        { description: "Create marker", type: "create", path: "<pfxdir>/marker.txt", content: "hi" },
+    ],
+}"""
+
+UNLESS_MARKED_TWEAK = """{
+    description: "Only for prefixes without the marker tweak",
+    conditions: [{ type: "tweak_ran", value: "test.marker", invert: true }],
+    tasks: [
+        { description: "Create other marker", type: "create", path: "<pfxdir>/other.txt", content: "hi" },
+    ],
+}"""
+
+DOWNLOAD_THEN_BROKEN_TWEAK = """{
+    description: "Downloads, then includes a malformed tweak only for some prefixes",
+    tasks: [
+        { description: "Download installer", type: "download", url: "https://example.com/installer.exe", checksum: "%s", filename: "installer.exe" },
+        { description: "Include broken", type: "tweak", name: "test.broken", conditions: [{ type: "env_matches", value: "PREFIXER_TEST_UNSET", matches: "x" }] },
+    ],
+}""" % ('0' * 64)
+
+BROKEN_TWEAK = """{
+    description: "Uses a task type that doesn't exist",
+    tasks: [{ description: "Nothing", type: "no_such_task" }],
+}"""
+
+
+@pytest.fixture
+def session(tmp_path, monkeypatch):
+    tweak_dir = tmp_path / 'tweaks' / 'test'
+    tweak_dir.mkdir(parents=True)
+    (tweak_dir / 'marker.json5').write_text(MARKER_TWEAK)
+    (tweak_dir / 'unless_marked.json5').write_text(UNLESS_MARKED_TWEAK)
+    (tweak_dir / 'download_then_broken.json5').write_text(DOWNLOAD_THEN_BROKEN_TWEAK)
+    (tweak_dir / 'broken.json5').write_text(BROKEN_TWEAK)
+    for folder in ['TWEAKS_DIR_USER', 'TWEAKS_DIR_SYSTEM', 'TWEAKS_DIR_PACKAGE']:
+        monkeypatch.setattr(tweaks, folder, str(tmp_path / 'tweaks'))
+    monkeypatch.setattr(tweaks, 'TWEAKS_PATHS', [str(tmp_path / 'tweaks')])
+
+    root = tmp_path / 'prefixes'
+    for name in ['Alpha', 'Beta', 'Broken', 'Unlaunched']:
+        (root / name / 'pfx').mkdir(parents=True)
+    (root / 'Alpha' / 'pfx' / 'user.reg').write_text('WINE REGISTRY Version 2\n\n[Software\\\\Wine\\\\Direct3D] 1700000000\n"VideoMemorySize"="1024"\n')
+
+    return Session(providers=[FolderProvider(root)])
+
+
+def test_session_resolve(session):
+    assert session.prefixes() == {'Alpha': 'Alpha', 'Beta': 'Beta', 'Broken': 'Broken', 'Unlaunched': 'Unlaunched'}
+    assert session.resolve('alph').name == 'Alpha'
+    assert [p.name for p in session.select(['all'])] == ['Alpha', 'Beta'] # Broken and Unlaunched are left out
+
+    with pytest.raises(NoPrefixError):
+        session.resolve('zzzzzzzz')
+
+
+def test_session_apply(session, tmp_path):
+    result = session.apply('Alpha', ['test.marker', 'test.unless_marked'], prefetch_downloads=False)
+
+    assert result.applied == ['test.marker']
+    assert result.skipped == ['test.unless_marked']
+    assert 'Create marker' in result.log
+    assert (tmp_path / 'prefixes' / 'Alpha' / 'pfx' / 'marker.txt').read_text() == 'hi'
+    assert [e.name for e in session.applied('Alpha')] == ['test.marker']
+    assert session.tweak('test.marker') is session.tweak('test.marker') # Built once
+
+    with pytest.raises(NoTweakError):
+        session.apply('Alpha', ['test.missing'])
+
+
+@responses.activate
+def test_malformed_include_fails_before_downloading(session, monkeypatch):
+    monkeypatch.setenv('PREFIXER_TEST_UNSET', 'y') # The include's condition fails, its tweak is only built by the plan
+    responses.get('https://example.com/installer.exe', body=b'MZ')
+
+    with pytest.raises(NoTaskError):
+        session.apply('Alpha', ['test.download_then_broken'])
+
+    assert len(responses.calls) == 0
+
+
+def test_session_plan(session, tmp_path):
+    Ledger(tmp_path / 'prefixes' / 'Beta' / 'pfx').record('test.marker')
+    planned = session.plan('Beta', ['test.unless_marked'])
+
+    assert planned.prefix.name == 'Beta'
+    assert [n.state for n in planned.plan.nodes if n.kind == 'task'] == ['skipped']
+    assert not (tmp_path / 'prefixes' / 'Beta' / 'pfx' / 'other.txt').exists()
+
+
+def test_session_registry(session, tmp_path):
+    with session.registry('Alpha') as registry:
+        assert registry.node('user.reg', 'Software\\\\Wine\\\\Direct3D').get('VideoMemorySize') == '"1024"'
+        registry.set('user.reg', 'Software\\\\Wine\\\\Direct3D', 'VideoMemorySize', '"2048"')
+
+    assert '"VideoMemorySize"="2048"' in (tmp_path / 'prefixes' / 'Alpha' / 'pfx' / 'user.reg').read_text()
+
+
+def test_session_apply_many(session, tmp_path):
+    results = {r.id: r for r in session.apply_many(['all'], ['test.marker'], jobs=2, log_dir=str(tmp_path / 'logs'))}
+
+    assert results['Alpha'].status == results['Beta'].status == 'done'
+    assert results['Broken'].status == results['Unlaunched'].status == 'skipped'
+    assert 'NoProtonError' in results['Broken'].error
+    assert (tmp_path / 'prefixes' / 'Beta' / 'pfx' / 'marker.txt').exists()
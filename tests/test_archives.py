@@ -0,0 +1,52 @@
+from unittest.mock import patch
+import tarfile
+import zipfile
+import pytest
+
+from prefixer.core import archives
+from prefixer.core.exceptions import BadFileError
+
+
+def make_zip(path, files):
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as zf:
+        for name, content in files.items(): zf.writestr(name, content)
+
+
+def test_zip_extracts_and_skips_unchanged(tmp_path):
+    files = {f'dir{i % 3}/file{i}.txt': f'content {i}' * 100 for i in range(50)}
+    files['../escape.txt'] = 'nope'
+    make_zip(tmp_path / 'a.zip', files)
+    dest = tmp_path / 'out'
+
+    first = archives.extract(str(tmp_path / 'a.zip'), str(dest), workers=4)
+    assert (first.extracted, first.skipped) == (51, 0)
+    assert (dest / 'dir1' / 'file1.txt').read_text() == 'content 1' * 100
+    assert (dest / 'escape.txt').exists() and not (tmp_path / 'escape.txt').exists()
+
+    (dest / 'dir2' / 'file2.txt').write_text('changed')
+    with patch('shutil.copyfileobj', wraps=archives.shutil.copyfileobj) as copied:
+        second = archives.extract(str(tmp_path / 'a.zip'), str(dest), workers=4)
+
+    assert (second.extracted, second.skipped) == (1, 50)
+    assert copied.call_count == 1
+    assert (dest / 'dir2' / 'file2.txt').read_text() == 'content 2' * 100
+
+
+def test_tar_extracts_and_skips_unchanged(tmp_path):
+    source = tmp_path / 'src'
+    (source / 'sub').mkdir(parents=True)
+    (source / 'sub' / 'a.dll').write_bytes(b'a' * 1000)
+    with tarfile.open(tmp_path / 'a.tar.gz', 'w:gz') as tf: tf.add(source / 'sub', 'sub')
+
+    first = archives.extract(str(tmp_path / 'a.tar.gz'), str(tmp_path / 'out'))
+    second = archives.extract(str(tmp_path / 'a.tar.gz'), str(tmp_path / 'out'))
+
+    assert (tmp_path / 'out' / 'sub' / 'a.dll').read_bytes() == b'a' * 1000
+    assert (first.extracted, second.extracted, second.skipped) == (1, 0, 1)
+
+
+def test_unsupported_archive(tmp_path):
+    (tmp_path / 'a.bin').write_bytes(b'not an archive')
+
+    with pytest.raises(BadFileError):
+        archives.extract(str(tmp_path / 'a.bin'), str(tmp_path / 'out'))
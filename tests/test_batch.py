@@ -0,0 +1,44 @@
+import threading
+from pathlib import Path
+
+from prefixer.core.batch import proton_slot, run_batch
+from prefixer.core.models import TaskContext
+from prefixer.core.tweaks import Tweak
+
+from conftest import FakePrefix
+
+
+def make_prefix(tmp_path: Path, name: str, create: bool = True) -> FakePrefix:
+    pfx = tmp_path / name / 'pfx'
+    if create: pfx.mkdir(parents=True)
+    return FakePrefix(pfx, tmp_path / name, tmp_path / 'proton', name)
+
+
+def test_batch_applies_per_prefix(tmp_path):
+    marker = Tweak('marker', 'Creates a marker', [TaskContext('Create marker', 'create', path='<pfxdir>/marker.txt', content='hi')], [])
+    prefixes = [('1', make_prefix(tmp_path, 'One')), ('2', make_prefix(tmp_path, 'Two')), ('3', make_prefix(tmp_path, 'Broken', create=False))]
+    log_dir = tmp_path / 'logs'
+    log_dir.mkdir()
+
+    results = {r.id: r for r in run_batch(prefixes, [('test.marker', marker)], 2, str(log_dir))}
+
+    assert results['1'].status == results['2'].status == 'done'
+    assert results['1'].applied == ['test.marker']
+    assert (tmp_path / 'Two' / 'pfx' / 'marker.txt').read_text() == 'hi'
+    assert results['3'].status == 'failed'
+    assert 'FileNotFoundError' in results['3'].error
+    assert 'Create marker' in (log_dir / '1.log').read_text()
+
+
+def test_proton_slot_throttles(tmp_path):
+    acquired = threading.Event()
+    def contender():
+        with proton_slot(tmp_path / 'proton', slots=1): acquired.set()
+
+    with proton_slot(tmp_path / 'proton', slots=1):
+        thread = threading.Thread(target=contender)
+        thread.start()
+        assert not acquired.wait(0.5)
+
+    thread.join(5)
+    assert acquired.is_set()
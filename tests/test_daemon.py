@@ -0,0 +1,103 @@
+import subprocess
+import socket
+import os
+import sys
+import time
+
+import click
+import pytest
+
+from prefixer import client
+from prefixer.core.daemon import Daemon, Watcher
+
+
+@pytest.fixture
+def daemon_env(tmp_path):
+    env = os.environ | {
+        'HOME': str(tmp_path / 'home'), 'XDG_CACHE_HOME': str(tmp_path / 'cache'), 'XDG_CONFIG_HOME': str(tmp_path / 'config'),
+        'PF_DAEMON_SOCKET': str(tmp_path / 'prefixer.sock'), 'ALLOW_ROOT': 'true'
+    }
+    (tmp_path / 'home').mkdir()
+
+    server = subprocess.Popen([sys.executable, '-c', 'from prefixer.core.daemon import Daemon; Daemon().serve()'],
+                              env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    for _ in range(100):
+        if (tmp_path / 'prefixer.sock').exists(): break
+        time.sleep(0.1)
+
+    yield env
+
+    server.terminate()
+    server.wait(timeout=10)
+
+
+def run_client(env: dict, *args: str) -> subprocess.CompletedProcess:
+    code = 'import sys; from prefixer import client; code = client.forward(sys.argv[1:]); print("forwarded", code, "prefixer.cli" in sys.modules)'
+    return subprocess.run([sys.executable, '-c', code, *args], env=env, capture_output=True, text=True, timeout=30)
+
+
+def test_forwards_to_daemon(daemon_env):
+    result = run_client(daemon_env, '--version')
+
+    assert 'Prefixer v' in result.stdout
+    assert result.stdout.splitlines()[-1] == 'forwarded 0 False'
+
+
+def test_falls_back_on_different_settings(daemon_env):
+    result = run_client(daemon_env | {'PF_NO_DOWNLOAD': 'true'}, '--version')
+
+    assert result.stdout.splitlines() == ['forwarded None False']
+
+
+def test_no_daemon(tmp_path):
+    from prefixer import client
+    assert client.forward(['--version'], path=str(tmp_path / 'missing.sock')) is None
+
+
+def test_refuses_foreign_socket(tmp_path, monkeypatch):
+    path = str(tmp_path / 'foreign.sock')
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as server:
+        server.bind(path)
+        server.listen()
+        monkeypatch.setattr(client, 'peer_uid', lambda conn: os.getuid() + 1)
+
+        assert client.forward(['--version'], path=path) is None
+        conn, _ = server.accept()
+        with conn: assert conn.recv(1024) == b'' # Closed without sending anything
+
+
+def test_refuses_shared_socket_dir(tmp_path):
+    shared = tmp_path / 'shared'
+    shared.mkdir()
+    shared.chmod(0o777)
+
+    with pytest.raises(click.ClickException):
+        Daemon(str(shared / 'daemon.sock')).socket_dir()
+
+    private = tmp_path / 'private' / 'daemon.sock'
+    Daemon(str(private)).socket_dir()
+    assert private.parent.stat().st_mode & 0o777 == 0o700
+
+
+def test_watcher_polling(tmp_path, monkeypatch):
+    watcher = Watcher([tmp_path])
+    monkeypatch.setattr(watcher, 'fd', None)
+    watcher.stamps = watcher.poll()
+
+    assert not watcher.changed()
+    (tmp_path / 'tweak.json5').write_text('{}')
+    assert watcher.changed()
+    assert not watcher.changed()
+
+
+def test_option_values_are_not_commands(monkeypatch, capsys):
+    assert client.command_name(['--profile', 'daemon']) == 'daemon'
+    assert client.command_name(['--search', 'daemon']) == '--search'
+
+    from prefixer import cli
+    monkeypatch.setattr(sys, 'argv', ['prefixer', '--search', 'cache'])
+    with pytest.raises(SystemExit) as exit:
+        cli.main()
+
+    assert exit.value.code == 0
+    assert 'No such option' not in capsys.readouterr().err
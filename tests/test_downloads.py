@@ -0,0 +1,144 @@
+import hashlib
+import os
+from pathlib import Path
+
+import pytest
+import responses
+
+from prefixer.core import downloads
+from prefixer.core.exceptions import BadDownloadError
+from prefixer.core.planner import Plan, prefetch
+from prefixer.core.tweaks import Tweak
+from prefixer.core.models import TaskContext, ConditionContext
+from prefixer.core.registry import task_registry
+
+URL = 'https://example.com/installer.exe'
+PAYLOAD = b'MZ' + b'\0' * 100_000
+CHECKSUM = hashlib.sha256(PAYLOAD).hexdigest()
+
+
+def download_task(checksum: str = CHECKSUM) -> TaskContext:
+    return TaskContext('Download installer', 'download', url=URL, checksum=checksum, filename='installer.exe')
+
+
+
+@responses.activate
+def test_download_is_cached(runtime):
+    responses.get(URL, body=PAYLOAD)
+
+    task_registry['download'](download_task(), runtime)
+    os.remove(os.path.join(runtime.operation_path, 'installer.exe'))
+    task_registry['download'](download_task(), runtime)
+
+    assert len(responses.calls) == 1
+    assert Path(runtime.operation_path, 'installer.exe').read_bytes() == PAYLOAD
+    assert downloads.lookup(CHECKSUM) is not None
+
+
+@responses.activate
+def test_download_mismatch_not_stored(runtime, monkeypatch):
+    responses.get(URL, body=PAYLOAD)
+    monkeypatch.setattr('click.confirm', lambda *args, **kwargs: False)
+
+    with pytest.raises(BadDownloadError):
+        task_registry['download'](download_task('0' * 64), runtime)
+
+    assert downloads.entries() == []
+
+
+def test_evict_least_recently_used(tmp_path):
+    for i, payload in enumerate([b'a' * 100, b'b' * 100, b'c' * 100]):
+        path = tmp_path / f'{i}.bin'
+        path.write_bytes(payload)
+        stored = downloads.add(str(path), hashlib.sha256(payload).hexdigest())
+        os.utime(stored, (i, i))
+
+    downloads.lookup(hashlib.sha256(b'a' * 100).hexdigest()) # now the most recently used
+    removed = downloads.evict(200)
+
+    assert removed == [hashlib.sha256(b'b' * 100).hexdigest()]
+    assert len(downloads.entries()) == 2
+
+
+@responses.activate
+def test_prefetch(runtime, monkeypatch):
+    other_url = 'https://example.com/other.exe'
+    other_payload = b'MZ' + b'\1' * 50_000
+    responses.get(URL, body=PAYLOAD)
+    responses.get(other_url, body=other_payload)
+
+    skipped = TaskContext('Download for other systems', 'download', url='https://example.com/skipped.exe', checksum='0' * 64,
+                          filename='skipped.exe', conditions=[ConditionContext('env_matches', False, value='PREFIXER_TEST_UNSET', matches='x')])
+    target = Tweak('test', 'Test tweak', [
+        download_task(),
+        TaskContext('Download other', 'download', url=other_url, checksum=hashlib.sha256(other_payload).hexdigest(), filename='other.exe'),
+        skipped
+    ], [])
+
+    monkeypatch.setenv('PREFIXER_TEST_UNSET', 'y')
+    prefetch(Plan.build_plan(runtime, [('test', target)]))
+
+    assert sorted(call.request.url for call in responses.calls) == [URL, other_url]
+
+    task_registry['download'](download_task(), runtime)
+    assert len(responses.calls) == 2
+
+
+@responses.activate
+def test_prefetch_respects_no_download(runtime, monkeypatch):
+    monkeypatch.setattr('prefixer.core.planner.NO_DOWNLOAD', True)
+    monkeypatch.setattr(downloads, 'NO_DOWNLOAD', True)
+
+    prefetch(Plan.build_plan(runtime, [('test', Tweak('test', 'Test tweak', [download_task()], []))]))
+    assert downloads.prefetch([(URL, CHECKSUM)]) == {}
+    with pytest.raises(BadDownloadError):
+        downloads.fetch_verified(URL, CHECKSUM)
+
+    assert len(responses.calls) == 0
+
+
+@responses.activate
+def test_download_resumes_partial():
+    def ranged(request):
+        start = int(request.headers['Range'].removeprefix('bytes=').rstrip('-'))
+        return 206, {'Content-Range': f'bytes {start}-{len(PAYLOAD) - 1}/{len(PAYLOAD)}'}, PAYLOAD[start:]
+
+    responses.add_callback(responses.GET, URL, callback=ranged)
+
+    part = downloads.part_path(CHECKSUM)
+    os.makedirs(os.path.dirname(part))
+    Path(part).write_bytes(PAYLOAD[:40_000])
+
+    stored = downloads.fetch_verified(URL, CHECKSUM)
+
+    assert responses.calls[0].request.headers['Range'] == 'bytes=40000-'
+    assert Path(stored).read_bytes() == PAYLOAD
+
+
+@responses.activate
+def test_download_restarts_without_range_support():
+    responses.get(URL, body=PAYLOAD)
+
+    part = downloads.part_path(CHECKSUM)
+    os.makedirs(os.path.dirname(part))
+    Path(part).write_bytes(b'stale')
+
+    assert downloads.fetch(URL, part) == CHECKSUM
+    assert Path(part).read_bytes() == PAYLOAD
+
+
+@responses.activate
+def test_reapplying_copied_download(runtime, tmp_path):
+    responses.get(URL, body=PAYLOAD)
+    system32 = tmp_path / 'pfx' / 'drive_c' / 'windows' / 'system32'
+    system32.mkdir(parents=True)
+    copy_task = TaskContext('Copy installer', 'copy', path=os.path.join(runtime.operation_path, 'installer.exe'), new_path=str(system32))
+
+    for _ in range(2):
+        task_registry['download'](download_task(), runtime)
+        task_registry['copy'](copy_task, runtime)
+
+    placed = system32 / 'installer.exe'
+    assert placed.read_bytes() == PAYLOAD
+    assert placed.stat().st_mode & 0o200 # Writable, so the next apply can replace it
+    assert os.stat(downloads.lookup(CHECKSUM)).st_ino != os.stat(runtime.operation_path + '/installer.exe').st_ino
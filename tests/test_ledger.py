@@ -0,0 +1,37 @@
+from prefixer.core.ledger import Ledger, LEDGER_FILE, prefixes_with, applied_tweaks, sync
+
+
+def test_migrates_legacy_list(tmp_path):
+    (tmp_path / 'tweaks.prefixer.txt').write_text('libs.dotnet.48\nfonts.courier\nlibs.dotnet.48\n')
+
+    ledger = Ledger(tmp_path)
+    assert ledger.ran('libs.dotnet.48')
+    assert not ledger.ran('libs.dotnet.4') # No substring matches
+    assert ledger.get('fonts.courier').version is None
+
+    assert not (tmp_path / LEDGER_FILE).exists() # Reading has no side effects
+    assert prefixes_with('fonts.courier') == []
+
+    ledger.record('fonts.georgia')
+    assert len((tmp_path / LEDGER_FILE).read_text().splitlines()) == 3
+    assert prefixes_with('fonts.courier') == [str(tmp_path)]
+    assert Ledger(tmp_path).get('libs.dotnet.48').version is None
+
+
+def test_record_and_reload(tmp_path):
+    ledger = Ledger(tmp_path)
+    ledger.record('fonts.courier', 'abc', 1.5)
+    ledger.record('fonts.courier', 'def', 2.0)
+    with open(tmp_path / LEDGER_FILE, 'a') as f: f.write('{"name": "cut')
+
+    reloaded = Ledger(tmp_path)
+    assert reloaded.get('fonts.courier').version == 'def'
+    assert [e.name for e in applied_tweaks(str(tmp_path))] == ['fonts.courier']
+
+
+def test_sync(tmp_path):
+    (tmp_path / LEDGER_FILE).write_text('{"name": "fonts.georgia", "version": null, "time": 1.0, "duration": 0.0}\n')
+    assert prefixes_with('fonts.georgia') == []
+
+    sync([str(tmp_path)])
+    assert prefixes_with('fonts.georgia') == [str(tmp_path)]
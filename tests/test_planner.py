@@ -0,0 +1,142 @@
+import threading
+from unittest.mock import patch
+from pathlib import Path
+
+import pytest
+
+from prefixer.core.exceptions import BadTweakError
+from prefixer.core.models import TaskContext, ConditionContext
+from prefixer.core.ledger import Ledger, LEDGER_FILE, prefixes_with
+from prefixer.core.planner import Plan
+from prefixer.core.tweaks import Tweak
+
+
+def create(path: str, content: str = 'x') -> TaskContext:
+    return TaskContext(f'Create {path}', 'create', path=path, content=content)
+
+
+def include(name: str) -> TaskContext:
+    return TaskContext(f'Include {name}', 'tweak', name=name)
+
+
+def test_shared_subtweak_runs_once(runtime):
+    library = {
+        'common': Tweak('common', 'Shared', [TaskContext('Count', 'text_replace', path='<pfxdir>/count.txt', values=[('x', 'xx')])], []),
+    }
+    first = Tweak('first', 'First', [create('<pfxdir>/count.txt'), include('common')], [])
+    second = Tweak('second', 'Second', [include('common'), create('<pfxdir>/second.txt')], [])
+
+    plan = Plan.build_plan(runtime, [('first', first), ('second', second)], library.__getitem__)
+    ran = plan.run()
+
+    assert ran == {'first': True, 'second': True}
+    assert [n.tweak for n in plan.nodes if n.kind == 'task' and n.state == 'done'].count('common') == 1
+    assert Path(runtime.pfx_path, 'count.txt').read_text() == 'xx'
+    ledger = Ledger(runtime.pfx_path)
+    assert [name for name in ['common', 'first', 'second', 'third'] if ledger.ran(name)] == ['common', 'first', 'second']
+    assert prefixes_with('common') == [runtime.pfx_path]
+
+
+def test_shared_subtweak_first_includer_skipped(runtime):
+    never = [ConditionContext('file_exists', False, filename='/nonexistent')]
+    library = {'common': Tweak('common', 'Shared', [create('<pfxdir>/common.txt')], [])}
+    first = Tweak('first', 'First', [include('common')], never)
+    second = Tweak('second', 'Second', [include('common')], [])
+    third = Tweak('third', 'Third', [TaskContext('Include common', 'tweak', name='common', conditions=never)], [])
+
+    plan = Plan.build_plan(runtime, [('first', first), ('second', second), ('third', third), ('common', library['common'])], library.__getitem__)
+    ran = plan.run()
+
+    assert ran == {'first': False, 'second': True, 'third': True, 'common': True}
+    assert Path(runtime.pfx_path, 'common.txt').exists()
+    assert [n.tweak for n in plan.nodes if n.kind == 'task' and n.state == 'done'] == ['common']
+    ledger = Ledger(runtime.pfx_path)
+    assert [name for name in ['first', 'second', 'third', 'common'] if ledger.ran(name)] == ['second', 'third', 'common']
+    assert ledger.get('common').time <= ledger.get('second').time
+
+
+def test_conflicts_are_ordered(runtime):
+    target = Tweak('files', 'Files', [
+        create('<pfxdir>/a/one.txt'),
+        create('<pfxdir>/b/two.txt'),
+        TaskContext('Wipe a', 'delete', path='<pfxdir>/a'),
+    ], [])
+    Path(runtime.pfx_path, 'a').mkdir()
+    Path(runtime.pfx_path, 'b').mkdir()
+
+    plan = Plan.build_plan(runtime, [('files', target)])
+    one, two, wipe = [n for n in plan.nodes if n.kind == 'task']
+
+    assert one not in two.deps and two not in one.deps
+    assert one in wipe.deps and two not in wipe.deps
+
+    plan.run()
+    assert not Path(runtime.pfx_path, 'a').exists()
+    assert Path(runtime.pfx_path, 'b', 'two.txt').exists()
+
+
+def test_independent_tasks_run_concurrently(runtime, monkeypatch):
+    barrier = threading.Barrier(2, timeout=5)
+    original = open
+    def waiting_open(path, *args, **kwargs):
+        if str(path).endswith('.txt') and 'tweaks.prefixer' not in str(path): barrier.wait()
+        return original(path, *args, **kwargs)
+
+    monkeypatch.setattr('builtins.open', waiting_open)
+    target = Tweak('pair', 'Pair', [create('<pfxdir>/one.txt'), create('<pfxdir>/two.txt')], [])
+
+    Plan.build_plan(runtime, [('pair', target)]).run(workers=2)
+
+    assert Path(runtime.pfx_path, 'two.txt').exists()
+
+
+def test_skipped_gate_skips_nested(runtime):
+    library = {'inner': Tweak('inner', 'Inner', [create('<pfxdir>/inner.txt')], [])}
+    gated = TaskContext('Include inner', 'tweak', name='inner', conditions=[ConditionContext('file_exists', False, filename='/nonexistent')])
+    target = Tweak('outer', 'Outer', [gated, create('<pfxdir>/outer.txt')], [])
+
+    ran = Plan.build_plan(runtime, [('outer', target)], library.__getitem__).run()
+
+    assert ran == {'outer': True}
+    assert not Path(runtime.pfx_path, 'inner.txt').exists()
+    assert Path(runtime.pfx_path, 'outer.txt').exists()
+
+
+def test_recursive_tweak(runtime):
+    looping = Tweak('loop', 'Loop', [include('loop')], [])
+
+    with pytest.raises(BadTweakError):
+        Plan.build_plan(runtime, [('loop', looping)], {'loop': looping}.__getitem__)
+
+
+def test_preview_estimate(runtime):
+    target = Tweak('installer', 'Installer', [
+        TaskContext('Download', 'download', url='https://example.com/a.exe', checksum='ab' * 32, filename='a.exe'),
+        TaskContext('Run', 'run_exe', path='<tempdir>/a.exe', args=['/q']),
+        TaskContext('Regedit', 'regedit', path='Software\\Wine', values={'Version': 'win10'}, filename='user.reg'),
+        TaskContext('Never', 'create', path='<pfxdir>/never.txt', content='x', conditions=[ConditionContext('file_exists', False, filename='/nonexistent')]),
+    ], [])
+
+    with patch('prefixer.core.downloads.remote_size', return_value=1234):
+        plan = Plan.build_plan(runtime, [('installer', target)])
+        plan.preview()
+        estimate = plan.estimate()
+
+    assert estimate.download_bytes == 1234
+    assert estimate.hives == ['user.reg']
+    assert estimate.launches == 1
+    assert (estimate.tasks, estimate.skipped) == (3, 1)
+    assert not Path(runtime.pfx_path, LEDGER_FILE).exists()
+
+    with patch('prefixer.core.downloads.remote_size') as remote_size, patch('prefixer.core.planner.NO_DOWNLOAD', True):
+        assert plan.estimate().download_bytes == 0
+    remote_size.assert_not_called()
+
+
+def test_resolve_paths(runtime, tmp_path):
+    ctx = TaskContext('Copy', 'copy', path='<tempdir>/a.dll', new_path='<pfxdir>/<gamedir>/<unknown>', args=['<tempdir>', '/q'])
+    ctx.resolve_paths(runtime)
+
+    assert ctx.path == f'{tmp_path}/operation/a.dll'
+    assert ctx.new_path == f'{tmp_path}/pfx/{tmp_path}/<unknown>'
+    assert ctx.args == [f'{tmp_path}/operation', '/q']
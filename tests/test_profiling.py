@@ -0,0 +1,36 @@
+import json
+import subprocess
+import time
+
+from prefixer.core.profiling import Profiler
+
+
+def test_spans_nest_and_count(tmp_path):
+    profiler = Profiler()
+    profiler.enable(str(tmp_path / 'trace.json'))
+
+    inner = profiler.wrap('regedit', 'inner', lambda: time.sleep(0.05))
+    def outer_body():
+        subprocess.run(['true'])
+        inner()
+    outer = profiler.wrap('task', 'outer', outer_body)
+
+    outer()
+    profiler.write_trace(profiler.trace_path)
+    profiler.enabled = False # It also wrapped the hive parser
+
+    spans = {span.name: span for span in profiler.spans}
+    assert spans['outer'].duration >= spans['inner'].duration >= 50_000_000
+    assert spans['outer'].own < spans['inner'].own
+    assert spans['outer'].subprocesses == 1
+
+    trace = json.loads((tmp_path / 'trace.json').read_text())
+    assert {e['name'] for e in trace['traceEvents']} == {'outer', 'inner'}
+    assert trace['phases']['task']['calls'] == 1
+
+
+def test_disabled_profiler_records_nothing():
+    profiler = Profiler()
+    profiler.wrap('task', 'noop', lambda: None)()
+
+    assert profiler.spans == []
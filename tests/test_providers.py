@@ -0,0 +1,79 @@
+from pathlib import Path
+
+import pytest
+
+from prefixer.core.exceptions import NoPrefixError, AmbiguousTargetError
+from prefixer.core import search
+from prefixer.providers.classes import Prefix, PrefixIndex, PrefixProvider, provider_reg
+
+from conftest import FakePrefix
+
+
+class FakeProvider(PrefixProvider):
+    def __init__(self, prefixes: dict[str, str]):
+        self.prefixes = prefixes
+        self.builds = 0
+
+    def get_prefixes(self) -> dict[str, str]:
+        self.builds += 1
+        return self.prefixes
+
+    def get_prefix(self, id: str) -> Prefix:
+        name = next(k for k, v in self.get_prefix_table().items() if v == id)
+        return FakePrefix(Path(id), Path(id), Path(id), name)
+
+    def get_prefix_by_index(self, index: int) -> Prefix:
+        return self.get_prefix(list(self.get_prefix_table().values())[index])
+
+provider_reg.pop('FakeProvider') # Keep the fake provider out of the CLI
+
+
+def test_prefix_index_single_build():
+    first = FakeProvider({'Cyberpunk 2077': '1091500', 'Fallout 4': '377160'})
+    second = FakeProvider({'Balatro': '2379780'})
+    index = PrefixIndex([first, second])
+
+    assert index.resolve('2379780').name == 'Balatro'
+    assert index.resolve('fallout').name == 'Fallout 4'
+    assert index.owners[index.find('balatro')] is second
+    assert first.builds == 1
+    assert second.builds == 1
+
+
+def test_prefix_index_no_match():
+    index = PrefixIndex([FakeProvider({'Fallout 4': '377160'})])
+
+    with pytest.raises(NoPrefixError):
+        index.resolve('zzzzzzzz')
+
+
+def test_prefix_index_select():
+    index = PrefixIndex([FakeProvider({'Fallout 4': '377160', 'Fallout: New Vegas': '22380', 'Balatro': '2379780'})])
+
+    assert sorted(index.ids[i] for i in index.select(['fallout*'])) == ['22380', '377160']
+    assert len(index.select(['all', 'balatro'])) == 3
+
+    with pytest.raises(NoPrefixError):
+        index.select(['zzz*'])
+
+
+def test_prefix_index_alias_and_recent(monkeypatch):
+    search.save_aliases({'cp': '1091500'})
+    providers = [FakeProvider({'Cyberpunk 2077': '1091500', 'Fallout 4': '377160', 'Fallout: New Vegas': '22380'})]
+
+    index = PrefixIndex(providers)
+    assert index.ids[index.find('cp')] == '1091500'
+    assert index.ids[index.find('fallout: new vegas')] == '22380'
+    assert index.ids[index.find('new vegs')] == '22380'
+
+    monkeypatch.setattr(search, 'rank', lambda *args, **kwargs: pytest.fail('fuzzy matched a recent target'))
+    assert index.ids[PrefixIndex(providers).find('new vegs')] == '22380'
+
+
+def test_prefix_index_ambiguous():
+    index = PrefixIndex([FakeProvider({'Fallout 3': '22300', 'Fallout 4': '377160', 'Balatro': '2379780'})])
+
+    with pytest.raises(AmbiguousTargetError) as e:
+        index.find('fallout')
+
+    assert {id for _, id, _ in e.value.candidates[:2]} == {'22300', '377160'}
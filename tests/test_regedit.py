@@ -1,5 +1,8 @@
+from unittest.mock import patch
+
 from prefixer.coldpfx.regedit import parser, writer
 from prefixer.coldpfx.regedit.models import RegistryNode
+from prefixer.coldpfx.regedit.transaction import HiveTransaction
 
 hive = """WINE REGISTRY Version 2
 ;; All keys relative to REGISTRY\\Machine
@@ -56,3 +59,142 @@ def test_serialize_hive():
     reparsed_hive = parser.parse_hive(lines)
 
     assert parsed_hive == reparsed_hive
+
+big_hive = hive + """
+
+[Software\\\\Wine] 1757166416
+"Version"="win10"
+
+[Software\\\\Wine\\\\DllOverrides] 1757166416
+"d3d9"="native,builtin"
+"dxgi"="native"
+
+[Software\\\\Wine\\\\DllOverridesExtra] 1757166416
+"x"="y"
+
+[Software\\\\Zzz] 1757166416
+"z"="z"
+"""
+
+def test_parse_prefix():
+    parsed_hive = parser.parse_hive(big_hive.split('\n'), prefix='software\\\\wine\\\\dlloverrides')
+
+    assert list(parsed_hive.nodes) == ['Software\\\\Wine\\\\DllOverrides']
+    assert parsed_hive.nodes['Software\\\\Wine\\\\DllOverrides'].get('dxgi') == '"native"'
+    assert len(parser.parse_hive(big_hive.split('\n'), prefix='Software\\\\Wine').nodes) == 3
+
+def test_read_node(tmp_path):
+    lines_read = []
+    def tracked():
+        for line in big_hive.split('\n'):
+            lines_read.append(line)
+            yield line
+
+    nodes = parser.iter_nodes(tracked(), 'Software\\\\Wine\\\\DllOverrides')
+    node = next(nodes)
+    assert node.values == {'d3d9': '"native,builtin"', 'dxgi': '"native"'}
+    assert not any('Zzz' in line for line in lines_read)
+
+    path = tmp_path / 'user.reg'
+    path.write_text(big_hive)
+    assert parser.read_node(str(path), 'Software\\\\Wine\\\\DllOverrides') == node
+    assert parser.read_node(str(path), 'Software\\\\Nothing') is None
+
+wine_hive = """WINE REGISTRY Version 2
+;; All keys relative to \\\\User\\\\S-1-5-21-0-0-0-1000
+
+#arch=win64
+
+[Control Panel\\\\Desktop] 1757166416
+#time=1dc1f2e2b9d8a00
+"FontSmoothing"="2"
+
+[Software\\\\Wine\\\\DllOverrides] 1757166416
+#time=1dc1f2e2b9d8a00
+"d3d9"="native,builtin"
+
+[Software\\\\Zzz] 1757166416
+"z"="z"
+"""
+
+def test_patch_file(tmp_path):
+    path = tmp_path / 'user.reg'
+    path.write_text(wine_hive)
+
+    parsed_hive = parser.parse_hive_file(str(path))
+    parsed_hive.nodes['Software\\\\Wine\\\\DllOverrides'].set('dxgi', '"native"')
+    writer.patch_file(parsed_hive, str(path), backup=str(tmp_path / 'user.reg.bak'))
+
+    patched = path.read_text()
+    before, after = wine_hive.split('[Software\\\\Wine\\\\DllOverrides]')
+    assert patched.startswith(before)
+    assert patched.endswith('[Software\\\\Zzz] 1757166416\n"z"="z"\n')
+    assert '#time=1dc1f2e2b9d8a00\n"FontSmoothing"' in patched
+    assert (tmp_path / 'user.reg.bak').read_text() == wine_hive
+
+    reparsed = parser.parse_hive_file(str(path))
+    assert reparsed.nodes['Software\\\\Wine\\\\DllOverrides'].values == {'d3d9': '"native,builtin"', 'dxgi': '"native"'}
+    assert reparsed.nodes['Software\\\\Zzz'].values == {'z': '"z"'}
+
+def test_patch_file_twice(tmp_path):
+    path = tmp_path / 'user.reg'
+    path.write_text(wine_hive)
+
+    parsed_hive = parser.parse_hive_file(str(path))
+    parsed_hive.nodes['Control Panel\\\\Desktop'].set('FontSmoothing', '"0"')
+    parsed_hive.nodes['Software\\\\New'] = RegistryNode('Software\\\\New', 0, {}, False)
+    parsed_hive.nodes['Software\\\\New'].set('a', '"b"')
+    writer.patch_file(parsed_hive, str(path))
+
+    parsed_hive.nodes['Software\\\\Zzz'].set('z', '!prefixer_remove!')
+    parsed_hive.nodes['Software\\\\New'].set('c', '"d"')
+    writer.patch_file(parsed_hive, str(path))
+
+    reparsed = parser.parse_hive_file(str(path))
+    assert reparsed == parsed_hive
+    assert reparsed.nodes['Software\\\\New'].values == {'a': '"b"', 'c': '"d"'}
+    assert reparsed.nodes['Software\\\\Zzz'].values == {}
+    assert reparsed.nodes['Software\\\\Wine\\\\DllOverrides'].values == {'d3d9': '"native,builtin"'}
+
+def test_transaction_batches_writes(tmp_path):
+    (tmp_path / 'user.reg').write_text(wine_hive)
+    (tmp_path / 'system.reg').write_text(wine_hive)
+
+    with patch.object(writer, 'patch_file', wraps=writer.patch_file) as patch_file:
+        with HiveTransaction(str(tmp_path)) as registry:
+            for i in range(10):
+                registry.set('user.reg', 'Software\\\\Wine\\\\DllOverrides', f'dll{i}', '"native"')
+                with registry: # nested tweaks share the transaction
+                    registry.set('system.reg', 'Software\\\\Prefixer', 'runs', f'"{i}"')
+
+            assert registry.node('user.reg', 'Software\\\\Wine\\\\DllOverrides').get('dll9') == '"native"'
+            assert (tmp_path / 'user.reg').read_text() == wine_hive
+
+    assert patch_file.call_count == 2
+    assert (tmp_path / 'user.reg.bak').read_text() == wine_hive
+    assert parser.read_node(str(tmp_path / 'system.reg'), 'Software\\\\Prefixer').values == {'runs': '"9"'}
+
+def test_transaction_replays_over_external_changes(tmp_path):
+    (tmp_path / 'user.reg').write_text(wine_hive)
+
+    registry = HiveTransaction(str(tmp_path))
+    registry.set('user.reg', 'Software\\\\Wine\\\\DllOverrides', 'dxgi', '"native"')
+    (tmp_path / 'user.reg').write_text(wine_hive + '\n[Software\\\\Wine\\\\Added] 1757166417\n"by"="wine"\n')
+    registry.commit()
+
+    reparsed = parser.parse_hive_file(str(tmp_path / 'user.reg'))
+    assert reparsed.nodes['Software\\\\Wine\\\\Added'].values == {'by': '"wine"'}
+    assert reparsed.nodes['Software\\\\Wine\\\\DllOverrides'].get('dxgi') == '"native"'
+
+def test_transaction_paths_ignore_case(tmp_path):
+    (tmp_path / 'user.reg').write_text(wine_hive)
+    registry = HiveTransaction(str(tmp_path))
+
+    assert registry.node('user.reg', 'software\\\\wine\\\\dlloverrides') is not None # Read straight from the file
+    registry.set('user.reg', 'SOFTWARE\\\\Wine\\\\DllOverrides', 'dxgi', '"native"')
+    assert registry.node('user.reg', 'software\\\\wine\\\\dlloverrides').get('dxgi') == '"native"' # From the parsed hive
+    registry.commit()
+
+    reparsed = parser.parse_hive_file(str(tmp_path / 'user.reg'))
+    assert [path for path in reparsed.nodes if path.lower() == 'software\\\\wine\\\\dlloverrides'] == ['Software\\\\Wine\\\\DllOverrides']
+    assert reparsed.nodes['Software\\\\Wine\\\\DllOverrides'].get('dxgi') == '"native"'
@@ -0,0 +1,47 @@
+import os
+
+from prefixer.core import regindex
+from prefixer.core.regindex import IndexedPrefix
+
+
+def write_user_reg(pfx, overrides: dict[str, str], version: str = 'win10'):
+    pfx.mkdir(parents=True, exist_ok=True)
+    lines = ['WINE REGISTRY Version 2', ';; All keys relative to \\\\User\\\\S-1-5-21-0-0-0-1000', '',
+             '[Software\\\\Wine] 1700000000', f'"Version"="{version}"', '',
+             '[Software\\\\Wine\\\\DllOverrides] 1700000000', *[f'"{dll}"="{mode}"' for dll, mode in overrides.items()], '']
+    (pfx / 'user.reg').write_text('\n'.join(lines))
+
+
+def test_refresh_and_query(tmp_path):
+    prefixes = [IndexedPrefix(str(i), name, str(tmp_path / name)) for i, name in enumerate(['Alpha', 'Beta', 'Gamma'])]
+    write_user_reg(tmp_path / 'Alpha', {'d3d9': 'native,builtin', 'dxgi': 'native'})
+    write_user_reg(tmp_path / 'Beta', {'d3d9': 'builtin'}, version='win7')
+    write_user_reg(tmp_path / 'Gamma', {'D3D9': 'native'})
+
+    result = regindex.refresh(prefixes, jobs=2)
+    assert (result.parsed, result.unchanged, result.failed) == (3, 0, {})
+
+    assert [m.name for m in regindex.query('Software\\Wine\\DllOverrides', 'd3d9', 'native*')] == ['Alpha', 'Gamma']
+    assert [m.name for m in regindex.query('software\\\\wine', 'Version', 'win7')] == ['Beta']
+    assert {m.value_name for m in regindex.query('Software\\Wine\\DllOverrides') if m.name == 'Alpha'} == {'d3d9', 'dxgi'}
+    assert regindex.query('Software\\Wine\\DllOverrides', 'd3d9', 'nat_ve') == [] # LIKE wildcards are literal
+
+    # Only the changed hive is parsed again
+    write_user_reg(tmp_path / 'Beta', {'d3d9': 'builtin'}, version='win10')
+    os.utime(tmp_path / 'Beta' / 'user.reg', ns=(1, 1))
+    result = regindex.refresh(prefixes, jobs=2)
+    assert (result.parsed, result.unchanged) == (1, 2)
+    assert regindex.query('Software\\Wine', 'Version', 'win7') == []
+
+
+def test_refresh_prunes(tmp_path):
+    prefixes = [IndexedPrefix(str(i), name, str(tmp_path / name)) for i, name in enumerate(['Alpha', 'Beta', 'Gamma'])]
+    for prefix in prefixes: write_user_reg(tmp_path / prefix.name, {'d3d9': 'native'})
+    regindex.refresh(prefixes, jobs=1)
+
+    (tmp_path / 'Beta' / 'user.reg').unlink()
+    result = regindex.refresh(prefixes[1:], jobs=1)
+
+    assert result.removed == 2 # Alpha is gone from the fleet, Beta's hive was deleted
+    assert [m.name for m in regindex.query('Software\\Wine\\DllOverrides', 'd3d9')] == ['Gamma']
+    assert regindex.summary() == {'prefixes': 1, 'hives': 1, 'values': 2}
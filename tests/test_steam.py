@@ -0,0 +1,147 @@
+from pathlib import Path
+
+import pytest
+import vdf
+
+from prefixer.core.exceptions import NoSteamError, NoProtonError
+from prefixer.providers.steam import SteamLibraryIndex, SteamPrefix, CompatToolIndex
+
+
+def write_manifest(library: Path, appid: str, name: str):
+    with open(library / 'steamapps' / f'appmanifest_{appid}.acf', 'w') as f:
+        vdf.dump({'AppState': {'appid': appid, 'name': name, 'installdir': name}}, f, pretty=True)
+
+
+@pytest.fixture
+def steam_root(tmp_path):
+    """Fake Steam root with two libraries"""
+    root = tmp_path / 'steam'
+    second = tmp_path / 'library2'
+    for lib in (root, second):
+        (lib / 'steamapps').mkdir(parents=True)
+
+    libraryfolders = {'libraryfolders': {
+        '0': {'path': str(root), 'apps': {'10': '0', '20': '0'}},
+        '1': {'path': str(second), 'apps': {'30': '0'}},
+        '2': {'path': str(tmp_path / 'unplugged'), 'apps': {'40': '0'}},
+    }}
+    with open(root / 'steamapps' / 'libraryfolders.vdf', 'w') as f:
+        vdf.dump(libraryfolders, f, pretty=True)
+
+    write_manifest(root, '10', 'Game A')
+    write_manifest(root, '20', 'Game B')
+    write_manifest(second, '30', 'Game C')
+
+    return root
+
+
+def test_index_refresh(steam_root):
+    index = SteamLibraryIndex(steam_root)
+    index.refresh()
+
+    assert set(index.libraries) == {str(steam_root), str(steam_root.parent / 'library2')}
+    assert index.app_libraries['30'] == str(steam_root.parent / 'library2')
+    assert {app: m['name'] for app, m in index.apps.items()} == {'10': 'Game A', '20': 'Game B', '30': 'Game C'}
+
+
+def test_index_reparses_only_changed(steam_root, monkeypatch):
+    SteamLibraryIndex(steam_root).refresh()
+
+    parsed = []
+    original = SteamLibraryIndex.parse_manifest
+    def spy(self, path, library, manifest_stamp):
+        parsed.append(Path(path).name)
+        return original(self, path, library, manifest_stamp)
+    monkeypatch.setattr(SteamLibraryIndex, 'parse_manifest', spy)
+
+    SteamLibraryIndex(steam_root).refresh()
+    assert parsed == []
+
+    write_manifest(steam_root, '20', 'Game B Remastered')
+    index = SteamLibraryIndex(steam_root)
+    index.refresh()
+
+    assert parsed == ['appmanifest_20.acf']
+    assert index.apps['20']['name'] == 'Game B Remastered'
+
+
+def test_compat_index(steam_root, monkeypatch):
+    write_manifest(steam_root, '50', 'Proton Experimental')
+    (steam_root / 'steamapps' / 'common' / 'Proton Experimental').mkdir(parents=True)
+    (steam_root / 'compatibilitytools.d' / 'GE-Proton9-1').mkdir(parents=True)
+    (steam_root / 'config').mkdir()
+    mapping = {'0': {'name': 'proton_experimental'}, '30': {'name': 'GE-Proton9-1'}, '20': {'name': 'proton_missing'}}
+    with open(steam_root / 'config' / 'config.vdf', 'w') as f:
+        vdf.dump({'InstallConfigStore': {'Software': {'Valve': {'Steam': {'CompatToolMapping': mapping}}}}}, f, pretty=True)
+
+    libraries = SteamLibraryIndex(steam_root)
+    libraries.refresh()
+    index = CompatToolIndex(steam_root)
+    index.tool_dirs = index.tool_dirs[:1]
+    index.refresh(libraries)
+
+    assert index.resolve(index.tool_for('10')) == steam_root / 'steamapps' / 'common' / 'Proton Experimental'
+    assert index.resolve(index.tool_for('30')) == steam_root / 'compatibilitytools.d' / 'GE-Proton9-1'
+    with pytest.raises(NoProtonError):
+        index.resolve(index.tool_for('20'))
+
+    monkeypatch.setattr(CompatToolIndex, 'parse_mapping', lambda self: pytest.fail('config.vdf parsed again'))
+    cached = CompatToolIndex(steam_root)
+    cached.tool_dirs = cached.tool_dirs[:1]
+    cached.refresh(libraries)
+    assert cached.tools == index.tools
+
+
+def test_index_no_steam(tmp_path):
+    with pytest.raises(NoSteamError):
+        SteamLibraryIndex(tmp_path / 'nothing').refresh()
+
+
+@pytest.fixture
+def proton_root(tmp_path):
+    """Fake Proton build whose proton, wine and wineserver only log how they were called"""
+    root = tmp_path / 'proton'
+    (root / 'files' / 'bin').mkdir(parents=True)
+    log = tmp_path / 'calls.log'
+
+    for script in [root / 'proton', root / 'files' / 'bin' / 'wine', root / 'files' / 'bin' / 'wineserver']:
+        script.write_text(f'#!/bin/sh\necho "{script.name} $*" >> {log}\n')
+        script.chmod(0o755)
+
+    return root
+
+
+def make_prefix(tmp_path: Path, proton_root: Path) -> SteamPrefix:
+    pfx = tmp_path / 'compatdata' / '10' / 'pfx'
+    pfx.mkdir(parents=True)
+    return SteamPrefix(pfx, tmp_path, proton_root, proton_root / 'proton', 'Game A', tmp_path / 'steam')
+
+
+def test_wineserver_session(tmp_path, proton_root):
+    prefix = make_prefix(tmp_path, proton_root)
+
+    with prefix.session():
+        prefix.run(Path('first.exe'))
+        prefix.run(Path('second.exe'), ['/q'])
+        prefix.wineserver('wait')
+    prefix.run(Path('third.exe'))
+
+    assert (tmp_path / 'calls.log').read_text().splitlines() == [
+        'wineserver -p', 'wine first.exe', 'wine second.exe /q', 'wineserver -k', 'wineserver -w', 'proton run third.exe'
+    ]
+
+
+def test_session_stops_before_registry_write(tmp_path, proton_root):
+    from prefixer.core.models import RuntimeContext
+
+    prefix = make_prefix(tmp_path, proton_root)
+    (prefix.pfx_path / 'user.reg').write_text('WINE REGISTRY Version 2\n;; All keys relative to \\\\User\\\\S-1-5-21-0-0-0-1000\n\n#arch=win64\n')
+    runtime = RuntimeContext(prefix, str(tmp_path))
+
+    with prefix.session():
+        prefix.run(Path('setup.exe'))
+        runtime.registry.set('user.reg', 'Software\\\\Wine', 'Version', '"win10"')
+        runtime.registry.commit()
+        assert not prefix.server_running
+
+    assert (tmp_path / 'calls.log').read_text().splitlines()[-2:] == ['wineserver -k', 'wineserver -w']
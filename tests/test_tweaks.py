@@ -1,8 +1,11 @@
 from unittest.mock import patch
 from pathlib import Path
+import pytest
 
-from prefixer.core.tweaks import index_tweak_folder, get_tweak_names, parse_tweak, get_tweak
-from prefixer.core.models import TweakData
+from prefixer.core.tweaks import index_tweak_folder, get_tweak_names, parse_tweak, get_tweak, Tweak, validate_tweak
+from prefixer.core.models import TweakData, TaskContext, ConditionContext
+from prefixer.core.exceptions import MalformedTaskError, NoTaskError
+from prefixer.core.catalog import TweakCatalog
 
 
 """
@@ -107,3 +110,47 @@ def test_get_tweak():
         patch('prefixer.core.tweaks.TWEAKS_DIR_PACKAGE', TWEAKS_DIR_PACKAGE):
 
         assert get_tweak("fonts.courier") == correct_fonts_courier_TweakData
+
+
+def test_catalog_entry():
+    entry = TweakCatalog().entry('fonts.courier', correct_fonts_courier_path)
+
+    assert entry.description == 'Microsoft Courier New Font'
+    assert entry.task_types == ['download', 'run_exe', 'wineserver']
+    assert entry.conditions == []
+
+
+def test_catalog_reparses_only_changed(tmp_path):
+    folder = tmp_path / 'tweaks'
+    (folder / 'fonts').mkdir(parents=True)
+    for name in ('a', 'b'):
+        (folder / 'fonts' / f'{name}.json5').write_text(f"{{description: 'Font {name}', tasks: []}}")
+
+    first = TweakCatalog()
+    assert set(first.index_folder(folder)) == {'fonts.a', 'fonts.b'}
+    for name, path in first.index_folder(folder).items(): first.entry(name, path)
+    first.save()
+
+    (folder / 'fonts' / 'b.json5').write_text("{description: 'Font B, now bolder', tasks: [{type: 'message'}]}")
+    (folder / 'fonts' / 'c.json5').write_text("{description: 'Font c', tasks: []}")
+
+    second = TweakCatalog()
+    with patch.object(TweakCatalog, 'summarize', wraps=TweakCatalog.summarize) as summarize:
+        entries = {name: second.entry(name, path) for name, path in second.index_folder(folder).items()}
+
+    assert sorted(call.args[0].name for call in summarize.call_args_list) == ['b.json5', 'c.json5']
+    assert entries['fonts.b'].description == 'Font B, now bolder'
+    assert entries['fonts.b'].task_types == ['message']
+
+
+def test_validate_tweak():
+    validate_tweak(Tweak('ok', 'OK', [TaskContext(type='delete', description='Delete', path='a')], []))
+
+    with pytest.raises(MalformedTaskError, match='Too little'):
+        validate_tweak(Tweak('missing', 'Missing', [TaskContext(type='copy', description='Copy', path='a')], []))
+    with pytest.raises(MalformedTaskError, match='Too many'):
+        validate_tweak(Tweak('extra', 'Extra', [TaskContext(type='delete', description='Delete', path='a', filename='b')], []))
+    with pytest.raises(NoTaskError):
+        validate_tweak(Tweak('unknown', 'Unknown', [TaskContext(type='nope', description='Nope')], []))
+    with pytest.raises(MalformedTaskError):
+        validate_tweak(Tweak('condition', 'Condition', [TaskContext(type='delete', description='Delete', path='a', conditions=[ConditionContext('file_exists', False)])], []))